@@ -1,9 +1,9 @@
 import os
 import sys
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pymongo.errors import ExecutionTimeout, PyMongoError
-from sqlalchemy import create_engine
+from pymongo import DeleteOne, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, ExecutionTimeout, PyMongoError
+from sqlalchemy import create_engine, event, inspect, text, types as sa_types
 
 # Thêm đường dẫn import_default
 sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
@@ -12,20 +12,121 @@ from import_default import *
 # Load environment variables from .env file (cùng thư mục với file này)
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
+# ==============================================================================
+# REGISTRY KẾT NỐI: TẠO CLIENT/ENGINE Ở LẦN DÙNG ĐẦU TIÊN
+# ==============================================================================
+
+# Cấu hình connection pool
+MONGO_CLIENT_SETTINGS = {
+    "maxPoolSize": 20,
+    "minPoolSize": 0,
+    "connectTimeoutMS": 10_000,
+    "serverSelectionTimeoutMS": 10_000,
+}
+SQL_ENGINE_SETTINGS = {
+    "pool_size": 5,
+    "max_overflow": 5,
+    "pool_pre_ping": True,  # Kiểm tra kết nối trước khi dùng để bỏ các kết nối đã bị server đóng
+    "pool_recycle": 1800,
+}
+
+# Khi importlib.reload, namespace cũ của module được giữ lại nên registry cũ được dùng tiếp,
+# mỗi URI chỉ có một pool duy nhất thay vì tạo thêm pool mới sau mỗi lần reload
+_CONNECTION_REGISTRY = globals().get("_CONNECTION_REGISTRY", {})
+_CONNECTION_LOCK = globals().get("_CONNECTION_LOCK", threading.Lock())
+
+
+def _get_connection_uri(uri_env):
+    uri = os.getenv(uri_env)
+    if not uri:
+        raise ValueError(f"Biến môi trường '{uri_env}' chưa được thiết lập.")
+    return uri
+
+
+def get_mongo_client(uri_env="PROD_MONGO_URI"):
+    """Lấy MongoClient dùng chung cho URI trong biến môi trường uri_env, tạo mới ở lần gọi đầu tiên."""
+    key = ("mongo", _get_connection_uri(uri_env))
+    with _CONNECTION_LOCK:
+        if key not in _CONNECTION_REGISTRY:
+            _CONNECTION_REGISTRY[key] = MongoClient(key[1], **MONGO_CLIENT_SETTINGS)
+        return _CONNECTION_REGISTRY[key]
+
+
+def get_sql_engine(uri_env):
+    """Lấy SQLAlchemy engine dùng chung cho URI trong biến môi trường uri_env, tạo mới ở lần gọi đầu tiên."""
+    key = ("sql", _get_connection_uri(uri_env))
+    with _CONNECTION_LOCK:
+        if key not in _CONNECTION_REGISTRY:
+            _CONNECTION_REGISTRY[key] = create_engine(key[1], **SQL_ENGINE_SETTINGS)
+        return _CONNECTION_REGISTRY[key]
+
+
+def dispose_all():
+    """Đóng toàn bộ MongoClient và connection pool của các engine đã tạo."""
+    with _CONNECTION_LOCK:
+        for (kind, _), connection in _CONNECTION_REGISTRY.items():
+            try:
+                if kind == "mongo":
+                    connection.close()
+                else:
+                    connection.dispose()
+            except Exception as e:
+                print(f"Lỗi khi đóng kết nối {kind}: {e}")
+        _CONNECTION_REGISTRY.clear()
+
+
+class _LazyConnection:
+    """
+    Đại diện cho client/database/engine, chỉ tạo kết nối thật ở lần truy cập thuộc tính đầu tiên.
+    Các hàm cần đối tượng thật (vd: pandas.to_sql) dùng _resolve_connection() để lấy ra.
+    """
+
+    def __init__(self, factory, label):
+        self._factory = factory
+        self._label = label
+
+    def _resolve(self):
+        return self._factory()
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __repr__(self):
+        return f"<lazy connection '{self._label}'>"
+
+
+def _resolve_connection(connection):
+    """Trả về client/engine thật nếu connection là _LazyConnection."""
+    # Kiểm tra theo type thay vì isinstance để vẫn nhận ra các đối tượng tạo trước lần reload gần nhất
+    return connection._resolve() if callable(getattr(type(connection), "_resolve", None)) else connection
+
+
 # Kết nối MongoDB
-mongo_client = MongoClient(os.getenv("PROD_MONGO_URI"))
-stock_db = mongo_client["stock_db"]
-ref_db = mongo_client["ref_db"]
+mongo_client = _LazyConnection(lambda: get_mongo_client("PROD_MONGO_URI"), "mongo_client")
+stock_db = _LazyConnection(lambda: get_mongo_client("PROD_MONGO_URI")["stock_db"], "stock_db")
+ref_db = _LazyConnection(lambda: get_mongo_client("PROD_MONGO_URI")["ref_db"], "ref_db")
 
 # Tạo các engine kết nối đến các database khác nhau
-vsuccess_engine = create_engine(os.getenv("VSUCCESS_URI"))
-twan_engine = create_engine(os.getenv("TWAN_URI"))
-cts_engine = create_engine(os.getenv("CTS_URI"))
-t2m_engine = create_engine(os.getenv("T2M_URI"))
+vsuccess_engine = _LazyConnection(lambda: get_sql_engine("VSUCCESS_URI"), "vsuccess_engine")
+twan_engine = _LazyConnection(lambda: get_sql_engine("TWAN_URI"), "twan_engine")
+cts_engine = _LazyConnection(lambda: get_sql_engine("CTS_URI"), "cts_engine")
+t2m_engine = _LazyConnection(lambda: get_sql_engine("T2M_URI"), "t2m_engine")
 
 
 # Các hàm tương tác DBs
-def get_mongo_collection(db_collection, df_name, find_query=None, projection=None):
+def get_mongo_collection(db_collection, df_name, find_query=None, projection=None, batch_size=None, dtypes=None, use_cache=False):
+    # Đọc qua cache trên đĩa nếu được yêu cầu (xem MONGO_CACHE_POLICY)
+    if use_cache:
+        return _read_through_mongo_cache(
+            db_collection,
+            df_name,
+            {"kind": "find", "query": find_query, "projection": projection, "dtypes": dtypes},
+            lambda: get_mongo_collection(db_collection, df_name, find_query, projection, batch_size, dtypes),
+        )
+
     # Các tham số cho việc thử lại và timeout
     MAX_RETRIES = 3  # Số lần thử lại tối đa
     OPERATION_TIMEOUT_SECONDS = 30  # Thời gian timeout cho mỗi lần thử (giây)
@@ -41,57 +142,739 @@ def get_mongo_collection(db_collection, df_name, find_query=None, projection=Non
     if projection is None:
         projection = {"_id": 0}
 
+    def _fetch():
+        return _find_to_frame(collection, find_query, projection, OPERATION_TIMEOUT_SECONDS, batch_size, dtypes)
+
+    return _run_mongo_with_retry(_fetch, df_name, MAX_RETRIES, RETRY_DELAY_SECONDS)
+
+
+def _find_to_frame(collection, find_query, projection, timeout_seconds, batch_size=None, dtypes=None):
+    """Thực hiện lệnh find và chuyển kết quả thành DataFrame."""
+    # Thực hiện lệnh find với điều kiện, projection và max_time_ms
+    # max_time_ms được áp dụng cho các hoạt động của cursor trên server MongoDB
+    cursor = collection.find(find_query, projection)
+    cursor.max_time_ms(timeout_seconds * 1000)  # Chuyển đổi giây sang mili giây
+
+    # Chế độ streaming: đọc từng batch và ghi thẳng vào các mảng theo cột, không giữ list các dict
+    if batch_size:
+        cursor.batch_size(batch_size)
+        return _concat_column_chunks(_iter_cursor_buffers(cursor, batch_size, projection, dtypes))
+
+    # Dữ liệu thực sự được lấy khi chuyển cursor thành list
+    # Đây là nơi ExecutionTimeout có thể xảy ra nếu server mất quá nhiều thời gian
+    docs_list = list(cursor)
+
+    # Chuyển đổi kết quả sang DataFrame và trả về
+    return pd.DataFrame(docs_list)
+
+
+def iter_mongo_collection(db_collection, df_name, find_query=None, projection=None, batch_size=50_000, dtypes=None):
+    """
+    Đọc collection theo từng phần (chunk) để xử lý mà không cần giữ toàn bộ dữ liệu trong bộ nhớ
+
+    Parameters:
+    - db_collection: database MongoDB (vd: stock_db)
+    - df_name: tên collection
+    - find_query: điều kiện lọc
+    - projection: các trường cần lấy, dùng để xác định cột và kiểu dữ liệu
+    - batch_size: số document cho mỗi chunk
+    - dtypes: dict {cột: dtype} để ghi đè kiểu dữ liệu mặc định ('category', 'object' hoặc dtype NumPy số/bool/datetime64;
+      cột số nguyên/bool không được thiếu giá trị)
+
+    Returns:
+    - generator trả về các DataFrame, mỗi DataFrame tối đa batch_size dòng
+
+    Lưu ý: không có cơ chế thử lại giữa chừng vì các chunk trước đó đã được trả về cho người gọi.
+    """
+    OPERATION_TIMEOUT_SECONDS = 30
+
+    if df_name not in db_collection.list_collection_names():
+        raise ValueError(f"Collection '{df_name}' không tồn tại trong database.")
+
+    if find_query is None:
+        find_query = {}
+    if projection is None:
+        projection = {"_id": 0}
+
+    cursor = db_collection[df_name].find(find_query, projection)
+    cursor.max_time_ms(OPERATION_TIMEOUT_SECONDS * 1000)
+    cursor.batch_size(batch_size)
+    try:
+        yield from _iter_cursor_columns(cursor, batch_size, projection, dtypes)
+    finally:
+        cursor.close()
+
+
+# Các trường có kiểu dữ liệu cố định khi đọc dạng cột, các trường còn lại được suy ra từ giá trị khác None đầu tiên
+COLUMN_DTYPE_DEFAULTS = {"date": "datetime64[ns]", "ticker": "category"}
+
+# Kiểu giá trị ghi được vào mảng của từng dtype, giá trị khác kiểu làm cột được nới thành object
+COLUMN_VALUE_TYPES = {"float64": (int, float, np.number), "datetime64[ns]": (datetime, np.datetime64)}
+
+
+def _normalize_column_dtype(column, dtype):
+    """Chuẩn hóa dtype người dùng truyền vào: 'category', 'object' hoặc tên dtype NumPy số/bool/datetime64."""
+    if dtype in ("category", "object"):
+        return dtype
+    try:
+        np_dtype = np.dtype(dtype)
+    except TypeError as e:
+        raise ValueError(f"dtype {dtype!r} của cột '{column}' không được hỗ trợ khi đọc dạng cột (dùng 'category', 'object' hoặc dtype NumPy)") from e
+    if np_dtype.kind not in "fiubMO":
+        raise ValueError(f"dtype {dtype!r} của cột '{column}' không được hỗ trợ khi đọc dạng cột (chỉ hỗ trợ số, bool, datetime64, category, object)")
+    return np_dtype.name
+
+
+def _resolve_column_dtype(column, sample_value, dtypes=None):
+    """Xác định dtype cho một cột: dtypes người dùng > mặc định theo tên > suy ra từ giá trị mẫu."""
+    if dtypes and column in dtypes:
+        return _normalize_column_dtype(column, dtypes[column])
+    if column in COLUMN_DTYPE_DEFAULTS:
+        return COLUMN_DTYPE_DEFAULTS[column]
+    if isinstance(sample_value, datetime):
+        return "datetime64[ns]"
+    if sample_value is None or (isinstance(sample_value, (int, float, np.number)) and not isinstance(sample_value, bool)):
+        # OHLCV và các chỉ báo kỹ thuật đều là số thực
+        return "float64"
+    return "object"
+
+
+def _allocate_column_buffers(column_dtypes, size):
+    """
+    Cấp phát trước các mảng NumPy cho từng cột, đã điền sẵn giá trị rỗng
+    (số nguyên/bool không có giá trị rỗng nên được điền 0, giá trị thiếu được kiểm tra khi đọc).
+    """
+    buffers = {}
+    for column, dtype in column_dtypes.items():
+        if dtype == "category":
+            buffers[column] = np.full(size, -1, dtype=np.int32)  # Lưu mã category, -1 là giá trị rỗng
+        elif dtype == "object":
+            buffers[column] = np.empty(size, dtype=object)
+        elif np.dtype(dtype).kind == "f":
+            buffers[column] = np.full(size, np.nan, dtype=dtype)
+        elif np.dtype(dtype).kind == "M":
+            buffers[column] = np.full(size, np.datetime64("NaT"), dtype=dtype)
+        else:
+            buffers[column] = np.zeros(size, dtype=dtype)
+    return buffers
+
+
+def _widen_to_object(buf):
+    """Chuyển mảng số/ngày sang object, giữ giá trị đã ghi (ngày thành datetime, NaT thành None)."""
+    if buf.dtype.kind == "M":
+        return buf.astype("datetime64[us]").astype(object)
+    return buf.astype(object)
+
+
+def _cast_column_part(part, dtype):
+    """
+    Đưa phần của một batch cũ về dtype cuối cùng của cột (cột được suy ra dtype muộn hoặc bị nới thành object).
+    Phần là số nguyên n nghĩa là n dòng của các batch trước khi cột xuất hiện, được điền giá trị rỗng.
+    """
+    if isinstance(part, int):
+        return _allocate_column_buffers({"_": dtype}, part)["_"]
+    if part.dtype == dtype or dtype == "category":
+        return part
+    if dtype == "object":
+        return _widen_to_object(part)
+    # Batch cũ chỉ gồm giá trị rỗng (cột chưa suy ra được dtype khi đó)
+    return _allocate_column_buffers({"_": dtype}, len(part))["_"]
+
+
+def _column_buffers_to_frame(buffers, column_dtypes, n_rows, category_lookup):
+    """Chuyển các mảng theo cột (n_rows dòng đầu) thành DataFrame."""
+    data = {}
+    for column, buf in buffers.items():
+        values = buf[:n_rows] if n_rows == len(buf) else buf[:n_rows].copy()
+        if column_dtypes[column] == "category":
+            values = pd.Categorical.from_codes(values, categories=list(category_lookup[column]))
+        data[column] = values
+    return pd.DataFrame(data)
+
+
+def _iter_cursor_buffers(cursor, batch_size, projection, dtypes=None):
+    """
+    Đọc cursor và ghi từng document thẳng vào các mảng theo cột.
+
+    Trả về (buffers, column_dtypes, n_rows, category_lookup) cho mỗi batch; column_dtypes và category_lookup
+    dùng chung giữa các batch (mã category không đổi, dtype chỉ có thể được nới ra).
+    Cột chỉ có None ở các document đầu được suy ra dtype từ giá trị khác None đầu tiên; giá trị không khớp
+    dtype đã suy ra (vd: chuỗi trong cột số) làm cột được nới thành object thay vì báo lỗi. Cột có dtype
+    trong dtypes giữ đúng dtype đó: giá trị không chuyển được, hoặc thiếu giá trị ở cột số nguyên/bool, sẽ báo lỗi.
+    Với projection dạng exclude, trường xuất hiện lần đầu ở document sau được thêm cột mới (các dòng trước rỗng),
+    giống pd.DataFrame(list(cursor)).
+    """
+    # Projection dạng include xác định sẵn danh sách cột, dạng exclude thì thêm cột theo các trường gặp được
+    columns = [key for key, value in projection.items() if key != "_id" and value]
+    dynamic_columns = not columns
+    column_dtypes = {}
+    strict_columns = set()  # Cột có dtype do người dùng chỉ định
+    required_columns = set()  # Cột số nguyên/bool do người dùng chỉ định: không có giá trị rỗng
+    category_lookup = {}
+    unresolved = set()  # Các cột chưa gặp giá trị khác None nào
+    buffers = None
+    n_rows = 0
+    row_offset = 0  # Số dòng của các batch đã trả về
+
+    def add_column(column, sample_value):
+        dtype = column_dtypes[column] = _resolve_column_dtype(column, sample_value, dtypes)
+        if dtypes and column in dtypes:
+            strict_columns.add(column)
+            if dtype not in ("category", "object") and np.dtype(dtype).kind in "iub":
+                required_columns.add(column)
+        elif sample_value is None and column not in COLUMN_DTYPE_DEFAULTS:
+            unresolved.add(column)
+        if dtype == "category":
+            category_lookup[column] = {}
+        if buffers is not None:
+            if column in required_columns:
+                raise ValueError(f"Cột '{column}' có dtype {dtype} nhưng thiếu ở các document trước")
+            buffers[column] = _allocate_column_buffers({column: dtype}, batch_size)[column]
+
+    for doc in cursor:
+        if buffers is None:
+            for column in columns or [key for key in doc if key != "_id"]:
+                add_column(column, doc.get(column))
+            buffers = _allocate_column_buffers(column_dtypes, batch_size)
+        elif dynamic_columns:
+            for key in doc:
+                if key not in buffers and key != "_id":
+                    add_column(key, doc[key])
+
+        for column, buf in buffers.items():
+            value = doc.get(column)
+            if value is None:
+                if column in required_columns:
+                    raise ValueError(f"Cột '{column}' có dtype {column_dtypes[column]} nhưng document thứ {row_offset + n_rows + 1} thiếu giá trị")
+                continue  # Giữ nguyên giá trị rỗng đã điền sẵn
+            if column in category_lookup:
+                lookup = category_lookup[column]
+                buf[n_rows] = lookup.setdefault(value, len(lookup))
+                continue
+            if column in strict_columns:
+                try:
+                    buf[n_rows] = value
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f"Giá trị {value!r} của cột '{column}' không chuyển được sang dtype {column_dtypes[column]}") from e
+                continue
+
+            if column in unresolved:
+                unresolved.discard(column)
+                resolved_dtype = _resolve_column_dtype(column, value, dtypes)
+                if resolved_dtype != column_dtypes[column]:
+                    # Các dòng trước đều rỗng nên chỉ cần cấp phát lại mảng theo dtype mới
+                    column_dtypes[column] = resolved_dtype
+                    buf = buffers[column] = _allocate_column_buffers({column: resolved_dtype}, batch_size)[column]
+
+            value_types = COLUMN_VALUE_TYPES.get(column_dtypes[column])
+            if value_types and (not isinstance(value, value_types) or isinstance(value, bool)):
+                column_dtypes[column] = "object"
+                buf = buffers[column] = _widen_to_object(buf)
+            buf[n_rows] = value
+
+        n_rows += 1
+        if n_rows == batch_size:
+            yield buffers, column_dtypes, n_rows, category_lookup
+            buffers = _allocate_column_buffers(column_dtypes, batch_size)
+            row_offset += n_rows
+            n_rows = 0
+
+    if buffers is not None and n_rows:
+        yield buffers, column_dtypes, n_rows, category_lookup
+
+
+def _iter_cursor_columns(cursor, batch_size, projection, dtypes=None):
+    """
+    Đọc cursor theo cột (xem _iter_cursor_buffers), trả về một DataFrame cho mỗi batch.
+    Mã category được dùng chung giữa các batch để ghép lại không bị đổi sang object.
+    """
+    for buffers, column_dtypes, n_rows, category_lookup in _iter_cursor_buffers(cursor, batch_size, projection, dtypes):
+        yield _column_buffers_to_frame(buffers, column_dtypes, n_rows, category_lookup)
+
+
+def _concat_column_chunks(buffer_chunks):
+    """
+    Ghép các batch dạng mảng theo cột của _iter_cursor_buffers thành một DataFrame, giữ nguyên kiểu category.
+
+    Ghép lần lượt từng cột và bỏ các mảng batch của cột đó ngay sau khi ghép, nên bộ nhớ đỉnh chỉ cao hơn
+    kích thước kết quả khoảng một cột (thay vì gấp đôi như pd.concat trên danh sách DataFrame).
+    """
+    column_parts = {}
+    column_dtypes = None
+    category_lookup = {}
+    total_rows = 0
+    for buffers, column_dtypes, n_rows, category_lookup in buffer_chunks:
+        for column, buf in buffers.items():
+            # Cột xuất hiện lần đầu ở batch này: các dòng của batch trước được ghi nhận bằng số dòng, điền rỗng khi ghép
+            parts = column_parts.setdefault(column, [total_rows] if total_rows else [])
+            parts.append(buf if n_rows == len(buf) else buf[:n_rows].copy())
+        total_rows += n_rows
+    if not column_parts:
+        return pd.DataFrame()
+
+    data = {}
+    for column in list(column_parts):
+        parts = column_parts.pop(column)
+        values = parts[0] if len(parts) == 1 else np.concatenate([_cast_column_part(part, column_dtypes[column]) for part in parts])
+        del parts
+        if column_dtypes[column] == "category":
+            # Danh sách category cuối cùng chứa mọi giá trị của các batch trước (mã không đổi)
+            values = pd.Categorical.from_codes(values, categories=list(category_lookup[column]))
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def _run_mongo_with_retry(operation, df_name, max_retries=3, retry_delay_seconds=1, backoff_factor=1, retry_stats=None):
+    """
+    Thực thi một thao tác đọc MongoDB với cơ chế thử lại khi gặp lỗi.
+    Thời gian chờ lần thứ k là retry_delay_seconds * backoff_factor**k, số lần thử lại được ghi vào retry_stats nếu có.
+    """
     last_exception = None
-    for attempt in range(MAX_RETRIES):
+    for attempt in range(max_retries):
+        if retry_stats is not None:
+            retry_stats["retries"] = attempt
         try:
-            # Thực hiện lệnh find với điều kiện, projection và max_time_ms
-            # max_time_ms được áp dụng cho các hoạt động của cursor trên server MongoDB
-            cursor = collection.find(find_query, projection)
-            cursor.max_time_ms(OPERATION_TIMEOUT_SECONDS * 1000)  # Chuyển đổi giây sang mili giây
-
-            # Dữ liệu thực sự được lấy khi chuyển cursor thành list
-            # Đây là nơi ExecutionTimeout có thể xảy ra nếu server mất quá nhiều thời gian
-            docs_list = list(cursor)
-
-            # Chuyển đổi kết quả sang DataFrame và trả về
-            df = pd.DataFrame(docs_list)
-            return df
+            return operation()
         except ExecutionTimeout as e:
             last_exception = e
-            print(f"Truy vấn cho '{df_name}' bị timeout (lần thử {attempt + 1}/{MAX_RETRIES}). Lỗi: {e}")
-            if attempt < MAX_RETRIES - 1:
-                print(f"Đang thử lại sau {RETRY_DELAY_SECONDS} giây...")
-                time.sleep(RETRY_DELAY_SECONDS)
-            else:
-                print(f"Đã đạt số lần thử lại tối đa cho '{df_name}'.")
+            print(f"Truy vấn cho '{df_name}' bị timeout (lần thử {attempt + 1}/{max_retries}). Lỗi: {e}")
         except PyMongoError as e:  # Bắt các lỗi khác liên quan đến MongoDB
             last_exception = e
-            print(f"Lỗi MongoDB khi truy vấn '{df_name}' (lần thử {attempt + 1}/{MAX_RETRIES}). Lỗi: {e}")
-            if attempt < MAX_RETRIES - 1:
-                print(f"Đang thử lại sau {RETRY_DELAY_SECONDS} giây...")
-                time.sleep(RETRY_DELAY_SECONDS)
-            else:
-                print(f"Đã đạt số lần thử lại tối đa cho '{df_name}'.")
+            print(f"Lỗi MongoDB khi truy vấn '{df_name}' (lần thử {attempt + 1}/{max_retries}). Lỗi: {e}")
         except Exception as e:  # Bắt các lỗi không mong muốn khác
             last_exception = e
-            print(f"Lỗi không mong muốn khi truy vấn '{df_name}' (lần thử {attempt + 1}/{MAX_RETRIES}). Lỗi: {e}")
-            if attempt < MAX_RETRIES - 1:
-                print(f"Đang thử lại sau {RETRY_DELAY_SECONDS} giây...")
-                time.sleep(RETRY_DELAY_SECONDS)
-            else:
-                print(f"Đã đạt số lần thử lại tối đa cho '{df_name}'.")
+            print(f"Lỗi không mong muốn khi truy vấn '{df_name}' (lần thử {attempt + 1}/{max_retries}). Lỗi: {e}")
+
+        if attempt < max_retries - 1:
+            delay_seconds = retry_delay_seconds * backoff_factor**attempt
+            print(f"Đang thử lại sau {delay_seconds} giây...")
+            time.sleep(delay_seconds)
+        else:
+            print(f"Đã đạt số lần thử lại tối đa cho '{df_name}'.")
 
     # Nếu tất cả các lần thử đều thất bại, raise một lỗi Runtime
     if last_exception:
         raise RuntimeError(
-            f"Không thể lấy dữ liệu cho '{df_name}' sau {MAX_RETRIES} lần thử. Lỗi cuối cùng: {last_exception}"
+            f"Không thể lấy dữ liệu cho '{df_name}' sau {max_retries} lần thử. Lỗi cuối cùng: {last_exception}"
         ) from last_exception
     else:
         # Trường hợp này không nên xảy ra nếu có lỗi và đã được bắt lại
-        raise RuntimeError(f"Không thể lấy dữ liệu cho '{df_name}' sau {MAX_RETRIES} lần thử (không rõ nguyên nhân).")
+        raise RuntimeError(f"Không thể lấy dữ liệu cho '{df_name}' sau {max_retries} lần thử (không rõ nguyên nhân).")
+
+
+def get_mongo_tickers(
+    db_collection, df_name, tickers, limit_per_ticker=None, find_query=None, projection=None, sort_field="date", use_cache=False
+):
+    """
+    Lấy dữ liệu của nhiều mã cổ phiếu bằng một truy vấn aggregation duy nhất
+
+    Parameters:
+    - db_collection: database MongoDB (vd: stock_db)
+    - df_name: tên collection (vd: "history_stock")
+    - tickers: danh sách mã cổ phiếu
+    - limit_per_ticker: số dòng tối đa cho mỗi mã, giới hạn được thực hiện trên server (None = lấy toàn bộ)
+    - find_query: điều kiện lọc bổ sung ngoài danh sách mã
+    - projection: các trường cần lấy (mặc định bỏ '_id')
+    - sort_field: trường dùng để sắp xếp giảm dần trong từng mã
+    - use_cache: đọc qua cache trên đĩa (xem MONGO_CACHE_POLICY)
+
+    Returns:
+    - dict {ticker: DataFrame} theo đúng thứ tự của tickers, mỗi DataFrame sắp xếp theo sort_field giảm dần
+    """
+    MAX_RETRIES = 3
+    OPERATION_TIMEOUT_SECONDS = 30
+    RETRY_DELAY_SECONDS = 1
+
+    tickers = list(dict.fromkeys(tickers))  # Bỏ mã trùng nhưng giữ thứ tự
+    if find_query is None:
+        find_query = {}
+    if projection is None:
+        projection = {"_id": 0}
+
+    # Projection dạng include phải giữ lại 'ticker' để tách kết quả theo mã
+    projection = dict(projection)
+    if any(value for key, value in projection.items() if key != "_id"):
+        projection["ticker"] = 1
+
+    pipeline = [{"$match": {**find_query, "ticker": {"$in": tickers}}}]
+    if limit_per_ticker is not None:
+        # Đánh số thứ tự từng dòng trong mỗi mã rồi cắt ngay trên server
+        pipeline += [
+            {
+                "$setWindowFields": {
+                    "partitionBy": "$ticker",
+                    "sortBy": {sort_field: -1},
+                    "output": {"_row_number": {"$documentNumber": {}}},
+                }
+            },
+            {"$match": {"_row_number": {"$lte": int(limit_per_ticker)}}},
+            {"$unset": "_row_number"},
+        ]
+    pipeline += [{"$sort": {"ticker": 1, sort_field: -1}}, {"$project": projection}]
+
+    collection = db_collection[df_name]
+
+    def _fetch():
+        cursor = collection.aggregate(pipeline, allowDiskUse=True, maxTimeMS=OPERATION_TIMEOUT_SECONDS * 1000)
+        return pd.DataFrame(list(cursor))
+
+    if use_cache:
+        df = _read_through_mongo_cache(
+            db_collection,
+            df_name,
+            {"kind": "aggregate", "pipeline": pipeline},
+            lambda: _run_mongo_with_retry(_fetch, df_name, MAX_RETRIES, RETRY_DELAY_SECONDS),
+        )
+    else:
+        df = _run_mongo_with_retry(_fetch, df_name, MAX_RETRIES, RETRY_DELAY_SECONDS)
+
+    # Chỉ kiểm tra sự tồn tại của collection khi không có kết quả, tránh thêm một round trip mỗi lần gọi
+    if df.empty and df_name not in db_collection.list_collection_names():
+        raise ValueError(f"Collection '{df_name}' không tồn tại trong database.")
+
+    result = {ticker: pd.DataFrame(columns=df.columns) for ticker in tickers}
+    if not df.empty:
+        for ticker, group_df in df.groupby("ticker", sort=False):
+            result[ticker] = group_df.reset_index(drop=True)
+    return result
+
+
+def get_mongo_collections_parallel(jobs, max_workers=None, raise_on_error=True):
+    """
+    Lấy nhiều collection/truy vấn MongoDB song song trên một thread pool
+
+    Parameters:
+    - jobs: danh sách tuple (db_collection, df_name, find_query, projection), find_query/projection có thể bỏ trống
+    - max_workers: số luồng tối đa (mặc định bằng kích thước connection pool của MongoClient)
+    - raise_on_error: raise lỗi nếu có job thất bại sau tất cả lần thử, nếu False kết quả của job đó là None
+
+    Returns:
+    - results: list DataFrame theo đúng thứ tự của jobs
+    - report_df: DataFrame thống kê từng job (latency_seconds, docs, retries, status)
+    """
+    MAX_RETRIES = 3
+    OPERATION_TIMEOUT_SECONDS = 30
+    RETRY_DELAY_SECONDS = 1
+    BACKOFF_FACTOR = 2  # Chờ 1s, 2s, 4s... giữa các lần thử
+
+    if not jobs:
+        return [], pd.DataFrame(columns=["job", "db", "collection", "latency_seconds", "docs", "retries", "status"])
+
+    if max_workers is None:
+        max_workers = mongo_client.options.pool_options.max_pool_size or 10
+    max_workers = max(1, min(max_workers, len(jobs)))
 
+    def _run_job(job_index):
+        db_collection, df_name, find_query, projection = (tuple(jobs[job_index]) + (None, None))[:4]
+        collection = db_collection[df_name]
+        job_stats = {"job": job_index, "db": db_collection.name, "collection": df_name, "retries": 0}
+
+        start_time = time.perf_counter()
+        try:
+            df = _run_mongo_with_retry(
+                lambda: _find_to_frame(collection, find_query or {}, projection or {"_id": 0}, OPERATION_TIMEOUT_SECONDS),
+                df_name,
+                MAX_RETRIES,
+                RETRY_DELAY_SECONDS,
+                backoff_factor=BACKOFF_FACTOR,
+                retry_stats=job_stats,
+            )
+            job_stats.update({"docs": len(df), "status": "ok"})
+            return df, job_stats, None
+        except RuntimeError as e:
+            job_stats.update({"docs": 0, "status": "error"})
+            return None, job_stats, e
+        finally:
+            job_stats["latency_seconds"] = time.perf_counter() - start_time
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        outputs = list(executor.map(_run_job, range(len(jobs))))
+
+    results = [df for df, _, _ in outputs]
+    report_df = pd.DataFrame([job_stats for _, job_stats, _ in outputs])
+    report_df = report_df[["job", "db", "collection", "latency_seconds", "docs", "retries", "status"]]
+
+    errors = [error for _, _, error in outputs if error is not None]
+    if errors and raise_on_error:
+        raise RuntimeError(f"{len(errors)}/{len(jobs)} truy vấn thất bại. Lỗi đầu tiên: {errors[0]}") from errors[0]
+    return results, report_df
+
+
+# ==============================================================================
+# CACHE TRÊN ĐĨA CHO CÁC TRUY VẤN MONGODB
+# ==============================================================================
+
+MONGO_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache", "mongo")
+MONGO_CACHE_MAX_BYTES = 2 * 1024**3  # Dung lượng tối đa của thư mục cache, vượt quá sẽ xóa theo LRU
+MONGO_CACHE_DEFAULT_TTL_SECONDS = 24 * 60 * 60
+MONGO_CACHE_MARKET_DATE_REFRESH_SECONDS = 5 * 60  # Thời gian giữ ngày giao dịch mới nhất trong bộ nhớ
+
+# Chính sách cache theo collection:
+# - None: không cache (dữ liệu trong phiên)
+# - "market_date": hợp lệ cho tới khi ref_db.date_series có ngày giao dịch mới
+# - số nguyên: TTL tính bằng giây
+# Các collection không có trong danh sách dùng MONGO_CACHE_DEFAULT_TTL_SECONDS
+MONGO_CACHE_POLICY = {
+    "today_stock": None,
+    "history_stock": "market_date",
+    "date_series": "market_date",
+}
+
+mongo_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "bypass": 0}
+_market_date_memo = {"value": None, "fetched_at": 0.0}
+
+
+def get_mongo_cache_stats():
+    """Trả về số lần hit/miss/evict của cache MongoDB trong phiên hiện tại."""
+    total = mongo_cache_stats["hits"] + mongo_cache_stats["misses"]
+    return {**mongo_cache_stats, "hit_ratio": mongo_cache_stats["hits"] / total if total else 0.0}
+
+
+def clear_mongo_cache():
+    """Xóa toàn bộ dữ liệu trong thư mục cache MongoDB."""
+    for file_path in glob.glob(os.path.join(MONGO_CACHE_DIR, "*")):
+        os.remove(file_path)
+    _market_date_memo.update({"value": None, "fetched_at": 0.0})
+
+
+def _get_latest_market_date():
+    """Lấy ngày giao dịch mới nhất từ ref_db.date_series (giữ trong bộ nhớ một thời gian ngắn)."""
+    now = time.time()
+    if _market_date_memo["value"] is None or now - _market_date_memo["fetched_at"] > MONGO_CACHE_MARKET_DATE_REFRESH_SECONDS:
+        doc = ref_db["date_series"].find_one({}, {"_id": 0, "date": 1}, sort=[("date", -1)])
+        _market_date_memo.update({"value": str(doc["date"]) if doc else "", "fetched_at": now})
+    return _market_date_memo["value"]
+
+
+def _mongo_cache_key(db_collection, df_name, key_payload):
+    """Tạo khóa cache từ tên database, collection và nội dung truy vấn."""
+    payload = {"db": db_collection.name, "collection": df_name, **key_payload}
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _read_through_mongo_cache(db_collection, df_name, key_payload, loader):
+    """
+    Đọc dữ liệu từ cache Parquet nếu còn hợp lệ, ngược lại gọi loader() để lấy từ MongoDB và ghi vào cache.
+    """
+    policy = MONGO_CACHE_POLICY.get(df_name, MONGO_CACHE_DEFAULT_TTL_SECONDS)
+    if policy is None:
+        mongo_cache_stats["bypass"] += 1
+        return loader()
+
+    key = _mongo_cache_key(db_collection, df_name, key_payload)
+    data_path = os.path.join(MONGO_CACHE_DIR, f"{key}.parquet")
+    meta_path = os.path.join(MONGO_CACHE_DIR, f"{key}.json")
+    market_date = _get_latest_market_date() if policy == "market_date" else None
+
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if policy == "market_date":
+                is_valid = meta.get("market_date") == market_date
+            else:
+                is_valid = time.time() - meta.get("created_at", 0) < policy
+            if is_valid:
+                df = pd.read_parquet(data_path)
+                os.utime(data_path)  # Cập nhật thời điểm truy cập cho LRU
+                mongo_cache_stats["hits"] += 1
+                return df
+        except Exception as e:
+            print(f"Không đọc được cache cho '{df_name}', sẽ tải lại từ MongoDB. Lỗi: {e}")
+
+    mongo_cache_stats["misses"] += 1
+    df = loader()
+
+    try:
+        os.makedirs(MONGO_CACHE_DIR, exist_ok=True)
+        # Ghi ra file tạm rồi đổi tên để không để lại cache dở dang nếu bị ngắt giữa chừng
+        temp_path = f"{data_path}.tmp"
+        df.to_parquet(temp_path, index=False)
+        os.replace(temp_path, data_path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"collection": df_name, "created_at": time.time(), "market_date": market_date}, f)
+        _evict_mongo_cache()
+    except Exception as e:
+        print(f"Không ghi được cache cho '{df_name}'. Lỗi: {e}")
+
+    return df
+
+
+def _evict_mongo_cache():
+    """Xóa các entry ít được truy cập gần đây nhất cho tới khi thư mục cache nằm trong giới hạn dung lượng."""
+    entries = []
+    for data_path in glob.glob(os.path.join(MONGO_CACHE_DIR, "*.parquet")):
+        stat = os.stat(data_path)
+        entries.append((stat.st_mtime, stat.st_size, data_path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, data_path in sorted(entries):
+        if total_size <= MONGO_CACHE_MAX_BYTES:
+            break
+        os.remove(data_path)
+        meta_path = data_path[: -len(".parquet")] + ".json"
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        total_size -= size
+        mongo_cache_stats["evictions"] += 1
+
+
+# ==============================================================================
+# ĐỒNG BỘ TĂNG DẦN HISTORY_STOCK VỀ KHO CỤC BỘ
+# ==============================================================================
+
+HISTORY_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache", "history_stock")
+
+
+def _load_history_manifest(store_dir):
+    manifest_path = os.path.join(store_dir, "_manifest.json")
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_history_manifest(store_dir, manifest):
+    manifest_path = os.path.join(store_dir, "_manifest.json")
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+def sync_history_stock(tickers, projection=None, overlap_days=5, db_collection=None, df_name="history_stock", store_dir=HISTORY_STORE_DIR):
+    """
+    Đồng bộ tăng dần dữ liệu lịch sử về kho Parquet cục bộ (mỗi mã một file)
+
+    Mỗi mã lưu lại ngày lớn nhất đã có (high-water mark). Lần đồng bộ sau chỉ lấy các dòng
+    từ overlap_days phiên gần nhất trở đi để vừa bổ sung dòng mới vừa cập nhật các dòng bị sửa
+    (overlap_days=0: chỉ lấy các dòng sau high-water mark). Tất cả các mã được lấy trong một truy vấn duy nhất.
+
+    Parameters:
+    - tickers: danh sách mã cổ phiếu
+    - projection: các trường cần lấy (bắt buộc có 'date' và 'ticker' nếu là projection dạng include)
+    - overlap_days: số phiên gần nhất được lấy lại để cập nhật dữ liệu bị điều chỉnh (>= 0)
+    - db_collection: database MongoDB (mặc định stock_db)
+    - df_name: tên collection lịch sử
+    - store_dir: thư mục lưu kho cục bộ
+
+    Returns:
+    - dict {ticker: DataFrame} toàn bộ lịch sử của từng mã, sắp xếp theo ngày giảm dần
+    """
+    if db_collection is None:
+        db_collection = stock_db
+    if projection is None:
+        projection = {"_id": 0}
+    if overlap_days < 0:
+        raise ValueError(f"overlap_days phải >= 0, nhận được: {overlap_days}")
+
+    tickers = list(dict.fromkeys(tickers))
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = _load_history_manifest(store_dir)
+    projection_hash = hashlib.sha256(json.dumps(projection, sort_keys=True).encode("utf-8")).hexdigest()
+
+    # --- 1. Đọc kho cục bộ và xác định mốc cần lấy lại cho từng mã ---
+    local_dict = {}
+    since_dict = {}
+    since_groups = {}  # {(mốc ngày, toán tử): [các mã]}, None nghĩa là lấy toàn bộ
+    for ticker in tickers:
+        file_path = os.path.join(store_dir, f"{ticker}.parquet")
+        entry = manifest.get(ticker)
+        local_df = None
+        if entry and entry.get("projection_hash") == projection_hash and os.path.exists(file_path):
+            local_df = pd.read_parquet(file_path)
+
+        since = None
+        if local_df is not None and not local_df.empty:
+            local_dates = np.sort(local_df["date"].unique())
+            if overlap_days == 0:
+                since = (pd.Timestamp(local_dates[-1]), "$gt")
+            else:
+                since = (pd.Timestamp(local_dates[max(len(local_dates) - overlap_days, 0)]), "$gte")
+        local_dict[ticker] = local_df
+        since_dict[ticker] = since
+        since_groups.setdefault(since, []).append(ticker)
+
+    # --- 2. Lấy phần chênh lệch của tất cả các mã trong một truy vấn ---
+    conditions = []
+    for since, group_tickers in since_groups.items():
+        condition = {"ticker": {"$in": group_tickers}}
+        if since is not None:
+            since_date, operator = since
+            condition["date"] = {operator: since_date.to_pydatetime()}
+        conditions.append(condition)
+    delta_df = get_mongo_collection(db_collection, df_name, find_query={"$or": conditions}, projection=projection, batch_size=50_000)
+
+    # --- 3. Gộp vào kho cục bộ: thay thế cửa sổ overlap, thêm dòng mới, ghi file qua file tạm ---
+    result = {}
+    delta_groups = dict(tuple(delta_df.groupby("ticker", sort=False, observed=True))) if not delta_df.empty else {}
+    # Cột của bảng rỗng khi truy vấn không trả về dòng nào: lấy theo projection dạng include
+    schema_columns = list(delta_df.columns) if len(delta_df.columns) else [field for field, value in projection.items() if value and field != "_id"]
+    fetched_rows = 0
+    for ticker in tickers:
+        local_df = local_dict[ticker]
+        new_df = delta_groups.get(ticker, pd.DataFrame(columns=delta_df.columns))
+        fetched_rows += len(new_df)
+
+        since = since_dict[ticker]
+        if since is None:
+            merged_df = new_df
+        elif new_df.empty:
+            merged_df = local_df  # Không có dữ liệu trả về thì giữ nguyên kho cục bộ
+        else:
+            since_date, operator = since
+            kept_mask = local_df["date"] <= since_date if operator == "$gt" else local_df["date"] < since_date
+            merged_df = pd.concat([local_df[kept_mask], new_df], ignore_index=True)
+
+        if merged_df.empty:
+            # Mã chưa có dữ liệu ở cả kho cục bộ lẫn Mongo: không ghi file/manifest để lần sau lấy lại toàn bộ
+            print(f"Không có dữ liệu '{df_name}' cho mã {ticker}, bỏ qua.")
+            result[ticker] = pd.DataFrame(columns=schema_columns)
+            continue
+
+        merged_df = merged_df.sort_values("date", ascending=False).reset_index(drop=True)
+        if "ticker" in merged_df.columns:
+            merged_df["ticker"] = merged_df["ticker"].astype(str)
+
+        file_path = os.path.join(store_dir, f"{ticker}.parquet")
+        if not new_df.empty or not os.path.exists(file_path):
+            temp_path = f"{file_path}.tmp"
+            merged_df.to_parquet(temp_path, index=False)
+            os.replace(temp_path, file_path)
+
+        manifest[ticker] = {
+            "high_water_mark": str(merged_df["date"].max()) if not merged_df.empty else None,
+            "rows": len(merged_df),
+            "projection_hash": projection_hash,
+            "synced_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        result[ticker] = merged_df
+
+    _save_history_manifest(store_dir, manifest)
+    print(f"Đồng bộ '{df_name}': {len(tickers)} mã, tải về {fetched_rows} dòng.")
+    return result
+
+
+def overwrite_mongo_collection(collection, df, chunk_size=None, parallel_workers=1, key_columns=None):
+    """
+    Ghi đè toàn bộ collection bằng DataFrame thông qua collection tạm (không gián đoạn việc đọc)
+
+    Parameters:
+    - collection: collection MongoDB cần ghi đè
+    - df: pandas DataFrame cần lưu
+    - chunk_size: số document mỗi lần insert. Nếu có, dùng chế độ bulk: tạo record theo từng chunk,
+      insert không theo thứ tự (unordered) và khi thử lại chỉ ghi các chunk chưa được xác nhận
+    - parallel_workers: số luồng insert song song ở chế độ bulk
+    - key_columns: danh sách cột khóa (vd: ["ticker", "date"]). Nếu có, dùng chế độ delta: chỉ upsert
+      các dòng thay đổi và xóa các khóa không còn trong df, không đổi tên collection
+
+    Returns:
+    - dict thống kê ở chế độ bulk/delta, None ở chế độ mặc định
+    """
+    if key_columns:
+        return _publish_mongo_delta(collection, df, list(key_columns))
 
-def overwrite_mongo_collection(collection, df):
     # Lấy tên collection hiện tại và database
     collection_name = collection.name
     db = collection.database  # Truy cập database từ collection
@@ -100,41 +883,49 @@ def overwrite_mongo_collection(collection, df):
 
     # Reset index của DataFrame
     df_reset = df.reset_index(drop=True)
-    records = df_reset.replace({pd.NaT: None}).to_dict(orient="records")
+    records = None
+    if not chunk_size:
+        records = df_reset.replace({pd.NaT: None}).to_dict(orient="records")
 
     MAX_RETRIES = 3
     RETRY_DELAY_SECONDS = 1
     last_exception = None
+    bulk_state = {"acknowledged": set(), "pending": {}}  # Trạng thái các chunk đã ghi, giữ qua các lần thử lại
+    swap_state = {"published": False}  # Đã đổi tên collection tạm thành tên chuẩn hay chưa, giữ qua các lần thử lại
+    bytes_written = None
+    start_time = time.perf_counter()
 
     for attempt in range(MAX_RETRIES):
         try:
-            # 1. Lưu dữ liệu vào collection tạm
+            # 1. Lưu dữ liệu vào collection tạm (bỏ qua nếu lần thử trước đã đổi tên xong, chỉ còn dọn collection cũ)
             temp_collection = db[temp_collection_name]
-            temp_collection.drop()  # Đảm bảo collection tạm sạch trước khi insert
-            if records:  # Ensure records is not empty before inserting
-                temp_collection.insert_many(records)
-
-            # 2. Rename collection cũ thành 'old_' (nếu tồn tại)
-            if collection_name in db.list_collection_names():
-                db[collection_name].rename(old_collection_name, dropTarget=True)
-
-            # 3. Rename collection tạm thành tên chuẩn
-            # Check if temp_collection exists before renaming, as it might have been dropped or not created if records were empty
-            if temp_collection_name in db.list_collection_names():
-                temp_collection.rename(collection_name, dropTarget=True)
-            elif not records and collection_name not in db.list_collection_names():
-                # If records were empty and original collection didn't exist, effectively we are creating an empty collection
-                pass  # Or db.create_collection(collection_name) if explicit creation is desired
-            elif not records and collection_name in db.list_collection_names():
-                # If records were empty and original collection existed, it means we want to empty it.
-                # The old collection was renamed to old_collection_name, so the current state is an empty collection_name.
-                # This case is handled by the rename of old_collection_name and then its deletion.
-                pass
-
-            # 4. Xóa collection 'old_' (nếu tồn tại)
-            if old_collection_name in db.list_collection_names():
-                db[old_collection_name].drop()
+            if not swap_state["published"]:
+                if chunk_size:
+                    # Chỉ làm sạch collection tạm ở lần đầu, các lần sau tiếp tục từ chunk chưa được xác nhận
+                    if attempt == 0:
+                        temp_collection.drop()
+                    _bulk_insert_chunks(temp_collection, df_reset, chunk_size, parallel_workers, bulk_state)
+                    try:
+                        bytes_written = db.command("collStats", temp_collection_name).get("size")
+                    except PyMongoError:
+                        pass
+                else:
+                    temp_collection.drop()  # Đảm bảo collection tạm sạch trước khi insert
+                    if records:  # Ensure records is not empty before inserting
+                        temp_collection.insert_many(records)
+
+            # 2-4. Đổi tên collection tạm thành tên chuẩn và xóa collection cũ
+            _swap_temp_collection(db, collection_name, temp_collection_name, old_collection_name, swap_state, allow_empty=df_reset.empty)
 
+            if chunk_size:
+                elapsed = time.perf_counter() - start_time
+                return {
+                    "docs": len(df_reset),
+                    "chunks": len(bulk_state["acknowledged"]),
+                    "seconds": elapsed,
+                    "docs_per_second": len(df_reset) / elapsed if elapsed else None,
+                    "bytes": bytes_written,
+                }
             return  # Exit if successful
 
         except (PyMongoError, Exception) as e:
@@ -152,6 +943,142 @@ def overwrite_mongo_collection(collection, df):
         ) from last_exception
 
 
+ROW_HASH_FIELD = "_row_hash"  # Trường lưu hash nội dung của từng document ở chế độ delta
+
+
+def _publish_mongo_delta(collection, df, key_columns, batch_size=1000):
+    """
+    So sánh df với hash nội dung đang lưu trong collection và chỉ ghi phần thay đổi bằng bulk_write.
+    """
+    collection_name = collection.name
+    start_time = time.perf_counter()
+
+    # 1. Đảm bảo có unique index trên các cột khóa để upsert/xóa theo khóa không phải quét toàn bộ collection
+    collection.create_index([(column, 1) for column in key_columns], unique=True, name="_".join(key_columns) + "_key")
+
+    # 2. Tính hash nội dung cho từng dòng mới (không tính cột khóa)
+    df_new = df.reset_index(drop=True)
+    value_columns = [column for column in df_new.columns if column not in key_columns]
+    df_new[ROW_HASH_FIELD] = pd.util.hash_pandas_object(df_new[value_columns], index=False).values.view(np.int64)
+
+    # 3. Chỉ đọc khóa và hash của dữ liệu đang lưu
+    projection = {"_id": 0, ROW_HASH_FIELD: 1, **{column: 1 for column in key_columns}}
+    existing_df = pd.DataFrame(list(collection.find({}, projection)), columns=key_columns + [ROW_HASH_FIELD])
+
+    merged_df = df_new[key_columns + [ROW_HASH_FIELD]].merge(
+        existing_df, on=key_columns, how="outer", suffixes=("", "_old"), indicator=True
+    )
+    changed_mask = (merged_df["_merge"] == "left_only") | (
+        (merged_df["_merge"] == "both") & (merged_df[ROW_HASH_FIELD] != merged_df[f"{ROW_HASH_FIELD}_old"])
+    )
+    changed_keys = merged_df.loc[changed_mask, key_columns]
+    deleted_keys = merged_df.loc[merged_df["_merge"] == "right_only", key_columns]
+
+    # 4. Tạo các thao tác upsert/xóa cho những khóa thay đổi
+    changed_df = df_new.merge(changed_keys, on=key_columns, how="inner")
+    operations = []
+    for record in changed_df.replace({pd.NaT: None}).to_dict(orient="records"):
+        key_filter = {column: record[column] for column in key_columns}
+        operations.append(ReplaceOne(key_filter, record, upsert=True))
+    for record in deleted_keys.replace({pd.NaT: None}).to_dict(orient="records"):
+        operations.append(DeleteOne(record))
+
+    MAX_RETRIES = 3
+    RETRY_DELAY_SECONDS = 1
+    for batch_start in range(0, len(operations), batch_size):
+        batch = operations[batch_start : batch_start + batch_size]
+        for attempt in range(MAX_RETRIES):
+            try:
+                # Upsert theo khóa nên ghi lại cùng một batch là idempotent
+                collection.bulk_write(batch, ordered=False)
+                break
+            except PyMongoError as e:
+                print(f"Error writing delta to '{collection_name}' (attempt {attempt + 1}/{MAX_RETRIES}): {e}")
+                if attempt == MAX_RETRIES - 1:
+                    raise RuntimeError(f"Failed to publish delta to '{collection_name}'. Last error: {e}") from e
+                time.sleep(RETRY_DELAY_SECONDS)
+
+    return {
+        "upserted": len(changed_df),
+        "deleted": len(deleted_keys),
+        "unchanged": len(df_new) - len(changed_df),
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def _swap_temp_collection(db, collection_name, temp_collection_name, old_collection_name, swap_state, allow_empty=False):
+    """
+    Đổi tên collection tạm thành tên chuẩn, chỉ gọi list_collection_names một lần.
+
+    Gọi lại được an toàn khi lần trước lỗi giữa chừng: swap_state["published"] ghi nhận bước đổi tên tạm -> chuẩn
+    đã xong, các lần gọi sau chỉ dọn collection 'old_'. Collection đang dùng không bao giờ bị đổi tên khi
+    collection tạm không tồn tại.
+    """
+    existing_names = set(db.list_collection_names())
+
+    if not swap_state["published"]:
+        if temp_collection_name not in existing_names:
+            # Collection tạm không tồn tại khi không có record nào được insert
+            if not allow_empty:
+                raise RuntimeError(f"Collection tạm '{temp_collection_name}' không tồn tại, giữ nguyên '{collection_name}'.")
+            if collection_name in existing_names:
+                db[collection_name].drop()
+            swap_state["published"] = True
+            return
+
+        # 2. Rename collection cũ thành 'old_' (nếu tồn tại)
+        if collection_name in existing_names:
+            db[collection_name].rename(old_collection_name, dropTarget=True)
+            existing_names.add(old_collection_name)
+
+        # 3. Rename collection tạm thành tên chuẩn
+        db[temp_collection_name].rename(collection_name, dropTarget=True)
+        swap_state["published"] = True
+
+    # 4. Xóa collection 'old_' (nếu tồn tại)
+    if old_collection_name in existing_names:
+        db[old_collection_name].drop()
+
+
+def _bulk_insert_chunks(temp_collection, df, chunk_size, parallel_workers, bulk_state):
+    """
+    Insert DataFrame vào collection theo từng chunk, bỏ qua các chunk đã được xác nhận ở lần thử trước.
+
+    Record của chunk bị lỗi được giữ lại (đã có '_id' do pymongo gán) để lần thử sau insert lại
+    một cách idempotent: các document đã ghi sẽ báo trùng khóa và được bỏ qua.
+    """
+    acknowledged = bulk_state["acknowledged"]
+    pending = bulk_state["pending"]
+    chunk_starts = [start for start in range(0, len(df), chunk_size) if start not in acknowledged]
+
+    def _insert_chunk(start):
+        chunk_records = pending.get(start)
+        if chunk_records is None:
+            chunk_records = df.iloc[start : start + chunk_size].replace({pd.NaT: None}).to_dict(orient="records")
+        try:
+            temp_collection.insert_many(chunk_records, ordered=False)
+        except BulkWriteError as e:
+            # Chỉ lỗi trùng khóa (11000) nghĩa là document đã được ghi ở lần thử trước
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])) or e.details.get("writeConcernErrors"):
+                pending[start] = chunk_records
+                raise
+        except Exception:
+            pending[start] = chunk_records
+            raise
+        pending.pop(start, None)
+        acknowledged.add(start)
+
+    if parallel_workers > 1:
+        with ThreadPoolExecutor(max_workers=parallel_workers) as executor:
+            futures = [executor.submit(_insert_chunk, start) for start in chunk_starts]
+            errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            raise errors[0]
+    else:
+        for start in chunk_starts:
+            _insert_chunk(start)
+
+
 def save_to_mssql(engine, df, table_name, if_exists="replace", index=False, max_retries=5):
     """
     Lưu DataFrame vào SQL với cơ chế thử lại khi gặp lỗi
@@ -168,6 +1095,7 @@ def save_to_mssql(engine, df, table_name, if_exists="replace", index=False, max_
     Returns:
     - True nếu thành công, raise exception nếu thất bại sau tất cả lần thử
     """
+    engine = _resolve_connection(engine)
     last_exception = None
     for _ in range(max_retries):
         try:
@@ -179,3 +1107,145 @@ def save_to_mssql(engine, df, table_name, if_exists="replace", index=False, max_
     # Nếu tất cả các lần thử đều thất bại
     if last_exception:
         raise RuntimeError(f"Không thể lưu dữ liệu vào bảng '{table_name}'. Lỗi: {last_exception}") from last_exception
+
+
+def save_to_mssql_bulk(
+    engine, df, table_name, if_exists="replace", index=False, chunk_size=10_000, dtype=None, max_retries=5, retry_delay=1
+):
+    """
+    Lưu DataFrame vào SQL theo từng chunk với kiểu cột cố định, dùng cho các bảng lớn
+
+    - if_exists="replace": ghi vào bảng staging rồi đổi tên sang bảng chính trong một transaction,
+      bảng cũ vẫn đọc được cho tới lúc đổi tên
+    - if_exists="append": ghi thẳng vào bảng chính
+    - if_exists="fail": raise lỗi nếu bảng đã tồn tại, ngược lại xử lý như "replace"
+    Mỗi chunk được ghi trong một transaction riêng, khi lỗi chỉ thử lại từ chunk đang lỗi.
+    Với MSSQL (pyodbc) dùng fast_executemany, các database khác dùng INSERT nhiều dòng (method="multi").
+    Có thể chạy thử với engine SQLite cục bộ, vd: create_engine("sqlite:///test.db").
+
+    Parameters:
+    - engine: SQLAlchemy engine
+    - df: pandas DataFrame cần lưu
+    - table_name: tên bảng trong database
+    - if_exists: hành động khi bảng đã tồn tại ('replace', 'append', 'fail')
+    - index: có lưu index hay không
+    - chunk_size: số dòng mỗi chunk
+    - dtype: dict {cột: kiểu SQLAlchemy}, mặc định suy ra từ dtype của DataFrame
+    - max_retries: số lần thử lại tối đa cho mỗi chunk
+    - retry_delay: thời gian chờ giữa các lần thử (giây)
+
+    Returns:
+    - dict thống kê (rows, chunks, seconds, rows_per_second)
+    """
+    engine = _resolve_connection(engine)
+    if if_exists not in ("replace", "append", "fail"):
+        raise ValueError(f"if_exists không hợp lệ: '{if_exists}'")
+    if if_exists == "fail" and inspect(engine).has_table(table_name):
+        raise ValueError(f"Bảng '{table_name}' đã tồn tại.")
+
+    start_time = time.perf_counter()
+    if dtype is None:
+        dtype = _infer_sql_types(df)
+
+    is_mssql_pyodbc = engine.dialect.name == "mssql" and engine.dialect.driver == "pyodbc"
+    if is_mssql_pyodbc:
+        _enable_fast_executemany(engine)
+        method = None  # executemany + fast_executemany nhanh hơn INSERT nhiều dòng trên MSSQL
+        rows_per_statement = chunk_size
+    else:
+        method = "multi"
+        # Giới hạn số tham số trong một câu lệnh (SQLite mặc định 999 ở các bản cũ)
+        n_columns = len(df.columns) + (df.index.nlevels if index else 0)
+        rows_per_statement = max(1, 999 // max(n_columns, 1))
+
+    use_staging = if_exists != "append"
+    target_table = f"{table_name}__staging" if use_staging else table_name
+
+    n_chunks = math.ceil(len(df) / chunk_size) if len(df) else 1
+    for chunk_index in range(n_chunks):
+        chunk_df = df.iloc[chunk_index * chunk_size : (chunk_index + 1) * chunk_size]
+        # Chunk đầu tiên của bảng staging tạo lại bảng với kiểu cột cố định, các chunk sau append
+        chunk_if_exists = "replace" if use_staging and chunk_index == 0 else "append"
+
+        last_exception = None
+        for attempt in range(max_retries):
+            try:
+                with engine.begin() as connection:
+                    chunk_df.to_sql(
+                        target_table,
+                        connection,
+                        if_exists=chunk_if_exists,
+                        index=index,
+                        dtype=dtype,
+                        method=method,
+                        chunksize=rows_per_statement,
+                    )
+                last_exception = None
+                break
+            except Exception as e:
+                last_exception = e
+                print(f"Lỗi khi ghi chunk {chunk_index + 1}/{n_chunks} vào '{target_table}' (lần thử {attempt + 1}/{max_retries}). Lỗi: {e}")
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay)
+
+        if last_exception:
+            raise RuntimeError(
+                f"Không thể lưu dữ liệu vào bảng '{table_name}' tại chunk {chunk_index + 1}/{n_chunks}. Lỗi: {last_exception}"
+            ) from last_exception
+
+    if use_staging:
+        _swap_staging_table(engine, target_table, table_name)
+
+    elapsed = time.perf_counter() - start_time
+    return {"rows": len(df), "chunks": n_chunks, "seconds": elapsed, "rows_per_second": len(df) / elapsed if elapsed else None}
+
+
+def _infer_sql_types(df):
+    """Suy ra kiểu cột SQLAlchemy từ dtype của DataFrame để không phải suy lại mỗi lần replace."""
+    sql_types = {}
+    for column, series in df.items():
+        if pd.api.types.is_bool_dtype(series):
+            sql_types[column] = sa_types.Boolean()
+        elif pd.api.types.is_integer_dtype(series):
+            sql_types[column] = sa_types.BigInteger()
+        elif pd.api.types.is_float_dtype(series):
+            sql_types[column] = sa_types.Float(precision=53)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            sql_types[column] = sa_types.DateTime()
+        else:
+            max_length = series.dropna().astype(str).str.len().max() if series.notna().any() else 0
+            # Chuỗi ngắn dùng độ dài cố định để có thể đánh index, chuỗi dài dùng NVARCHAR(MAX)/TEXT
+            sql_types[column] = sa_types.Unicode(length=max(int(max_length) * 2, 50)) if max_length <= 2000 else sa_types.UnicodeText()
+    return sql_types
+
+
+def _enable_fast_executemany(engine):
+    """Bật fast_executemany của pyodbc cho các câu lệnh executemany của engine (chỉ đăng ký một lần)."""
+
+    def _set_fast_executemany(conn, cursor, statement, parameters, context, executemany):
+        if executemany:
+            cursor.fast_executemany = True
+
+    if not getattr(engine, "_fast_executemany_enabled", False):
+        event.listen(engine, "before_cursor_execute", _set_fast_executemany)
+        engine._fast_executemany_enabled = True
+
+
+def _swap_staging_table(engine, staging_table, table_name):
+    """Đổi tên bảng staging thành bảng chính và xóa bảng cũ trong cùng một transaction."""
+    quote = engine.dialect.identifier_preparer.quote
+    old_table = f"{table_name}__old"
+    has_table = inspect(engine).has_table(table_name)
+
+    with engine.begin() as connection:
+        if engine.dialect.name == "mssql":
+            connection.execute(text(f"DROP TABLE IF EXISTS {quote(old_table)}"))
+            if has_table:
+                connection.execute(text("EXEC sp_rename :old_name, :new_name"), {"old_name": table_name, "new_name": old_table})
+            connection.execute(text("EXEC sp_rename :old_name, :new_name"), {"old_name": staging_table, "new_name": table_name})
+        else:
+            connection.execute(text(f"DROP TABLE IF EXISTS {quote(old_table)}"))
+            if has_table:
+                connection.execute(text(f"ALTER TABLE {quote(table_name)} RENAME TO {quote(old_table)}"))
+            connection.execute(text(f"ALTER TABLE {quote(staging_table)} RENAME TO {quote(table_name)}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {quote(old_table)}"))
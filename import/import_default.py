@@ -1,5 +1,6 @@
 # === Cấu hình ban đầu ===
 import warnings
+import importlib
 from dotenv import load_dotenv
 
 # === Thư viện chuẩn của Python ===
@@ -11,31 +12,82 @@ import random
 from datetime import timedelta, datetime, timezone
 from typing import cast
 import math
+import json
+import threading
+import asyncio
+import atexit
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 # === Phân tích Dữ liệu (Data Analysis) ===
 import pandas as pd
 import numpy as np
-import pandas_ta as ta
+
+
+# === Import lười (lazy) cho các thư viện nặng hoặc chỉ có trên một số hệ điều hành ===
+class _LazyModule:
+    """
+    Đại diện cho một module (hoặc một thuộc tính của module), chỉ thực sự import ở lần truy cập đầu tiên.
+    Hỗ trợ truy cập thuộc tính, gọi hàm/khởi tạo class và isinstance như đối tượng thật.
+    """
+
+    def __init__(self, module_name, attribute=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+
+    def _load(self):
+        if self._target is None:
+            module = importlib.import_module(self._module_name)
+            self._target = getattr(module, self._attribute) if self._attribute else module
+        return self._target
+
+    def __getattr__(self, name):
+        target = self._load()
+        try:
+            return getattr(target, name)
+        except AttributeError:
+            # Cho phép truy cập submodule chưa được import, vd: win32com.client
+            if self._attribute is None:
+                return importlib.import_module(f"{self._module_name}.{name}")
+            raise
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __instancecheck__(self, instance):
+        return isinstance(instance, self._load())
+
+    def __subclasscheck__(self, subclass):
+        return issubclass(subclass, self._load())
+
+    def __repr__(self):
+        name = f"{self._module_name}.{self._attribute}" if self._attribute else self._module_name
+        return f"<lazy '{name}' ({'loaded' if self._target is not None else 'not loaded'})>"
+
+
+# pandas_ta chỉ đăng ký accessor DataFrame.ta sau khi được import (truy cập ta.<hàm> bất kỳ để kích hoạt)
+ta = _LazyModule("pandas_ta")
 
 # === Tiện ích khác (Utilities) ===
-import openpyxl
 import dateutil
-import os
-import requests
 import zipfile
 import io
 import re
 import hashlib
-import urllib3
 from urllib.parse import urlparse, quote
 import hmac
 from pathlib import Path
 import glob
-import win32com.client
+
+openpyxl = _LazyModule("openpyxl")
+requests = _LazyModule("requests")
+urllib3 = _LazyModule("urllib3")
+win32com = _LazyModule("win32com")  # Chỉ có trên Windows, import khi gọi win32com.client
 
 # Bỏ qua các cảnh báo không quan trọng để giữ cho output sạch sẽ
 warnings.filterwarnings("ignore")
 warnings.simplefilter('ignore', category=FutureWarning)
 
 # Tắt cảnh báo ChainedAssignmentWarning của Pandas
-pd.options.mode.chained_assignment = None
\ No newline at end of file
+pd.options.mode.chained_assignment = None
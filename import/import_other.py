@@ -1,14 +1,31 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
+from import_default import _LazyModule
+
+# Các thư viện trong file này đều được import lười (lazy), chỉ tải khi được dùng lần đầu
+
 # === Web Scraping & Parsing ===
-import requests
-import feedparser
-from bs4 import BeautifulSoup, Tag
+requests = _LazyModule("requests")
+feedparser = _LazyModule("feedparser")
+BeautifulSoup = _LazyModule("bs4", "BeautifulSoup")
+Tag = _LazyModule("bs4", "Tag")
 
 # === AI & Generative ===
-import google.generativeai as genai
+genai = _LazyModule("google.generativeai")
 
 # === Data Analysis & Visualization ===
-from fpdf import FPDF
-from fpdf.enums import XPos, YPos
-import plotly.express as px
-from plotly import graph_objects as go
-from plotly.subplots import make_subplots
\ No newline at end of file
+FPDF = _LazyModule("fpdf", "FPDF")
+XPos = _LazyModule("fpdf.enums", "XPos")
+YPos = _LazyModule("fpdf.enums", "YPos")
+px = _LazyModule("plotly.express")
+go = _LazyModule("plotly.graph_objects")
+make_subplots = _LazyModule("plotly.subplots", "make_subplots")
+MplFigure = _LazyModule("matplotlib.figure", "Figure")
+FigureCanvasAgg = _LazyModule("matplotlib.backends.backend_agg", "FigureCanvasAgg")
+PolyCollection = _LazyModule("matplotlib.collections", "PolyCollection")
+LineCollection = _LazyModule("matplotlib.collections", "LineCollection")
+mtransforms = _LazyModule("matplotlib.transforms")
+mpatches = _LazyModule("matplotlib.patches")
+font_manager = _LazyModule("matplotlib.font_manager")
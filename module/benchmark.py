@@ -0,0 +1,543 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
+
+from import_default import *
+from import_database import *
+from clean_data import *
+from ingest_data import *
+from peer_metrics import *
+from candle_chart import *
+from candle_chart import _build_financial_figure, _chart_components, _has_rsi, _rsi_band_shapes, _static_layout_updates, _render_chart_task, _open_warm_exporter
+
+
+# ==============================================================================
+# CÁC HÀM ĐO HIỆU NĂNG (BENCHMARK) CHO CÁC BƯỚC XỬ LÝ CHÍNH
+# ==============================================================================
+
+
+def _time_call(func, repeat=1):
+    """Chạy hàm repeat lần, trả về (kết quả lần cuối, thời gian tốt nhất tính bằng giây)."""
+    best_seconds = None
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start_time
+        best_seconds = elapsed if best_seconds is None else min(best_seconds, elapsed)
+    return result, best_seconds
+
+
+# ==============================================================================
+# 1. GHI DỮ LIỆU VÀO SQL
+# ==============================================================================
+
+
+def benchmark_save_to_mssql(engine, df, table_name, chunk_size=10_000):
+    """
+    So sánh tốc độ ghi giữa save_to_mssql (to_sql mặc định) và save_to_mssql_bulk trên cùng một engine
+
+    Parameters:
+    - engine: SQLAlchemy engine (vd: vsuccess_engine, hoặc create_engine("sqlite:///bench.db") để thử cục bộ)
+    - df: DataFrame dùng để ghi thử
+    - table_name: tên bảng dùng để ghi thử (sẽ bị ghi đè)
+    - chunk_size: số dòng mỗi chunk cho save_to_mssql_bulk
+
+    Returns:
+    - DataFrame gồm method, rows, seconds, rows_per_second
+    """
+    _, default_seconds = _time_call(lambda: save_to_mssql(engine, df, table_name))
+    _, bulk_seconds = _time_call(lambda: save_to_mssql_bulk(engine, df, table_name, chunk_size=chunk_size))
+
+    return pd.DataFrame(
+        [
+            {"method": "save_to_mssql", "rows": len(df), "seconds": default_seconds},
+            {"method": "save_to_mssql_bulk", "rows": len(df), "seconds": bulk_seconds},
+        ]
+    ).assign(rows_per_second=lambda x: x["rows"] / x["seconds"])
+
+
+# ==============================================================================
+# 2. THỜI GIAN IMPORT VÀ BỘ NHỚ KHI KHỞI ĐỘNG
+# ==============================================================================
+
+_IMPORT_PROBE = """
+import json, os, sys, time
+sys.path[:0] = [os.path.join({project_dir!r}, "import"), os.path.join({project_dir!r}, "module")]
+start_time = time.perf_counter()
+import {module_name}
+elapsed = time.perf_counter() - start_time
+try:
+    import resource
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux trả về KB
+except ImportError:
+    import psutil
+    rss_mb = psutil.Process().memory_info().peak_wset / 1024**2  # Windows
+print(json.dumps({{"seconds": elapsed, "rss_mb": rss_mb, "loaded_modules": len(sys.modules)}}))
+"""
+
+
+def benchmark_import_time(project_dir=None, modules=("import_default", "import_database", "import_other", "clean_data", "candle_chart"), repeat=3):
+    """
+    Đo thời gian import lần đầu (cold start) và RSS tối đa của từng module, mỗi lần đo chạy trong một process mới
+
+    Để so sánh trước/sau, chạy hàm này với project_dir trỏ tới hai bản checkout khác nhau của repo.
+
+    Parameters:
+    - project_dir: thư mục gốc của repo cần đo (mặc định là repo hiện tại)
+    - modules: danh sách module cần đo
+    - repeat: số lần đo cho mỗi module (lấy thời gian nhỏ nhất)
+
+    Returns:
+    - DataFrame gồm module, seconds, rss_mb, loaded_modules, error
+    """
+    import subprocess
+
+    if project_dir is None:
+        project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    rows = []
+    for module_name in modules:
+        code = _IMPORT_PROBE.format(project_dir=project_dir, module_name=module_name)
+        runs = []
+        error = None
+        for _ in range(repeat):
+            completed = subprocess.run(
+                [sys.executable, "-c", code], capture_output=True, text=True, cwd=os.path.join(project_dir, "notebook")
+            )
+            if completed.returncode != 0:
+                error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "unknown error"
+                break
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        if runs:
+            best_run = min(runs, key=lambda x: x["seconds"])
+            rows.append({"module": module_name, **best_run, "error": None})
+        else:
+            rows.append({"module": module_name, "seconds": None, "rss_mb": None, "loaded_modules": None, "error": error})
+    return pd.DataFrame(rows)
+
+
+# ==============================================================================
+# 3. CHUYỂN ĐỔI DỮ LIỆU FA SANG LONG FORMAT
+# ==============================================================================
+
+
+def _transform_to_long_format_rowwise(df):
+    """Phiên bản cũ của transform_to_long_format (parse tên cột trên từng dòng), chỉ dùng để so sánh."""
+    id_cols = df.columns[:4]
+    new_id_cols = {id_cols[0]: "ticker", id_cols[1]: "company_name", id_cols[2]: "exchange", id_cols[3]: "industry"}
+    df.rename(columns=new_id_cols, inplace=True)
+
+    id_vars = list(new_id_cols.values())
+    value_vars = df.columns[4:]
+    df_long = pd.melt(df, id_vars=id_vars, value_vars=value_vars, var_name="indicator_full", value_name="value")
+    df_long.dropna(subset=["value"], inplace=True)
+
+    def parse_indicator(indicator_full):
+        parts = indicator_full.strip().split("\n")
+        name = parts[0] if len(parts) > 0 else None
+        period_str = " ".join(parts[1:])
+        date_match = re.search(r"(\d{4}-\d{2}-\d{2})", period_str)
+        quarter_match = re.search(r"(Q\d-\d{4})", period_str)
+        if date_match:
+            period = pd.to_datetime(date_match.group(1))
+        elif quarter_match:
+            period = quarter_match.group(1)
+        else:
+            period = "N/A"
+        unit_str = parts[-1] if "Đơn vị:" in parts[-1] else None
+        unit = unit_str.replace("Đơn vị:", "").strip() if unit_str else None
+        return name, period, unit
+
+    parsed_cols = df_long["indicator_full"].apply(lambda x: pd.Series(parse_indicator(x), index=["name", "period", "unit"]))
+    df_long = pd.concat([df_long, parsed_cols], axis=1)
+    return df_long[["ticker", "industry", "name", "period", "unit", "value"]].copy()
+
+
+def benchmark_transform_to_long_format(file_paths=("../data/raw/raw_ptcb.xlsx", "../data/raw/raw_bctc.xlsx"), repeat=3):
+    """
+    So sánh transform_to_long_format hiện tại với phiên bản parse từng dòng và kiểm tra kết quả giống hệt nhau
+
+    Parameters:
+    - file_paths: các file export thô (đọc bằng read_excel(skiprows=7, skipfooter=11) như trong fa_data)
+    - repeat: số lần đo cho mỗi phiên bản (lấy thời gian nhỏ nhất)
+
+    Returns:
+    - DataFrame gồm file, rows, rowwise_seconds, vectorized_seconds, speedup
+    """
+    rows = []
+    for file_path in file_paths:
+        raw_df = pd.read_excel(file_path, skiprows=7, skipfooter=11)
+        old_df, old_seconds = _time_call(lambda: _transform_to_long_format_rowwise(raw_df.copy()), repeat)
+        new_df, new_seconds = _time_call(lambda: transform_to_long_format(raw_df.copy()), repeat)
+        pd.testing.assert_frame_equal(old_df, new_df)
+        rows.append(
+            {
+                "file": os.path.basename(file_path),
+                "rows": len(new_df),
+                "rowwise_seconds": old_seconds,
+                "vectorized_seconds": new_seconds,
+                "speedup": old_seconds / new_seconds if new_seconds else None,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+# ==============================================================================
+# 4. ĐỌC FILE EXPORT THÔ
+# ==============================================================================
+
+
+def benchmark_read_raw_exports(
+    path_dict={"ptcb": "../data/raw/raw_ptcb.xlsx", "bctc": "../data/raw/raw_bctc.xlsx", "current": "../data/raw/raw_current.xlsx"}
+):
+    """
+    So sánh thời gian đọc 3 file export giữa pd.read_excel tuần tự (cách hiện tại trong fa_data)
+    và read_raw_exports (song song, khi chưa có cache và khi đã có cache)
+
+    Returns:
+    - DataFrame gồm method, seconds
+    """
+    import tempfile
+
+    baseline_dict, baseline_seconds = _time_call(
+        lambda: {key: pd.read_excel(path, skiprows=RAW_EXPORT_SKIPROWS, skipfooter=RAW_EXPORT_SKIPFOOTER) for key, path in path_dict.items()}
+    )
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold_dict, cold_seconds = _time_call(lambda: read_raw_exports(path_dict, cache_dir=cache_dir))
+        warm_dict, warm_seconds = _time_call(lambda: read_raw_exports(path_dict, cache_dir=cache_dir))
+
+    for key in path_dict:
+        pd.testing.assert_frame_equal(baseline_dict[key], cold_dict[key])
+        pd.testing.assert_frame_equal(baseline_dict[key], warm_dict[key])
+
+    return pd.DataFrame(
+        [
+            {"method": "pd.read_excel (tuần tự)", "seconds": baseline_seconds},
+            {"method": f"read_raw_exports ({get_excel_engine()}, chưa có cache)", "seconds": cold_seconds},
+            {"method": "read_raw_exports (đã có cache)", "seconds": warm_seconds},
+        ]
+    )
+
+
+# ==============================================================================
+# 5. GIÁ TRỊ RÒNG KHỐI NGOẠI / TỰ DOANH
+# ==============================================================================
+
+
+def _net_flows_filter_groupby(temp_df, net_flows, unit):
+    """Cách tính cũ trong fa_data (lọc isin và groupby riêng cho từng phía), chỉ dùng để so sánh."""
+    ticker_info = temp_df[["ticker", "industry", "period", "unit"]].drop_duplicates(subset=["ticker"]).set_index("ticker")
+    net_dfs = []
+    for net_name, spec in net_flows.items():
+        net = (
+            temp_df[temp_df["name"].isin(spec["buy"])].groupby("ticker")["value"].sum()
+            - temp_df[temp_df["name"].isin(spec["sell"])].groupby("ticker")["value"].sum()
+        )
+        net_df = net.reset_index()
+        net_df["name"] = net_name
+        net_df["industry"] = net_df["ticker"].map(ticker_info["industry"])
+        net_df["period"] = net_df["ticker"].map(ticker_info["period"])
+        net_df["unit"] = unit
+        net_dfs.append(net_df)
+    return pd.concat(net_dfs, ignore_index=True)
+
+
+def benchmark_compute_net_flows(long_df, net_flows, unit="Triệu VND", scale=10, repeat=3):
+    """
+    So sánh compute_net_flows với cách lọc/groupby cũ trên bảng current đã nhân bản scale lần
+    (mỗi bản sao đổi tên mã) để mô phỏng dữ liệu lớn hơn, đồng thời kiểm tra kết quả giống nhau
+
+    Parameters:
+    - long_df: bảng long của bộ dữ liệu 'current' (kết quả transform_to_long_format)
+    - net_flows: cấu hình chỉ tiêu ròng như trong dataset_configs['current']['net_flows']
+    - unit: đơn vị của các dòng ròng
+    - scale: số lần nhân bản dữ liệu
+    - repeat: số lần đo (lấy thời gian nhỏ nhất)
+
+    Returns:
+    - DataFrame gồm rows, filter_groupby_seconds, matrix_seconds, speedup
+    """
+    scaled_df = pd.concat([long_df.assign(ticker=long_df["ticker"] + f"_{i}") for i in range(scale)], ignore_index=True)
+
+    old_df, old_seconds = _time_call(lambda: _net_flows_filter_groupby(scaled_df, net_flows, unit), repeat)
+    new_df, new_seconds = _time_call(lambda: compute_net_flows(scaled_df, net_flows, unit), repeat)
+    pd.testing.assert_frame_equal(old_df, new_df)
+
+    return pd.DataFrame(
+        [
+            {
+                "rows": len(scaled_df),
+                "filter_groupby_seconds": old_seconds,
+                "matrix_seconds": new_seconds,
+                "speedup": old_seconds / new_seconds if new_seconds else None,
+            }
+        ]
+    )
+
+
+# ==============================================================================
+# 6. THỐNG KÊ SO SÁNH TRONG NGÀNH
+# ==============================================================================
+
+
+def _peer_metrics_groupby(long_df):
+    """Cách tính bằng groupby/transform của pandas, chỉ dùng để so sánh với compute_peer_metrics."""
+    temp_df = long_df.dropna(subset=["industry", "value"]).copy()
+    grouped = temp_df.groupby(["industry", "name", "period"])["value"]
+    temp_df["peer_count"] = grouped.transform("count")
+    temp_df["rank"] = grouped.rank(ascending=False, method="min").astype(int)
+    temp_df["industry_mean"] = grouped.transform("mean")
+    temp_df["industry_median"] = grouped.transform("median")
+    temp_df["industry_std"] = grouped.transform("std")
+    temp_df["zscore"] = (temp_df["value"] - temp_df["industry_mean"]) / temp_df["industry_std"]
+    return temp_df
+
+
+def benchmark_peer_metrics(long_df, scale=5, repeat=3):
+    """
+    So sánh compute_peer_metrics với groupby/transform trên bảng long đã nhân bản scale lần (mỗi bản sao đổi tên mã)
+
+    Parameters:
+    - long_df: bảng long (vd: pd.concat các bảng clean_ptcb/clean_bctc/clean_current)
+    - scale: số lần nhân bản dữ liệu
+    - repeat: số lần đo (lấy thời gian nhỏ nhất)
+
+    Returns:
+    - DataFrame gồm rows, groupby_seconds, matrix_seconds, speedup
+    """
+    scaled_df = pd.concat([long_df.assign(ticker=long_df["ticker"].astype(str) + f"_{i}") for i in range(scale)], ignore_index=True)
+
+    old_df, old_seconds = _time_call(lambda: _peer_metrics_groupby(scaled_df), repeat)
+    new_df, new_seconds = _time_call(lambda: compute_peer_metrics(scaled_df), repeat)
+
+    # Kiểm tra kết quả giống nhau sau khi ghép theo khóa
+    merged_df = new_df.merge(old_df, on=["ticker", "industry", "name", "period"], suffixes=("", "_groupby"))
+    for column in ["rank", "industry_mean", "industry_median", "industry_std", "zscore"]:
+        assert np.allclose(merged_df[column], merged_df[f"{column}_groupby"], equal_nan=True), column
+
+    return pd.DataFrame(
+        [
+            {
+                "rows": len(scaled_df),
+                "groupby_seconds": old_seconds,
+                "matrix_seconds": new_seconds,
+                "speedup": old_seconds / new_seconds if new_seconds else None,
+            }
+        ]
+    )
+
+
+# ==============================================================================
+# 7. DỰNG FIGURE BIỂU ĐỒ NẾN
+# ==============================================================================
+
+
+def _build_figure_per_element(df, width, height, line_name_dict, line_columns, chart_config, symbol_name, time_frame):
+    """
+    Lắp figure từ cùng các thành phần như _build_financial_figure nhưng theo từng phần tử:
+    make_subplots rồi add_trace/add_shape/add_annotation và update_layout từng phần.
+    """
+    chart_config["symbol_name"] = symbol_name
+    chart_config["time_frame"] = time_frame
+
+    components = _chart_components(df, line_name_dict, line_columns, chart_config, symbol_name)
+
+    fig = make_subplots(**SUBPLOT_SPEC)
+    fig.update_layout(_static_layout_updates(chart_config, width, height))
+    if _has_rsi(df):
+        for shape in _rsi_band_shapes(chart_config):
+            fig.add_shape(shape)
+    for trace in components["traces"]:
+        fig.add_trace(trace)
+    for shape in components["shapes"]:
+        fig.add_shape(shape)
+    for annotation in components["annotations"]:
+        fig.add_annotation(annotation)
+    fig.update_layout(components["layout_updates"])
+    return fig
+
+
+def benchmark_chart_figure(df_dict, line_name_dict, chart_config, width=1400, height=1200, repeat=3):
+    """
+    So sánh thời gian lắp figure cho mỗi mã giữa cách thêm từng thành phần (make_subplots + add_trace/add_annotation/
+    add_shape) và cách sao chép layout template rồi tạo Figure một lần, đồng thời kiểm tra hai figure giống nhau
+
+    Hai cách dùng chung các thành phần dạng dict (_chart_components) nên chỉ đo phần lắp figure,
+    không phải toàn bộ code vẽ cũ (các hàm _add_* gọi trực tiếp trên figure trước khi có template).
+
+    Parameters:
+    - df_dict: dict {symbol: DataFrame} dữ liệu vẽ biểu đồ (như full_stock_ta_dict trong ta_data)
+    - line_name_dict: dict tên hiển thị của các đường chỉ báo (cấu hình 14 đường trong ta_data)
+    - chart_config: cấu hình từ create_chart_config
+    - width, height: kích thước biểu đồ
+    - repeat: số lần đo (lấy thời gian nhỏ nhất)
+
+    Returns:
+    - DataFrame gồm symbol, per_element_seconds, template_seconds, speedup
+    """
+    line_columns = list(line_name_dict.keys())
+    records = []
+    for symbol, df in df_dict.items():
+        per_element_fig, per_element_seconds = _time_call(
+            lambda: _build_figure_per_element(df.copy(), width, height, line_name_dict, line_columns, dict(chart_config), symbol, "1D"), repeat
+        )
+        template_fig, template_seconds = _time_call(
+            lambda: _build_financial_figure(df.copy(), width, height, line_name_dict, line_columns, dict(chart_config), symbol, "1D"), repeat
+        )
+        assert json.loads(per_element_fig.to_json()) == json.loads(template_fig.to_json()), symbol
+
+        records.append(
+            {
+                "symbol": symbol,
+                "per_element_seconds": per_element_seconds,
+                "template_seconds": template_seconds,
+                "speedup": per_element_seconds / template_seconds if template_seconds else None,
+            }
+        )
+    return pd.DataFrame(records)
+
+
+# ==============================================================================
+# 8. BACKEND XUẤT ẢNH BIỂU ĐỒ: PLOTLY + KALEIDO SO VỚI MATPLOTLIB AGG
+# ==============================================================================
+
+
+_BACKEND_MEMORY_PROBE = """
+import json, os, sys
+sys.path[:0] = [os.path.join({project_dir!r}, "import"), os.path.join({project_dir!r}, "module")]
+import pandas as pd
+from candle_chart import _render_chart_task, _open_warm_exporter
+df_dict, chart_kwargs = pd.read_pickle({input_path!r})
+if chart_kwargs["backend"] == "plotly":
+    _open_warm_exporter()
+errors = [_render_chart_task(symbol, df, chart_kwargs, max_attempts=1)["error"] for symbol, df in df_dict.items()]
+worker_rss_mb = None
+browser_rss_mb = None
+if os.path.exists("/proc/self/status"):
+    # Linux: VmHWM là RSS tối đa của riêng process này (ru_maxrss còn giữ giá trị của process cha qua fork/exec)
+    def read_status_kb(pid, field):
+        with open(f"/proc/{{pid}}/status") as f:
+            return next((int(line.split()[1]) for line in f if line.startswith(field)), 0)
+    parent_of = {{}}
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            parent_of[int(pid)] = read_status_kb(pid, "PPid:")
+        except OSError:
+            pass
+    descendants, frontier = set(), {{os.getpid()}}
+    while frontier:
+        frontier = {{pid for pid, ppid in parent_of.items() if ppid in frontier}} - descendants
+        descendants |= frontier
+    worker_rss_mb = read_status_kb("self", "VmHWM:") / 1024
+    browser_rss_mb = 0.0
+    for pid in descendants:
+        try:
+            browser_rss_mb += read_status_kb(pid, "VmRSS:") / 1024
+        except OSError:
+            pass
+else:
+    try:
+        import psutil
+        process = psutil.Process()
+        worker_rss_mb = process.memory_info().peak_wset / 1024**2  # Windows
+        browser_rss_mb = sum(child.memory_info().rss for child in process.children(recursive=True)) / 1024**2
+    except ImportError:
+        pass
+print(json.dumps({{"worker_rss_mb": worker_rss_mb, "browser_rss_mb": browser_rss_mb, "error": next((e for e in errors if e), None)}}))
+"""
+
+
+def _measure_backend_memory(df_dict, chart_kwargs, project_dir):
+    """Vẽ + xuất ảnh cả df_dict bằng một backend trong process mới, trả về RSS của process vẽ và của trình duyệt."""
+    import subprocess
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = os.path.join(temp_dir, "input.pkl")
+        pd.to_pickle((df_dict, chart_kwargs), input_path)
+        code = _BACKEND_MEMORY_PROBE.format(project_dir=project_dir, input_path=input_path)
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=os.path.join(project_dir, "notebook"))
+
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "unknown error"
+        return {"worker_rss_mb": None, "browser_rss_mb": None, "error": error}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def benchmark_chart_backends(df_dict, line_name_dict, chart_config, width=1400, height=1200, backends=CHART_BACKENDS, repeat=3):
+    """
+    So sánh thời gian vẽ + xuất một ảnh PNG và bộ nhớ giữa các backend của create_financial_chart
+
+    Mỗi backend chạy đúng đường xuất ảnh hàng loạt (_render_chart_task, không dùng cache, Kaleido đã giữ ấm)
+    nên chi phí khởi động trình duyệt không bị tính vào từng ảnh.
+
+    Bộ nhớ đo một lần cho mỗi backend trong một process mới vẽ toàn bộ df_dict:
+    - worker_rss_mb: RSS tối đa của process vẽ (/proc trên Linux, psutil trên Windows)
+    - browser_rss_mb: tổng RSS hiện tại của các process con, tức trình duyệt headless của Kaleido đang giữ ấm
+      (0 với matplotlib); trên Windows cần psutil, không có thì để trống. Các process của trình duyệt dùng chung
+      một số trang nhớ nên tổng này có thể cao hơn bộ nhớ thực tế
+
+    Parameters:
+    - df_dict: dict {symbol: DataFrame} dữ liệu vẽ biểu đồ (như full_stock_ta_dict trong ta_data)
+    - line_name_dict: dict tên hiển thị của các đường chỉ báo
+    - chart_config: cấu hình từ create_chart_config
+    - width, height: kích thước biểu đồ
+    - backends: các backend cần so sánh
+    - repeat: số lần đo thời gian (lấy thời gian nhỏ nhất)
+
+    Returns:
+    - DataFrame gồm symbol, backend, build_seconds, export_seconds, total_seconds, image_kb, error,
+      worker_rss_mb, browser_rss_mb, memory_error
+    """
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    line_columns = list(line_name_dict.keys())
+    if "plotly" in backends:
+        _open_warm_exporter()
+
+    backend_kwargs = {
+        backend: {
+            "width": width,
+            "height": height,
+            "line_name_dict": line_name_dict,
+            "line_columns": line_columns,
+            "chart_config": chart_config,
+            "time_frame": "1D",
+            "path": None,
+            "image_name_template": "{symbol}_chart.png",
+            "use_cache": False,
+            "backend": backend,
+        }
+        for backend in backends
+    }
+
+    records = []
+    for symbol, df in df_dict.items():
+        for backend, chart_kwargs in backend_kwargs.items():
+            result = None
+            for _ in range(repeat):
+                run = _render_chart_task(symbol, df.copy(), chart_kwargs, max_attempts=1)
+                if run["error"] is not None:
+                    result = run
+                    break
+                if result is None or run["build_seconds"] + run["export_seconds"] < result["build_seconds"] + result["export_seconds"]:
+                    result = run
+
+            records.append(
+                {
+                    "symbol": symbol,
+                    "backend": backend,
+                    "build_seconds": result["build_seconds"],
+                    "export_seconds": result["export_seconds"] if result["error"] is None else None,
+                    "total_seconds": result["build_seconds"] + result["export_seconds"] if result["error"] is None else None,
+                    "image_kb": len(result["image_bytes"]) / 1024 if result["image_bytes"] is not None else None,
+                    "error": result["error"],
+                }
+            )
+
+    memory_df = pd.DataFrame(
+        [{"backend": backend, **_measure_backend_memory(df_dict, chart_kwargs, project_dir)} for backend, chart_kwargs in backend_kwargs.items()]
+    ).rename(columns={"error": "memory_error"})
+    return pd.DataFrame(records).merge(memory_df, on="backend", how="left")
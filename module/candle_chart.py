@@ -3,9 +3,8 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
 
-from import_default import *
-from import_database import *
-from import_other import *
+from import_default import copy, glob, io, json, hashlib, time, importlib, asyncio, atexit, pd, np, ProcessPoolExecutor, as_completed
+from import_other import go, make_subplots, MplFigure, FigureCanvasAgg, PolyCollection, LineCollection, mtransforms, mpatches, font_manager
 
 
 # ==============================================================================
@@ -41,56 +40,64 @@ def _get_style_for_column(col_name):
 
 
 # ==============================================================================
-# 2. CÁC HÀM VẼ CÁC THÀNH PHẦN CỦA BIỂU ĐỒ
+# 2. CÁC THÀNH PHẦN CỦA BIỂU ĐỒ (TRACE, SHAPE, ANNOTATION DẠNG DICT)
 # ==============================================================================
 
+# Tên trục của các subplot do make_subplots tạo ra (hàng 1 có trục y phụ cho volume, hàng 2 là RSI)
+PRICE_AXES = {"xaxis": "x", "yaxis": "y"}
+VOLUME_AXES = {"xaxis": "x", "yaxis": "y2"}
+RSI_AXES = {"xaxis": "x2", "yaxis": "y3"}
 
-def _add_candlestick_chart(fig, df, config):
-    """Thêm biểu đồ nến vào subplot chính."""
-    fig.add_trace(
-        go.Candlestick(
-            x=df["date"],
-            open=df["open"],
-            high=df["high"],
-            low=df["low"],
-            close=df["close"],
-            increasing_line_color=config["color_up"],
-            decreasing_line_color=config["color_down"],
-            increasing_fillcolor=config["color_up"],
-            decreasing_fillcolor=config["color_down"],
-            line=dict(width=1),
-            name="Giá",
-        ),
-        row=1,
-        col=1,
-        secondary_y=False,
-    )
+SUBPLOT_SPEC = {
+    "rows": 2,
+    "cols": 1,
+    "shared_xaxes": True,
+    "vertical_spacing": 0.03,
+    "row_heights": [0.8, 0.2],
+    "specs": [[{"secondary_y": True}], [{"secondary_y": False}]],
+}
 
 
-def _add_volume_chart(fig, df):
-    """Thêm biểu đồ khối lượng vào subplot chính."""
-    fig.add_trace(
-        go.Bar(x=df["date"], y=df["volume"], marker=dict(color=df["volume_color"], opacity=0.3), name="Volume"),
-        row=1,
-        col=1,
-        secondary_y=True,
-    )
+def _hline_shape(y, axes, line):
+    """Đường ngang chạy hết chiều rộng subplot (tương đương fig.add_hline)."""
+    return {"type": "line", "x0": 0, "x1": 1, "xref": f"{axes['xaxis']} domain", "y0": y, "y1": y, "yref": axes["yaxis"], "line": line}
+
+
+def _candlestick_trace(df, config):
+    """Biểu đồ nến của subplot chính."""
+    return {
+        "type": "candlestick",
+        "x": df["date"],
+        "open": df["open"],
+        "high": df["high"],
+        "low": df["low"],
+        "close": df["close"],
+        "increasing": {"line": {"color": config["color_up"]}, "fillcolor": config["color_up"]},
+        "decreasing": {"line": {"color": config["color_down"]}, "fillcolor": config["color_down"]},
+        "line": {"width": 1},
+        "name": "Giá",
+        **PRICE_AXES,
+    }
 
 
-def _add_technical_lines(fig, df, line_columns, line_name_dict):
-    """Thêm các đường chỉ báo kỹ thuật và trả về thông tin để tạo nhãn."""
+def _volume_trace(df):
+    """Biểu đồ khối lượng trên trục y phụ của subplot chính."""
+    return {"type": "bar", "x": df["date"], "y": df["volume"], "marker": {"color": df["volume_color"], "opacity": 0.3}, "name": "Volume", **VOLUME_AXES}
+
+
+def _technical_line_traces(df, line_columns, line_name_dict):
+    """Các đường chỉ báo kỹ thuật và thông tin để tạo nhãn."""
+    traces = []
     line_info = []
     for col in line_columns:
         if col in df.columns and not df[col].isnull().all():
             line_style_full = _get_style_for_column(col)
             line_shape_value = line_style_full.pop("line_shape", None)
 
-            trace_args = {"x": df["date"], "y": df[col], "mode": "lines", "line": line_style_full, "name": col}
-
             if line_shape_value:
-                trace_args["line_shape"] = line_shape_value
+                line_style_full["shape"] = line_shape_value
 
-            fig.add_trace(go.Scatter(**trace_args), row=1, col=1, secondary_y=False)
+            traces.append({"type": "scatter", "x": df["date"], "y": df[col], "mode": "lines", "line": line_style_full, "name": col, **PRICE_AXES})
 
             last_valid_idx = df[col].last_valid_index()
             if last_valid_idx is not None:
@@ -103,49 +110,44 @@ def _add_technical_lines(fig, df, line_columns, line_name_dict):
                         "color": _get_style_for_column(col).get("color", "black"),
                     }
                 )
-    return line_info
+    return traces, line_info
 
 
-def _add_rsi_chart(fig, df, config):
-    """Thêm biểu đồ RSI hoàn chỉnh."""
-    rsi_col = "RSI_14"
-    if rsi_col not in df.columns or df[rsi_col].isnull().all():
-        return
+def _has_rsi(df):
+    return "RSI_14" in df.columns and not df["RSI_14"].isnull().all()
 
-    fig.add_trace(
-        go.Scatter(x=df["date"], y=df[rsi_col], mode="lines", line=dict(color=config["color_rsi_line"], width=1.5), name="RSI"),
-        row=2,
-        col=1,
-    )
-    fig.add_hline(y=config["rsi_upper_bound"], line_dash="dash", line_color=config["color_rsi_bound_line"], line_width=1.5, row=2, col=1)
-    fig.add_hline(y=config["rsi_lower_bound"], line_dash="dash", line_color=config["color_rsi_bound_line"], line_width=1.5, row=2, col=1)
-    fig.add_hrect(
-        y0=config["rsi_lower_bound"],
-        y1=config["rsi_upper_bound"],
-        fillcolor=config["color_rsi_bound_fill"],
-        opacity=1,
-        layer="below",
-        line_width=0,
-        row=2,
-        col=1,
-    )
 
+def _rsi_band_shapes(config):
+    """Hai đường biên và vùng nền của RSI (chỉ phụ thuộc cấu hình nên nằm sẵn trong template)."""
+    bound_line = {"color": config["color_rsi_bound_line"], "dash": "dash", "width": 1.5}
+    return [
+        _hline_shape(config["rsi_upper_bound"], RSI_AXES, bound_line),
+        _hline_shape(config["rsi_lower_bound"], RSI_AXES, bound_line),
+        {
+            "type": "rect",
+            "x0": 0,
+            "x1": 1,
+            "xref": f"{RSI_AXES['xaxis']} domain",
+            "y0": config["rsi_lower_bound"],
+            "y1": config["rsi_upper_bound"],
+            "yref": RSI_AXES["yaxis"],
+            "fillcolor": config["color_rsi_bound_fill"],
+            "opacity": 1,
+            "layer": "below",
+            "line": {"width": 0},
+        },
+    ]
+
+
+def _layout_rsi_tags(df, config):
+    """
+    Tính vị trí các nhãn RSI (biên trên, biên dưới, giá trị hiện tại), đẩy nhãn biên ra xa nhãn hiện tại nếu quá gần.
+
+    Returns:
+    - danh sách dict gồm y, text, font_color, bgcolor, bordercolor
+    """
+    rsi_col = "RSI_14"
     last_rsi = df[rsi_col].iloc[-1]
-    fig.add_annotation(
-        x=0.013,
-        y=1,
-        xref="x domain",
-        yref="y domain",
-        text=f"RSI 14: <b style='color:{config['color_rsi_line']};'>{last_rsi:.2f}</b>",
-        showarrow=False,
-        xanchor="left",
-        yanchor="top",
-        font=dict(size=config["font_size_subplot_title"], family=config["font_family"], color="black"),
-        xshift=-13,
-        yshift=18,
-        row=2,
-        col=1,
-    )
 
     y_axis_range = df[rsi_col].max() - df[rsi_col].min()
     if y_axis_range == 0:
@@ -160,8 +162,7 @@ def _add_rsi_chart(fig, df, config):
     if abs(last_rsi - y_lower_pos) < min_spacing:
         y_lower_pos = last_rsi - min_spacing
 
-    tag_font = dict(size=config["font_size_tag"], family=config["font_family"])
-    annotations = [
+    return [
         {
             "y": y_upper_pos,
             "text": f"<b>RSI {config['rsi_upper_bound']:.2f}</b>",
@@ -185,24 +186,49 @@ def _add_rsi_chart(fig, df, config):
         },
     ]
 
-    for anno in annotations:
-        fig.add_annotation(
-            x=config["label_x_position"],
-            y=anno["y"],
-            xref="x domain",
-            yref="y",
-            text=anno["text"],
-            ax=-10,
-            ay=0,
-            xanchor="left",
-            yanchor="middle",
-            font={**tag_font, "color": anno["font_color"]},
-            bgcolor=anno["bgcolor"],
-            bordercolor=anno["bordercolor"],
-            borderwidth=1,
-            row=2,
-            col=1,
+
+def _rsi_components(df, config):
+    """Đường RSI, tiêu đề và các nhãn của subplot RSI (không gồm dải biên đã có trong template)."""
+    rsi_col = "RSI_14"
+    trace = {"type": "scatter", "x": df["date"], "y": df[rsi_col], "mode": "lines", "line": {"color": config["color_rsi_line"], "width": 1.5}, "name": "RSI", **RSI_AXES}
+
+    last_rsi = df[rsi_col].iloc[-1]
+    annotations = [
+        {
+            "x": 0.013,
+            "y": 1,
+            "xref": f"{RSI_AXES['xaxis']} domain",
+            "yref": f"{RSI_AXES['yaxis']} domain",
+            "text": f"RSI 14: <b style='color:{config['color_rsi_line']};'>{last_rsi:.2f}</b>",
+            "showarrow": False,
+            "xanchor": "left",
+            "yanchor": "top",
+            "font": {"size": config["font_size_subplot_title"], "family": config["font_family"], "color": "black"},
+            "xshift": -13,
+            "yshift": 18,
+        }
+    ]
+
+    tag_font = {"size": config["font_size_tag"], "family": config["font_family"]}
+    for anno in _layout_rsi_tags(df, config):
+        annotations.append(
+            {
+                "x": config["label_x_position"],
+                "y": anno["y"],
+                "xref": f"{RSI_AXES['xaxis']} domain",
+                "yref": RSI_AXES["yaxis"],
+                "text": anno["text"],
+                "ax": -10,
+                "ay": 0,
+                "xanchor": "left",
+                "yanchor": "middle",
+                "font": {**tag_font, "color": anno["font_color"]},
+                "bgcolor": anno["bgcolor"],
+                "bordercolor": anno["bordercolor"],
+                "borderwidth": 1,
+            }
         )
+    return trace, annotations
 
 
 # ==============================================================================
@@ -210,11 +236,14 @@ def _add_rsi_chart(fig, df, config):
 # ==============================================================================
 
 
-def _process_and_add_annotations(fig, df, line_info, symbol_name, config):
+def _layout_price_tags(df, line_info, symbol_name, config):
     """
-    Hàm tổng hợp xử lý và thêm tất cả các nhãn giá vào biểu đồ chính.
-    Logic mới: Gộp tất cả các tag, sắp xếp theo giá trị, sau đó đẩy tuần tự
+    Gom tag giá và các tag chỉ báo, sắp xếp theo giá trị giảm dần rồi đẩy tuần tự
     từ trên xuống để đảm bảo không chồng chéo và giữ đúng thứ tự.
+
+    Returns:
+    - sorted_tags: danh sách tag (name, value, color, is_price_tag) kèm y_pos đã tránh chồng chéo
+    - price_color: màu của giá đóng cửa
     """
     # --- 1. GOM TẤT CẢ CÁC TAG LẠI ---
     last_close = df["close"].iloc[-1]
@@ -222,23 +251,20 @@ def _process_and_add_annotations(fig, df, line_info, symbol_name, config):
     price_color = config["color_up"] if last_close >= last_open else config["color_down"]
 
     # Thêm tag giá vào danh sách chung, cùng với các tag chỉ báo
-    line_info.append(
+    tags = line_info + [
         {
             "name": f"{symbol_name}: {last_close:.2f}",
             "value": last_close,
             "is_price_tag": True,  # Đánh dấu để có style riêng
             "color": price_color,
         }
-    )
-
-    # Vẽ đường hline cho giá đóng cửa
-    fig.add_hline(y=last_close, line_color=price_color, line_width=1, line_dash="dash", row=1, col=1)
+    ]
 
     # --- 2. SẮP XẾP TẤT CẢ TAG THEO GIÁ TRỊ GIẢM DẦN ---
     # Đây là bước quan trọng nhất để đảm bảo thứ tự trực quan
-    sorted_tags = sorted(line_info, key=lambda x: x["value"], reverse=True)
+    sorted_tags = sorted(tags, key=lambda x: x["value"], reverse=True)
 
-    # --- 3. TÍNH TOÁN VỊ TRÍ Y AN TOÀN VÀ VẼ LÊN BIỂU ĐỒ ---
+    # --- 3. TÍNH TOÁN VỊ TRÍ Y AN TOÀN ---
     visible_y_range = df["high"].max() - df["low"].min()
     if visible_y_range == 0:
         visible_y_range = df["close"].iloc[0] * 0.1  # Tránh chia cho 0
@@ -249,45 +275,52 @@ def _process_and_add_annotations(fig, df, line_info, symbol_name, config):
     for tag_info in sorted_tags:
         y_pos = tag_info["value"]
 
-        # Nếu đây không phải tag đầu tiên, kiểm tra xung đột với tag ngay phía trên nó
-        if last_placed_y is not None:
-            # Nếu vị trí hiện tại quá gần vị trí đã đặt trước đó (tức là nằm trong vùng an toàn)
-            if y_pos > last_placed_y - min_spacing:
-                # Đẩy vị trí hiện tại xuống để tạo khoảng trống
-                y_pos = last_placed_y - min_spacing
+        # Nếu vị trí hiện tại quá gần tag ngay phía trên (nằm trong vùng an toàn) thì đẩy xuống để tạo khoảng trống
+        if last_placed_y is not None and y_pos > last_placed_y - min_spacing:
+            y_pos = last_placed_y - min_spacing
 
         # Cập nhật vị trí cuối cùng đã đặt cho lần lặp tiếp theo
         last_placed_y = y_pos
+        tag_info["y_pos"] = y_pos
+
+    return sorted_tags, price_color
 
-        # Chuẩn bị style và vẽ annotation
-        is_price_tag = tag_info.get("is_price_tag", False)
 
-        if is_price_tag:
+def _price_tag_components(df, line_info, symbol_name, config):
+    """Đường giá đóng cửa và các nhãn giá/chỉ báo của subplot chính."""
+    sorted_tags, price_color = _layout_price_tags(df, line_info, symbol_name, config)
+
+    # Đường hline cho giá đóng cửa
+    shapes = [_hline_shape(df["close"].iloc[-1], PRICE_AXES, {"color": price_color, "width": 1, "dash": "dash"})]
+
+    annotations = []
+    for tag_info in sorted_tags:
+        # Chuẩn bị style cho annotation
+        if tag_info.get("is_price_tag", False):
             font_config = dict(size=config["font_size_price_tag"], color="white", family=config["font_family"])
             bgcolor = tag_info["color"]
-            bordercolor = tag_info["color"]
         else:
             font_config = dict(size=config["font_size_tag"], color=tag_info["color"], family=config["font_family"])
             bgcolor = config["tag_bgcolor"]
-            bordercolor = tag_info["color"]
-
-        fig.add_annotation(
-            x=config["label_x_position"],
-            y=y_pos,
-            xref="x domain",
-            yref="y",
-            text=f"<b>{tag_info['name']}</b>",
-            font=font_config,
-            bgcolor=bgcolor,
-            bordercolor=bordercolor,
-            borderwidth=1,
-            xanchor="left",
-            yanchor="middle",
-            ax=-10,
-            ay=0,
-            row=1,
-            col=1,
+
+        annotations.append(
+            {
+                "x": config["label_x_position"],
+                "y": tag_info["y_pos"],
+                "xref": f"{PRICE_AXES['xaxis']} domain",
+                "yref": PRICE_AXES["yaxis"],
+                "text": f"<b>{tag_info['name']}</b>",
+                "font": font_config,
+                "bgcolor": bgcolor,
+                "bordercolor": tag_info["color"],
+                "borderwidth": 1,
+                "xanchor": "left",
+                "yanchor": "middle",
+                "ax": -10,
+                "ay": 0,
+            }
         )
+    return shapes, annotations
 
 
 # ==============================================================================
@@ -295,14 +328,42 @@ def _process_and_add_annotations(fig, df, line_info, symbol_name, config):
 # ==============================================================================
 
 
-def _configure_layout_and_axes(fig, df, max_volume, config, width, height):
-    """Cấu hình layout tổng thể, các trục X, Y và tiêu đề."""
+def _static_layout_updates(config, width, height):
+    """Phần layout chỉ phụ thuộc cấu hình và kích thước (kích thước, màu nền, font, style các trục)."""
+    tick_font = dict(size=config["font_size_axis"], color=config["tick_color"])
+    xaxis_style = {"showgrid": False, "type": "category", "tickmode": "array", "tickfont": tick_font}
+    return {
+        "height": height,
+        "width": width,
+        "xaxis": {**xaxis_style, "rangeslider": {"visible": False}},
+        "xaxis2": xaxis_style,
+        "showlegend": False,
+        "margin": config["margin"],
+        "plot_bgcolor": config["plot_bgcolor"],
+        "paper_bgcolor": config["paper_bgcolor"],
+        "hovermode": "x unified",
+        "font": dict(family=config["font_family"]),
+        "title": {
+            "y": 0.98,
+            "x": 0.047,
+            "xanchor": "left",
+            "yanchor": "top",
+            "font": dict(size=config["font_size_title"], family=config["font_family"], color="black"),
+        },
+        "yaxis": {"showgrid": True, "gridcolor": config["grid_color"], "tickfont": tick_font},
+        "yaxis2": {"showgrid": False, "showticklabels": False},
+        "yaxis3": {"showgrid": True, "gridcolor": config["grid_color"], "autorange": True, "fixedrange": False, "tickfont": tick_font},
+    }
+
+
+def _build_title_text(df, config):
+    """Tiêu đề gồm mã, khung thời gian và OHLC, thay đổi của phiên cuối."""
     last_day = df.iloc[-1]
     o, h, l, c = last_day.get("open", 0), last_day.get("high", 0), last_day.get("low", 0), last_day.get("close", 0)
     diff, pct_change = last_day.get("diff", 0), last_day.get("pct_change", 0)
     value_color = config["color_up"] if c >= o else config["color_down"]
     sign = "+" if diff >= 0 else ""
-    title_text = (
+    return (
         f"{config['symbol_name']} {config['time_frame']}   "
         f"<span style='color:black;'>O:</span><b style='color:{value_color};'>{o:.2f}</b> "
         f"<span style='color:black;'>H:</span><b style='color:{value_color};'>{h:.2f}</b> "
@@ -311,68 +372,27 @@ def _configure_layout_and_axes(fig, df, max_volume, config, width, height):
         f"<span style='color:{value_color}; font-weight:bold;'>{sign}{diff:.2f} ({sign}{pct_change:.2%})</span>"
     )
 
-    fig.update_layout(
-        height=height,
-        width=width,
-        xaxis_rangeslider_visible=False,
-        showlegend=False,
-        margin=config["margin"],
-        plot_bgcolor=config["plot_bgcolor"],
-        paper_bgcolor=config["paper_bgcolor"],
-        hovermode="x unified",
-        font=dict(family=config["font_family"]),
-        title={
-            "text": title_text,
-            "y": 0.98,
-            "x": 0.047,
-            "xanchor": "left",
-            "yanchor": "top",
-            "font": dict(size=config["font_size_title"], family=config["font_family"], color="black"),
-        },
-    )
-
-    tick_labels, tick_vals = _generate_xaxis_ticks(df)
-    fig.update_xaxes(
-        showgrid=False,
-        type="category",
-        tickmode="array",
-        tickvals=tick_vals,
-        ticktext=tick_labels,
-        tickfont=dict(size=config["font_size_axis"], color=config["tick_color"]),
-    )
-
-    fig.update_yaxes(
-        row=1,
-        col=1,
-        secondary_y=False,
-        showgrid=True,
-        gridcolor=config["grid_color"],
-        tickfont=dict(size=config["font_size_axis"], color=config["tick_color"]),
-    )
-
-    fig.update_yaxes(
-        row=1,
-        col=1,
-        secondary_y=True,
-        showgrid=False,
-        showticklabels=False,
-        range=[0, max_volume * config["volume_yaxis_range_multiplier"]],
-    )
 
-    fig.update_yaxes(
-        row=2,
-        col=1,
-        showgrid=True,
-        gridcolor=config["grid_color"],
-        autorange=True,
-        fixedrange=False,
-        tickfont=dict(size=config["font_size_axis"], color=config["tick_color"]),
-    )
+def _dynamic_layout_components(df, max_volume, config):
+    """
+    Phần layout phụ thuộc dữ liệu: tiêu đề, nhãn trục X, khoảng trục volume và các đường lưới dọc mỗi 10 nến.
 
-    for i in range(10, len(df), 10):
-        fig.add_shape(
-            type="line", x0=i, x1=i, y0=0, y1=1, xref="x", yref="paper", line=dict(color=config["grid_color"], width=1), layer="below"
-        )
+    Returns:
+    - layout_updates: dict cập nhật layout
+    - grid_shapes: danh sách shape đường lưới dọc
+    """
+    tick_labels, tick_vals = _generate_xaxis_ticks(df)
+    layout_updates = {
+        "title": {"text": _build_title_text(df, config)},
+        "xaxis": {"tickvals": tick_vals, "ticktext": tick_labels},
+        "xaxis2": {"tickvals": tick_vals, "ticktext": tick_labels},
+        "yaxis2": {"range": [0, max_volume * config["volume_yaxis_range_multiplier"]]},
+    }
+    grid_line = {"color": config["grid_color"], "width": 1}
+    grid_shapes = [
+        {"type": "line", "x0": i, "x1": i, "y0": 0, "y1": 1, "xref": "x", "yref": "paper", "line": grid_line, "layer": "below"} for i in range(10, len(df), 10)
+    ]
+    return layout_updates, grid_shapes
 
 
 def _generate_xaxis_ticks(df):
@@ -413,7 +433,445 @@ def _generate_xaxis_ticks(df):
 
 
 # ==============================================================================
-# 5. HÀM CHÍNH TỔNG HỢP (ORCHESTRATION FUNCTION)
+# 5. TEMPLATE FIGURE DÙNG CHUNG CHO MỌI MÃ
+# ==============================================================================
+
+# Cache layout template theo (cấu hình, kích thước, có RSI hay không)
+_CHART_TEMPLATE_CACHE = {}
+
+
+def _merge_layout(base, updates):
+    """Gộp đệ quy các dict cập nhật vào layout (giống fig.update_layout nhưng trên dict thuần)."""
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge_layout(base[key], value)
+        else:
+            base[key] = value
+    return base
+
+
+def get_chart_template(chart_config, width, height, has_rsi=True):
+    """
+    Layout dựng sẵn một lần cho mỗi cấu hình biểu đồ: lưới subplot, style trục, font, dải RSI
+
+    Parameters:
+    - chart_config: cấu hình từ create_chart_config (bỏ qua symbol_name/time_frame)
+    - width, height: kích thước ảnh
+    - has_rsi: có vẽ subplot RSI hay không
+
+    Returns:
+    - layout dạng dict (dùng chung, cần sao chép trước khi sửa)
+    """
+    static_config = {key: value for key, value in chart_config.items() if key not in ("symbol_name", "time_frame")}
+    cache_key = json.dumps([static_config, width, height, has_rsi], sort_keys=True, default=str)
+    template_layout = _CHART_TEMPLATE_CACHE.get(cache_key)
+    if template_layout is None:
+        fig = make_subplots(**SUBPLOT_SPEC)
+        fig.update_layout(_static_layout_updates(chart_config, width, height))
+        if has_rsi:
+            fig.update_layout(shapes=_rsi_band_shapes(chart_config))
+        template_layout = fig.layout.to_plotly_json()
+        # Template giao diện mặc định của Plotly được áp lại khi tạo Figure nên không cần sao chép mỗi lần
+        template_layout.pop("template", None)
+        _CHART_TEMPLATE_CACHE[cache_key] = template_layout
+    return template_layout
+
+
+def _chart_components(df, line_name_dict, line_columns, chart_config, symbol_name):
+    """Dựng toàn bộ phần phụ thuộc dữ liệu của biểu đồ dưới dạng dict: trace, shape, annotation, cập nhật layout."""
+    line_columns, max_volume = _prepare_chart_data(df, chart_config, line_columns)
+
+    traces = [_candlestick_trace(df, chart_config), _volume_trace(df)]
+    line_traces, line_info = _technical_line_traces(df, line_columns, line_name_dict)
+    traces.extend(line_traces)
+
+    annotations = []
+    if _has_rsi(df):
+        rsi_trace, rsi_annotations = _rsi_components(df, chart_config)
+        traces.append(rsi_trace)
+        annotations.extend(rsi_annotations)
+
+    shapes, price_annotations = _price_tag_components(df, line_info, symbol_name, chart_config)
+    annotations.extend(price_annotations)
+
+    layout_updates, grid_shapes = _dynamic_layout_components(df, max_volume, chart_config)
+    shapes.extend(grid_shapes)
+
+    return {"traces": traces, "shapes": shapes, "annotations": annotations, "layout_updates": layout_updates}
+
+
+# ==============================================================================
+# 6. CACHE ẢNH PNG THEO NỘI DUNG ĐẦU VÀO
+# ==============================================================================
+
+CHART_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache", "chart_png")
+CHART_CACHE_MAX_BYTES = 512 * 1024**2  # Dung lượng tối đa của thư mục cache, vượt quá sẽ xóa theo LRU
+CHART_RENDER_VERSION = 1  # Tăng khi thay đổi cách vẽ để các ảnh đã cache không còn được dùng
+
+chart_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_chart_cache_stats():
+    """Trả về số lần hit/miss/evict của cache ảnh biểu đồ trong phiên hiện tại."""
+    total = chart_cache_stats["hits"] + chart_cache_stats["misses"]
+    return {**chart_cache_stats, "hit_ratio": chart_cache_stats["hits"] / total if total else 0.0}
+
+
+def clear_chart_cache():
+    """Xóa toàn bộ ảnh trong thư mục cache biểu đồ."""
+    for file_path in glob.glob(os.path.join(CHART_CACHE_DIR, "*.png")):
+        os.remove(file_path)
+
+
+def _chart_cache_key(df, width, height, line_name_dict, line_columns, chart_config, symbol_name, time_frame, scale, backend="plotly"):
+    """Hash toàn bộ đầu vào quyết định nội dung ảnh: dữ liệu, các đường chỉ báo, cấu hình và kích thước."""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    static_config = {key: value for key, value in chart_config.items() if key not in ("symbol_name", "time_frame")}
+    payload = [
+        CHART_RENDER_VERSION,
+        [str(column) for column in df.columns],
+        [str(dtype) for dtype in df.dtypes],
+        list(line_columns),
+        line_name_dict,
+        static_config,
+        symbol_name,
+        time_frame,
+        width,
+        height,
+        scale,
+        backend,
+    ]
+    digest.update(json.dumps(payload, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _read_chart_cache(cache_key):
+    image_path = os.path.join(CHART_CACHE_DIR, f"{cache_key}.png")
+    if not os.path.exists(image_path):
+        chart_cache_stats["misses"] += 1
+        return None
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    os.utime(image_path)  # Cập nhật thời điểm truy cập cho LRU
+    chart_cache_stats["hits"] += 1
+    return image_bytes
+
+
+def _write_chart_cache(cache_key, image_bytes):
+    os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+    image_path = os.path.join(CHART_CACHE_DIR, f"{cache_key}.png")
+    temp_path = f"{image_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(image_bytes)
+    os.replace(temp_path, image_path)
+    _evict_chart_cache()
+
+
+def _evict_chart_cache():
+    """Xóa các ảnh ít được truy cập gần đây nhất cho tới khi thư mục cache nằm trong giới hạn dung lượng."""
+    entries = []
+    for image_path in glob.glob(os.path.join(CHART_CACHE_DIR, "*.png")):
+        try:
+            stat = os.stat(image_path)
+        except FileNotFoundError:  # Process khác vừa xóa
+            continue
+        entries.append((stat.st_mtime, stat.st_size, image_path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, image_path in sorted(entries):
+        if total_size <= CHART_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(image_path)
+            chart_cache_stats["evictions"] += 1
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+# ==============================================================================
+# 7. BACKEND MATPLOTLIB (AGG): VẼ ẢNH TRỰC TIẾP KHÔNG CẦN TRÌNH DUYỆT
+# ==============================================================================
+
+CHART_BACKENDS = ("plotly", "matplotlib")
+
+# Vị trí các subplot theo tỷ lệ vùng vẽ, lấy đúng như make_subplots(**SUBPLOT_SPEC) tạo ra
+# (cột cuối 6% chiều rộng dành cho trục y phụ của volume)
+MPL_X_DOMAIN = (0.0, 0.94)
+MPL_PRICE_Y_DOMAIN = (0.224, 1.0)
+MPL_RSI_Y_DOMAIN = (0.0, 0.194)
+
+# Ảnh Plotly có kích thước width × height "px" ở scale 1; với figure rộng width/100 inch thì 1 px = 0.72 point
+MPL_PX_TO_PT = 0.72
+MPL_CANDLE_WIDTH = 0.6  # Độ rộng thân nến so với khoảng cách giữa hai nến
+MPL_DASH_STYLES = {"solid": "-", "dash": (0, (4, 3)), "dot": (0, (1, 2))}
+
+_MPL_FONT_CACHE = {}
+
+
+def _check_chart_backend(backend):
+    if backend not in CHART_BACKENDS:
+        raise ValueError(f"backend phải là một trong {CHART_BACKENDS}, nhận được: {backend!r}")
+
+
+def _mpl_color(color):
+    """Đổi màu dạng CSS của cấu hình (hex, tên màu, 'rgba(r, g, b, a)') sang dạng matplotlib hiểu được."""
+    if isinstance(color, str) and color.replace(" ", "").startswith(("rgba(", "rgb(")):
+        parts = [float(part) for part in color[color.index("(") + 1 : color.rindex(")")].split(",")]
+        return (parts[0] / 255, parts[1] / 255, parts[2] / 255, parts[3] if len(parts) > 3 else 1.0)
+    return color
+
+
+def _mpl_font_family(font_family):
+    """Dùng font của cấu hình nếu máy có cài, ngược lại dùng font mặc định của matplotlib (tránh cảnh báo findfont mỗi ảnh)."""
+    if font_family not in _MPL_FONT_CACHE:
+        installed = {font.name for font in font_manager.fontManager.ttflist}
+        _MPL_FONT_CACHE[font_family] = font_family if font_family in installed else "DejaVu Sans"
+    return _MPL_FONT_CACHE[font_family]
+
+
+def _title_segments(df, config):
+    """Các đoạn chữ (nội dung, màu, in đậm) của tiêu đề, giống _build_title_text nhưng không dùng HTML."""
+    last_day = df.iloc[-1]
+    o, h, l, c = last_day.get("open", 0), last_day.get("high", 0), last_day.get("low", 0), last_day.get("close", 0)
+    diff, pct_change = last_day.get("diff", 0), last_day.get("pct_change", 0)
+    value_color = config["color_up"] if c >= o else config["color_down"]
+    sign = "+" if diff >= 0 else ""
+    segments = [(f"{config['symbol_name']} {config['time_frame']}   ", "black", False)]
+    for label, value in (("O:", o), ("H:", h), ("L:", l), ("C:", c)):
+        segments.append((label, "black", False))
+        segments.append((f"{value:.2f} ", value_color, True))
+    segments.append((f" {sign}{diff:.2f} ({sign}{pct_change:.2%})", value_color, True))
+    return segments
+
+
+def _draw_text_segments(ax, xy, xycoords, offset_px, segments, font):
+    """Vẽ nối tiếp các đoạn chữ khác màu trên cùng một dòng (mỗi đoạn neo vào cạnh phải của đoạn trước)."""
+    anchor, anchor_xy, offset = xycoords, xy, (offset_px[0] * MPL_PX_TO_PT, offset_px[1] * MPL_PX_TO_PT)
+    for content, color, bold in segments:
+        anchor = ax.annotate(
+            content,
+            xy=anchor_xy,
+            xycoords=anchor,
+            xytext=offset,
+            textcoords="offset points",
+            ha="left",
+            va="top",
+            color=_mpl_color(color),
+            fontweight="bold" if bold else "normal",
+            annotation_clip=False,
+            **font,
+        )
+        anchor_xy, offset = (1, 1), (0, 0)
+
+
+def _draw_tag(ax, y, text, font_size, font_color, bgcolor, bordercolor, config, font):
+    """Nhãn có khung ở mép phải subplot, đặt như annotation Plotly (x = label_x_position, lùi 10px, căn giữa theo y)."""
+    ax.annotate(
+        text,
+        xy=(config["label_x_position"], y),
+        xycoords=mtransforms.blended_transform_factory(ax.transAxes, ax.transData),
+        xytext=(-10 * MPL_PX_TO_PT, 0),
+        textcoords="offset points",
+        ha="left",
+        va="center",
+        fontsize=font_size * MPL_PX_TO_PT,
+        fontweight="bold",
+        color=_mpl_color(font_color),
+        bbox={"boxstyle": "square,pad=0.15", "facecolor": _mpl_color(bgcolor), "edgecolor": _mpl_color(bordercolor), "linewidth": MPL_PX_TO_PT},
+        annotation_clip=False,
+        **font,
+    )
+
+
+def _draw_candles(ax_price, ax_volume, df, config):
+    """Nến và khối lượng vẽ bằng một PolyCollection/LineCollection cho mỗi loại thay vì một artist cho mỗi nến."""
+    x = np.arange(len(df), dtype=np.float64)
+    open_, high, low, close = (df[col].to_numpy(dtype=np.float64) for col in ("open", "high", "low", "close"))
+    volume = df["volume"].to_numpy(dtype=np.float64)
+    colors = np.where(close >= open_, config["color_up"], config["color_down"])
+    left, right = x - MPL_CANDLE_WIDTH / 2, x + MPL_CANDLE_WIDTH / 2
+
+    body_low, body_high = np.minimum(open_, close), np.maximum(open_, close)
+    bodies = np.stack([np.c_[left, body_low], np.c_[left, body_high], np.c_[right, body_high], np.c_[right, body_low]], axis=1)
+    wicks = np.stack([np.c_[x, low], np.c_[x, high]], axis=1)
+    bars = np.stack([np.c_[left, np.zeros_like(volume)], np.c_[left, volume], np.c_[right, volume], np.c_[right, np.zeros_like(volume)]], axis=1)
+
+    ax_volume.add_collection(PolyCollection(bars, facecolors=colors, edgecolors="none", alpha=0.3))
+    ax_price.add_collection(LineCollection(wicks, colors=colors, linewidths=MPL_PX_TO_PT, zorder=2))
+    # Viền cùng màu để nến có open == close vẫn hiện thành một vạch ngang
+    ax_price.add_collection(PolyCollection(bodies, facecolors=colors, edgecolors=colors, linewidths=MPL_PX_TO_PT, zorder=3))
+    ax_price.update_datalim(np.r_[np.c_[x, low], np.c_[x, high]])
+
+
+def _draw_line_traces(ax, line_traces):
+    """Các đường chỉ báo kỹ thuật từ trace dạng dict của _technical_line_traces (dùng chung style với Plotly)."""
+    x = None
+    for trace in line_traces:
+        line = trace["line"]
+        y = np.asarray(trace["y"], dtype=np.float64)
+        if x is None:
+            x = np.arange(len(y))
+        ax.plot(
+            x,
+            y,
+            color=_mpl_color(line.get("color", "black")),
+            linewidth=line.get("width", 1.2) * MPL_PX_TO_PT,
+            linestyle=MPL_DASH_STYLES.get(line.get("dash", "solid"), "-"),
+            drawstyle="steps-post" if line.get("shape") == "hv" else "default",
+            zorder=4,
+        )
+
+
+def _style_mpl_axis(ax, config, font, show_xticks):
+    ax.set_facecolor("none")
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    pad = config["margin"].get("pad", 0) * MPL_PX_TO_PT
+    ax.tick_params(axis="both", length=0, pad=pad, labelsize=config["font_size_axis"] * MPL_PX_TO_PT, labelcolor=_mpl_color(config["tick_color"]))
+    ax.tick_params(axis="x", labelbottom=show_xticks)
+    for label in ax.get_xticklabels() + ax.get_yticklabels():
+        label.set_family(font["family"])
+    ax.yaxis.grid(True, color=_mpl_color(config["grid_color"]), linewidth=MPL_PX_TO_PT)
+    ax.set_axisbelow(True)
+
+
+def _place_mpl_axes(fig, axes_domains, config, width, height, renderer):
+    """
+    Đặt các subplot vào vùng vẽ giống Plotly: vùng vẽ = ảnh trừ margin, nới thêm phần chữ của nhãn trục
+    (tương đương automargin của Plotly), rồi chia theo domain của từng subplot.
+
+    Returns:
+    - (left, bottom, plot_width, plot_height) của vùng vẽ theo tỷ lệ figure
+    """
+    margin = config["margin"]
+    left, right = margin.get("l", 0) / width, 1 - margin.get("r", 0) / width
+    bottom, top = margin.get("b", 0) / height, 1 - margin.get("t", 0) / height
+
+    to_figure = fig.transFigure.inverted()
+    label_width, label_height = 0.0, 0.0
+    for ax, _, _ in axes_domains:
+        for label in ax.get_yticklabels():
+            if label.get_visible() and label.get_text():
+                extent = label.get_window_extent(renderer).transformed(to_figure)
+                label_width = max(label_width, extent.width)
+        for label in ax.get_xticklabels():
+            if label.get_visible() and label.get_text():
+                extent = label.get_window_extent(renderer).transformed(to_figure)
+                label_height = max(label_height, extent.height)
+    pad = margin.get("pad", 0)
+    left += label_width + pad / width
+    bottom += label_height + pad / height
+
+    plot_width, plot_height = right - left, top - bottom
+    for ax, x_domain, y_domain in axes_domains:
+        ax.set_position(
+            [left + x_domain[0] * plot_width, bottom + y_domain[0] * plot_height, (x_domain[1] - x_domain[0]) * plot_width, (y_domain[1] - y_domain[0]) * plot_height]
+        )
+    return left, bottom, plot_width, plot_height
+
+
+def _build_matplotlib_figure(df, width, height, line_name_dict, line_columns, chart_config, symbol_name, time_frame, scale=2):
+    """
+    Dựng biểu đồ nến + khối lượng + RSI + các nhãn bằng matplotlib (Figure thuần, không dùng pyplot nên không giữ
+    trạng thái toàn cục). Dùng chung cấu hình, logic tránh chồng nhãn và nhãn trục X với bản Plotly.
+
+    Parameters:
+    - như create_financial_chart, scale: hệ số phóng ảnh (2 = ảnh 2 lần width × height như bản Plotly)
+
+    Returns:
+    - matplotlib Figure đã gắn canvas Agg
+    """
+    chart_config["symbol_name"] = symbol_name
+    chart_config["time_frame"] = time_frame
+    line_columns, max_volume = _prepare_chart_data(df, chart_config, line_columns)
+    line_traces, line_info = _technical_line_traces(df, line_columns, line_name_dict)
+    has_rsi = _has_rsi(df)
+    font = {"family": _mpl_font_family(chart_config["font_family"])}
+
+    fig = MplFigure(figsize=(width / 100, height / 100), dpi=100 * scale, facecolor=_mpl_color(chart_config["paper_bgcolor"]))
+    FigureCanvasAgg(fig)
+    renderer = fig.canvas.get_renderer()
+
+    # --- 1. Các subplot: volume nằm dưới nến trên cùng vị trí, RSI dùng chung trục X ---
+    ax_volume = fig.add_axes([0, 0, 1, 1], zorder=0)
+    ax_price = fig.add_axes([0, 0, 1, 1], sharex=ax_volume, zorder=1)
+    ax_rsi = fig.add_axes([0, 0, 1, 1], sharex=ax_volume, zorder=1)
+    ax_volume.set_axis_off()
+
+    # --- 2. Dữ liệu ---
+    _draw_candles(ax_price, ax_volume, df, chart_config)
+    _draw_line_traces(ax_price, line_traces)
+    ax_price.autoscale_view()
+    ax_volume.set_ylim(0, max_volume * chart_config["volume_yaxis_range_multiplier"])
+
+    if has_rsi:
+        rsi = df["RSI_14"].to_numpy(dtype=np.float64)
+        bound_line = {"color": _mpl_color(chart_config["color_rsi_bound_line"]), "linestyle": MPL_DASH_STYLES["dash"], "linewidth": 1.5 * MPL_PX_TO_PT}
+        ax_rsi.axhspan(chart_config["rsi_lower_bound"], chart_config["rsi_upper_bound"], facecolor=_mpl_color(chart_config["color_rsi_bound_fill"]), linewidth=0, zorder=0)
+        ax_rsi.axhline(chart_config["rsi_upper_bound"], **bound_line)
+        ax_rsi.axhline(chart_config["rsi_lower_bound"], **bound_line)
+        ax_rsi.plot(np.arange(len(rsi)), rsi, color=_mpl_color(chart_config["color_rsi_line"]), linewidth=1.5 * MPL_PX_TO_PT, zorder=4)
+    ax_volume.set_xlim(-0.5, len(df) - 0.5)  # Trục category: mỗi nến một vị trí nguyên
+
+    # --- 3. Trục: nhãn X giống _generate_xaxis_ticks (chỉ giữ các vị trí có chữ), lưới ngang, font ---
+    tick_labels, tick_vals = _generate_xaxis_ticks(df)
+    labeled = [(val, label) for val, label in zip(tick_vals, tick_labels) if label]
+    ax_rsi.set_xticks([val for val, _ in labeled], [label for _, label in labeled])
+    _style_mpl_axis(ax_price, chart_config, font, show_xticks=False)
+    _style_mpl_axis(ax_rsi, chart_config, font, show_xticks=True)
+    if not has_rsi:
+        ax_rsi.set_yticks([])
+        ax_rsi.yaxis.grid(False)
+
+    left, bottom, plot_width, plot_height = _place_mpl_axes(
+        fig, [(ax_volume, MPL_X_DOMAIN, MPL_PRICE_Y_DOMAIN), (ax_price, MPL_X_DOMAIN, MPL_PRICE_Y_DOMAIN), (ax_rsi, MPL_X_DOMAIN, MPL_RSI_Y_DOMAIN)],
+        chart_config,
+        width,
+        height,
+        renderer,
+    )
+
+    # --- 4. Nền vùng vẽ và lưới dọc mỗi 10 nến (chạy suốt chiều cao vùng vẽ như shape yref="paper" của Plotly) ---
+    plot_bg = _mpl_color(chart_config["plot_bgcolor"])
+    for ax in (ax_price, ax_rsi):
+        position = ax.get_position()
+        fig.add_artist(mpatches.Rectangle((position.x0, position.y0), position.width, position.height, transform=fig.transFigure, facecolor=plot_bg, linewidth=0, zorder=-1))
+    grid_transform = mtransforms.blended_transform_factory(ax_price.transData, fig.transFigure)
+    grid_segments = [[(i, bottom), (i, bottom + plot_height)] for i in range(10, len(df), 10)]
+    fig.add_artist(LineCollection(grid_segments, colors=[_mpl_color(chart_config["grid_color"])], linewidths=MPL_PX_TO_PT, transform=grid_transform, zorder=-0.5))
+
+    # --- 5. Nhãn giá/chỉ báo bên phải (cùng logic đẩy tránh chồng chéo với Plotly) ---
+    sorted_tags, price_color = _layout_price_tags(df, line_info, symbol_name, chart_config)
+    ax_price.axhline(df["close"].iloc[-1], color=_mpl_color(price_color), linewidth=MPL_PX_TO_PT, linestyle=MPL_DASH_STYLES["dash"], zorder=4)
+    for tag_info in sorted_tags:
+        if tag_info.get("is_price_tag", False):
+            _draw_tag(ax_price, tag_info["y_pos"], tag_info["name"], chart_config["font_size_price_tag"], "white", tag_info["color"], tag_info["color"], chart_config, font)
+        else:
+            _draw_tag(ax_price, tag_info["y_pos"], tag_info["name"], chart_config["font_size_tag"], tag_info["color"], chart_config["tag_bgcolor"], tag_info["color"], chart_config, font)
+
+    if has_rsi:
+        for anno in _layout_rsi_tags(df, chart_config):
+            _draw_tag(ax_rsi, anno["y"], anno["text"].replace("<b>", "").replace("</b>", ""), chart_config["font_size_tag"], anno["font_color"], anno["bgcolor"], anno["bordercolor"], chart_config, font)
+        rsi_title = [("RSI 14: ", "black", False), (f"{df['RSI_14'].iloc[-1]:.2f}", chart_config["color_rsi_line"], True)]
+        _draw_text_segments(ax_rsi, (0.013, 1), "axes fraction", (-13, 18), rsi_title, {**font, "fontsize": chart_config["font_size_subplot_title"] * MPL_PX_TO_PT})
+
+    # --- 6. Tiêu đề (vị trí theo tỷ lệ cả ảnh như title của Plotly) ---
+    _draw_text_segments(ax_price, (0.047, 0.98), "figure fraction", (0, 0), _title_segments(df, chart_config), {**font, "fontsize": chart_config["font_size_title"] * MPL_PX_TO_PT})
+
+    return fig
+
+
+def _matplotlib_to_image(fig, scale=2):
+    """Xuất figure matplotlib ra bytes PNG bằng Agg (kích thước ảnh = width × height × scale như bản Plotly)."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100 * scale, facecolor=fig.get_facecolor())
+    return buffer.getvalue()
+
+
+# ==============================================================================
+# 8. HÀM CHÍNH TỔNG HỢP (ORCHESTRATION FUNCTION)
 # ==============================================================================
 def create_chart_config(title_font_size, axis_font_size, tag_font_size, price_tag_font_size, min_spacing_ratio, margin):
     return {
@@ -460,51 +918,261 @@ def create_financial_chart(
     image_name: str,
     symbol_name: str,
     time_frame: str = "1D",
+    use_cache: bool = True,
+    backend: str = "plotly",
 ):
     """
     Hàm chính để tạo biểu đồ tài chính hoàn chỉnh.
+    Nếu use_cache và đầu vào (dữ liệu, đường chỉ báo, cấu hình, kích thước) trùng với một lần vẽ trước,
+    ảnh được lấy từ cache thay vì xuất lại (figure vẫn được dựng để trả về).
+    backend: "plotly" (xuất ảnh qua Kaleido) hoặc "matplotlib" (vẽ trực tiếp bằng Agg, không cần trình duyệt);
+    với "matplotlib" figure trả về là matplotlib Figure.
     """
+    _check_chart_backend(backend)
     if df.empty:
         print("DataFrame is empty. Cannot create chart.")
-        return go.Figure()
+        return go.Figure() if backend == "plotly" else MplFigure()
 
-    chart_config["symbol_name"] = symbol_name
-    chart_config["time_frame"] = time_frame
+    # Hash đầu vào trước khi dựng figure (_prepare_chart_data thêm cột vào df)
+    cache_key = _chart_cache_key(df, width, height, line_name_dict, line_columns, chart_config, symbol_name, time_frame, scale=2, backend=backend) if use_cache else None
 
-    line_columns, max_volume = _prepare_chart_data(df, chart_config, line_columns)
+    if backend == "matplotlib":
+        fig = _build_matplotlib_figure(df, width, height, line_name_dict, line_columns, chart_config, symbol_name, time_frame, scale=2)
+    else:
+        fig = _build_financial_figure(df, width, height, line_name_dict, line_columns, chart_config, symbol_name, time_frame)
 
-    fig = make_subplots(
-        rows=2,
-        cols=1,
-        shared_xaxes=True,
-        vertical_spacing=0.03,
-        row_heights=[0.8, 0.2],
-        specs=[[{"secondary_y": True}], [{"secondary_y": False}]],
-    )
+    # Chuyển đổi fig thành dạng bytes để có thể upload hoặc dùng sau này
+    image_bytes = _read_chart_cache(cache_key) if cache_key else None
+    if image_bytes is None:
+        if backend == "matplotlib":
+            image_bytes = _matplotlib_to_image(fig, scale=2)
+        else:
+            image_bytes = fig.to_image(format="png", width=width, height=height, scale=2)
+        if cache_key:
+            _write_chart_cache(cache_key, image_bytes)
 
-    # Các hàm vẽ thành phần
-    _add_candlestick_chart(fig, df, chart_config)
-    _add_volume_chart(fig, df)
-    line_info = _add_technical_lines(fig, df, line_columns, line_name_dict)
-    _add_rsi_chart(fig, df, chart_config)
+    # Lưu file nếu có đường dẫn
+    _save_chart_image(image_bytes, path, image_name)
 
-    # Xử lý và vẽ annotations với logic mới
-    _process_and_add_annotations(fig, df, line_info, symbol_name, chart_config)
+    # Trả về 2 giá trị như code gốc của bạn mong đợi
+    return fig, image_bytes
 
-    # Cấu hình layout cuối cùng
-    _configure_layout_and_axes(fig, df, max_volume, chart_config, width, height)
 
-    # Chuyển đổi fig thành dạng bytes để có thể upload hoặc dùng sau này
-    image_bytes = fig.to_image(format="png", width=width, height=height, scale=2)
+def _build_financial_figure(df, width, height, line_name_dict, line_columns, chart_config, symbol_name, time_frame):
+    """Dựng figure Plotly hoàn chỉnh (chưa xuất ảnh): sao chép layout template rồi tạo Figure một lần với toàn bộ dữ liệu."""
+    chart_config["symbol_name"] = symbol_name
+    chart_config["time_frame"] = time_frame
 
-    # Lưu file nếu có đường dẫn
+    components = _chart_components(df, line_name_dict, line_columns, chart_config, symbol_name)
+
+    layout = copy.deepcopy(get_chart_template(chart_config, width, height, has_rsi=_has_rsi(df)))
+    _merge_layout(layout, components["layout_updates"])
+    layout["shapes"] = layout.get("shapes", []) + components["shapes"]
+    layout["annotations"] = layout.get("annotations", []) + components["annotations"]
+
+    return go.Figure(data=components["traces"], layout=layout)
+
+
+def _save_chart_image(image_bytes, path, image_name):
     if path and image_name:
         if not os.path.exists(path):
-            os.makedirs(path)
+            os.makedirs(path, exist_ok=True)
         full_path = os.path.join(path, image_name)
         # Ghi lại từ dạng bytes đã tạo để không phải render lần 2
         with open(full_path, "wb") as f:
             f.write(image_bytes)
 
-    # Trả về 2 giá trị như code gốc của bạn mong đợi
-    return fig, image_bytes
+
+# ==============================================================================
+# 9. XUẤT ẢNH HÀNG LOẠT VỚI TIẾN TRÌNH XUẤT ẢNH GIỮ ẤM (WARM EXPORTER)
+# ==============================================================================
+
+
+class _WarmExporter:
+    """
+    Giữ một phiên Kaleido (v1+, trình duyệt headless) mở suốt vòng đời process để các lần xuất ảnh sau
+    dùng lại thay vì khởi động trình duyệt cho mỗi ảnh. Nếu không mở được (Kaleido bản cũ hoặc thiếu trình
+    duyệt), xuất ảnh bằng fig.to_image như bình thường.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._kaleido = None
+        self._fallback_reported = False
+
+    def _report_fallback(self, reason):
+        """Báo một lần mỗi process khi không giữ được phiên Kaleido và phải xuất ảnh bằng fig.to_image."""
+        if not self._fallback_reported:
+            print(f"[process {os.getpid()}] Không mở được phiên Kaleido giữ ấm ({reason}), xuất ảnh bằng fig.to_image.")
+            self._fallback_reported = True
+
+    def open(self):
+        if self._kaleido is not None:
+            return True
+        try:
+            kaleido = importlib.import_module("kaleido")
+            if not hasattr(kaleido, "Kaleido"):
+                self._report_fallback("Kaleido bản cũ không có kaleido.Kaleido")
+                return False
+            # Trong process đang chạy sẵn event loop (vd: Jupyter với max_workers=1), run_until_complete sẽ báo lỗi
+            self._loop = asyncio.new_event_loop()
+            self._kaleido = self._loop.run_until_complete(kaleido.Kaleido(n=1).__aenter__())
+            atexit.register(self.close)
+            return True
+        except Exception as e:
+            self._report_fallback(repr(e))
+            self.close()
+            return False
+
+    def close(self):
+        if self._kaleido is not None:
+            try:
+                self._loop.run_until_complete(self._kaleido.__aexit__(None, None, None))
+            except Exception:
+                pass
+        if self._loop is not None:
+            self._loop.close()
+        self._loop = None
+        self._kaleido = None
+
+    def to_image(self, fig, width, height, scale=2):
+        if self.open():
+            options = {"format": "png", "width": width, "height": height, "scale": scale}
+            return self._loop.run_until_complete(self._kaleido.calc_fig(fig, opts=options))
+        return fig.to_image(format="png", width=width, height=height, scale=scale)
+
+
+# Mỗi process (kể cả các process con của render_charts_batch) có một exporter riêng
+_WARM_EXPORTER = _WarmExporter()
+
+
+def _open_warm_exporter():
+    _WARM_EXPORTER.open()
+
+
+def _render_chart_task(symbol_name, df, chart_kwargs, max_attempts):
+    """Dựng và xuất ảnh một biểu đồ (chạy được trong process con), thử lại riêng cho biểu đồ này khi lỗi."""
+    width, height, backend = chart_kwargs["width"], chart_kwargs["height"], chart_kwargs["backend"]
+    result = {"symbol": symbol_name, "image_bytes": None, "build_seconds": None, "export_seconds": None, "attempts": 0, "error": None, "cached": False}
+    image_name = chart_kwargs["image_name_template"].format(symbol=symbol_name)
+
+    # Ảnh đã có trong cache: bỏ qua cả bước dựng figure và xuất ảnh
+    cache_key = None
+    if chart_kwargs["use_cache"]:
+        cache_key = _chart_cache_key(
+            df, width, height, chart_kwargs["line_name_dict"], chart_kwargs["line_columns"], chart_kwargs["chart_config"], symbol_name, chart_kwargs["time_frame"], scale=2, backend=backend
+        )
+        result["image_bytes"] = _read_chart_cache(cache_key)
+        if result["image_bytes"] is not None:
+            result["cached"] = True
+            _save_chart_image(result["image_bytes"], chart_kwargs["path"], image_name)
+            return result
+
+    # Lỗi dựng figure (dữ liệu thiếu cột, toàn NaN...) chỉ được ghi vào kết quả của biểu đồ này, không dừng cả batch
+    start_time = time.perf_counter()
+    build_figure = _build_matplotlib_figure if backend == "matplotlib" else _build_financial_figure
+    try:
+        fig = build_figure(
+            df,
+            width,
+            height,
+            chart_kwargs["line_name_dict"],
+            chart_kwargs["line_columns"],
+            dict(chart_kwargs["chart_config"]),
+            symbol_name,
+            chart_kwargs["time_frame"],
+        )
+    except Exception as e:
+        result["error"] = f"build: {e!r}"
+        return result
+    finally:
+        result["build_seconds"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for attempt in range(1, max_attempts + 1):
+        result["attempts"] = attempt
+        try:
+            if backend == "matplotlib":
+                result["image_bytes"] = _matplotlib_to_image(fig, scale=2)
+            else:
+                result["image_bytes"] = _WARM_EXPORTER.to_image(fig, width, height, scale=2)
+            result["error"] = None
+            break
+        except Exception as e:
+            result["error"] = repr(e)
+            # Phiên xuất ảnh có thể đã hỏng: đóng lại để lần thử sau mở phiên mới
+            _WARM_EXPORTER.close()
+    result["export_seconds"] = time.perf_counter() - start_time
+
+    if result["image_bytes"] is not None:
+        if cache_key:
+            _write_chart_cache(cache_key, result["image_bytes"])
+        _save_chart_image(result["image_bytes"], chart_kwargs["path"], image_name)
+    return result
+
+
+def render_charts_batch(
+    df_dict,
+    width,
+    height,
+    line_name_dict,
+    line_columns,
+    chart_config,
+    path=None,
+    image_name_template="{symbol}_chart.png",
+    time_frame="1D",
+    max_workers=None,
+    max_attempts=5,
+    use_cache=True,
+    backend="plotly",
+):
+    """
+    Xuất ảnh biểu đồ cho nhiều mã cùng lúc
+
+    Mỗi process trong pool giữ một tiến trình xuất ảnh (Kaleido) luôn chạy nên chỉ tốn chi phí khởi động
+    một lần cho mỗi process thay vì cho mỗi ảnh. Lỗi xuất ảnh được thử lại riêng cho từng biểu đồ.
+
+    Parameters:
+    - df_dict: dict {symbol: DataFrame} dữ liệu đã sắp xếp theo ngày tăng dần
+    - width, height, line_name_dict, line_columns, chart_config, time_frame: như create_financial_chart
+    - path: thư mục lưu ảnh (None = không lưu file)
+    - image_name_template: mẫu tên file, vd: "{symbol}_chart.png"
+    - max_workers: số process xuất ảnh (mặc định min(số mã, số CPU)); 1 = chạy trong process hiện tại
+    - max_attempts: số lần thử tối đa cho mỗi biểu đồ
+    - use_cache: dùng lại ảnh đã vẽ khi đầu vào không đổi (xem CHART_CACHE_DIR)
+    - backend: "plotly" hoặc "matplotlib" (như create_financial_chart, matplotlib không cần tiến trình xuất ảnh)
+
+    Returns:
+    - image_dict: dict {symbol: image_bytes} (None nếu biểu đồ không xuất được sau max_attempts lần)
+    - timing_df: DataFrame gồm symbol, build_seconds, export_seconds, attempts, error, cached
+    """
+    chart_kwargs = {
+        "width": width,
+        "height": height,
+        "line_name_dict": line_name_dict,
+        "line_columns": list(line_columns),
+        "chart_config": chart_config,
+        "time_frame": time_frame,
+        "path": path,
+        "image_name_template": image_name_template,
+        "use_cache": use_cache,
+        "backend": backend,
+    }
+    _check_chart_backend(backend)
+    df_dict = {symbol: df for symbol, df in df_dict.items() if not df.empty}
+    workers = min(max_workers or os.cpu_count() or 1, len(df_dict)) or 1
+
+    if workers > 1:
+        initializer = _open_warm_exporter if backend == "plotly" else None
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as executor:
+            futures = [executor.submit(_render_chart_task, symbol, df, chart_kwargs, max_attempts) for symbol, df in df_dict.items()]
+            results = [future.result() for future in as_completed(futures)]
+    else:
+        if backend == "plotly":
+            _open_warm_exporter()
+        results = [_render_chart_task(symbol, df, chart_kwargs, max_attempts) for symbol, df in df_dict.items()]
+
+    result_by_symbol = {result["symbol"]: result for result in results}
+    image_dict = {symbol: result_by_symbol[symbol]["image_bytes"] for symbol in df_dict}
+    timing_df = pd.DataFrame([{key: value for key, value in result_by_symbol[symbol].items() if key != "image_bytes"} for symbol in df_dict])
+    return image_dict, timing_df
@@ -3,12 +3,35 @@ import os
 
 sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
 
-from import_default import *
-from import_database import *
-from import_other import *
+from import_default import re, time, datetime, pd, np, openpyxl, win32com, multiprocessing, ThreadPoolExecutor, ProcessPoolExecutor
 
 
-def transform_to_long_format(df):
+def _parse_indicator(indicator_full):
+    """Tách tên cột của file export thành (tên chỉ tiêu, kỳ, đơn vị)."""
+    parts = indicator_full.strip().split("\n")
+    name = parts[0] if len(parts) > 0 else None
+
+    # Tìm period (Ngày hoặc Quý)
+    period_str = " ".join(parts[1:])
+    date_match = re.search(r"(\d{4}-\d{2}-\d{2})", period_str)
+    quarter_match = re.search(r"(Q\d-\d{4})", period_str)
+
+    period = None
+    if date_match:
+        period = pd.to_datetime(date_match.group(1))
+    elif quarter_match:
+        period = quarter_match.group(1)
+    else:
+        period = "N/A"
+
+    # Tìm unit
+    unit_str = parts[-1] if "Đơn vị:" in parts[-1] else None
+    unit = unit_str.replace("Đơn vị:", "").strip() if unit_str else None
+
+    return name, period, unit
+
+
+def transform_to_long_format(df, compact=False):
     # --- 1. Làm sạch tên cột định danh ---
     # Giả định 4 cột đầu tiên luôn là cột định danh
     id_cols = df.columns[:4]
@@ -24,38 +47,407 @@ def transform_to_long_format(df):
     df_long.dropna(subset=["value"], inplace=True)
 
     # --- 3. Trích xuất thông tin từ cột phức hợp ---
-    def parse_indicator(indicator_full):
-        parts = indicator_full.strip().split("\n")
-        name = parts[0] if len(parts) > 0 else None
-
-        # Tìm period (Ngày hoặc Quý)
-        period_str = " ".join(parts[1:])
-        date_match = re.search(r"(\d{4}-\d{2}-\d{2})", period_str)
-        quarter_match = re.search(r"(Q\d-\d{4})", period_str)
-
-        period = None
-        if date_match:
-            period = pd.to_datetime(date_match.group(1))
-        elif quarter_match:
-            period = quarter_match.group(1)
-        else:
-            period = "N/A"
-
-        # Tìm unit
-        unit_str = parts[-1] if "Đơn vị:" in parts[-1] else None
-        unit = unit_str.replace("Đơn vị:", "").strip() if unit_str else None
-
-        return name, period, unit
-
-    parsed_cols = df_long["indicator_full"].apply(lambda x: pd.Series(parse_indicator(x), index=["name", "period", "unit"]))
+    # Mỗi tên cột chỉ parse một lần rồi ánh xạ ngược về các dòng theo vị trí cột.
+    # pd.melt xếp dữ liệu theo từng cột nối tiếp nhau nên vị trí cột của dòng i là i // len(df)
+    col_codes = df_long.index.to_numpy() // len(df)
+    used_codes, inverse = np.unique(col_codes, return_inverse=True)
+    header_df = pd.DataFrame([_parse_indicator(value_vars[code]) for code in used_codes], columns=["name", "period", "unit"])
+    parsed_cols = header_df.iloc[inverse].set_axis(df_long.index)
     df_long = pd.concat([df_long, parsed_cols], axis=1)
 
     # --- 4. Hoàn thiện DataFrame cuối cùng ---
     final_df = df_long[["ticker", "industry", "name", "period", "unit", "value"]].copy()
 
+    if compact:
+        final_df = to_compact_long_format(final_df)
+
     return final_df
 
 
+# Các cột chuỗi lặp lại trên mọi dòng của bảng long, lưu dạng category ở chế độ compact
+COMPACT_CATEGORY_COLUMNS = ["ticker", "industry", "name", "unit", "group"]
+
+
+def _parse_quarter(value):
+    """Chuyển chuỗi dạng 'Q2-2025' thành pd.Period quý, trả về NaT nếu không đúng định dạng."""
+    match = re.fullmatch(r"Q([1-4])-(\d{4})", str(value))
+    if not match:
+        return pd.NaT
+    return pd.Period(year=int(match.group(2)), quarter=int(match.group(1)), freq="Q")
+
+
+def to_compact_long_format(df):
+    """
+    Chuyển bảng long sang schema gọn: các cột chuỗi thành category, cột period (lẫn ngày và chuỗi quý)
+    được tách thành period_date (datetime64), period_quarter (period[Q-DEC]) và period_label (category)
+    giữ nguyên các kỳ không phải ngày hay quý (vd: 'N/A') để không lẫn với dòng thiếu kỳ
+    """
+    compact_df = df.copy()
+    for column in COMPACT_CATEGORY_COLUMNS:
+        if column in compact_df.columns:
+            compact_df[column] = compact_df[column].astype("category")
+
+    if "period" in compact_df.columns:
+        # Chỉ xử lý trên các giá trị period khác nhau rồi ánh xạ lại theo mã
+        codes, uniques = pd.factorize(compact_df["period"], use_na_sentinel=True)
+        unique_dates = pd.Series([value if isinstance(value, (pd.Timestamp, datetime)) else pd.NaT for value in uniques], dtype="datetime64[ns]")
+        unique_quarters = pd.Series([_parse_quarter(value) for value in uniques], dtype="period[Q-DEC]")
+        unique_labels = pd.Categorical(
+            [None if pd.notna(date) or pd.notna(quarter) else str(value) for value, date, quarter in zip(uniques, unique_dates, unique_quarters)]
+        )
+
+        # Mã -1 (giá trị rỗng) được điền NaT/NaN khi take với allow_fill
+        period_date = unique_dates.array.take(codes, allow_fill=True)
+        period_quarter = unique_quarters.array.take(codes, allow_fill=True)
+        period_label = unique_labels.take(codes, allow_fill=True)
+
+        position = compact_df.columns.get_loc("period")
+        compact_df = compact_df.drop(columns="period")
+        compact_df.insert(position, "period_date", period_date)
+        compact_df.insert(position + 1, "period_quarter", period_quarter)
+        compact_df.insert(position + 2, "period_label", period_label)
+
+    return compact_df
+
+
+def save_long_table(df, csv_path, **csv_kwargs):
+    """
+    Lưu bảng long ra CSV như cũ và thêm một bản Parquet (schema compact) cùng tên bên cạnh
+
+    Returns:
+    - đường dẫn file Parquet
+    """
+    df.to_csv(csv_path, index=False, **csv_kwargs)
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    compact_df = df if "period_date" in df.columns else to_compact_long_format(df)
+    compact_df.to_parquet(parquet_path, index=False)
+    return parquet_path
+
+
+def load_long_table(path):
+    """Đọc bảng long, ưu tiên file Parquet cùng tên nếu có (giữ nguyên kiểu category/datetime/period)."""
+    parquet_path = os.path.splitext(path)[0] + ".parquet"
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+    return pd.read_csv(path)
+
+
+# ==============================================================================
+# CẬP NHẬT TĂNG DẦN: CHỈ XỬ LÝ LẠI CÁC LÁT (TICKER, KỲ) THAY ĐỔI
+# ==============================================================================
+
+FA_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache", "fa_store")
+
+
+def _period_key(period):
+    """Chuỗi đại diện cho một kỳ (ngày dạng YYYY-MM-DD hoặc chuỗi quý) dùng để so khớp."""
+    return period.strftime("%Y-%m-%d") if isinstance(period, (pd.Timestamp, datetime)) else str(period)
+
+
+def _period_keys_of(period_series):
+    """Tính _period_key cho cả cột period, chỉ xử lý trên các giá trị khác nhau."""
+    codes, uniques = pd.factorize(period_series)
+    unique_keys = np.array([_period_key(value) for value in uniques] + ["nan"], dtype=object)
+    return unique_keys[codes]  # Mã -1 (rỗng) trỏ tới phần tử cuối "nan"
+
+
+def _fingerprint_raw_slices(raw_df):
+    """
+    Tính hash cho từng lát (ticker, kỳ) của bảng thô dạng wide (4 cột đầu là cột định danh).
+
+    Returns:
+    - fingerprint_df: DataFrame (ticker, period_key, fingerprint)
+    - period_columns: dict {period_key: [tên cột giá trị thuộc kỳ đó]}
+    """
+    ticker_col, industry_col = raw_df.columns[0], raw_df.columns[3]
+    period_columns = {}
+    for column in raw_df.columns[4:]:
+        period_columns.setdefault(_period_key(_parse_indicator(column)[1]), []).append(column)
+
+    parts = []
+    for period_key, columns in period_columns.items():
+        # Hash theo dòng gồm ngành và các giá trị của kỳ, trộn thêm hash của tên cột để thay đổi header cũng được phát hiện
+        row_hash = pd.util.hash_pandas_object(raw_df[[industry_col, *columns]], index=False).to_numpy()
+        header_hash = pd.util.hash_array(np.array(columns, dtype=object)).sum(dtype=np.uint64)
+        parts.append(
+            pd.DataFrame(
+                {
+                    "ticker": raw_df[ticker_col].to_numpy(),
+                    "period_key": period_key,
+                    "fingerprint": (row_hash ^ header_hash).view(np.int64),
+                }
+            )
+        )
+    fingerprint_df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["ticker", "period_key", "fingerprint"])
+    return fingerprint_df, period_columns
+
+
+def refresh_long_table_incremental(raw_df, key, store_dir=FA_STORE_DIR):
+    """
+    Cập nhật bảng long đã lưu bằng cách chỉ chuyển đổi lại các lát (ticker, kỳ) có hash thay đổi
+
+    Lần chạy đầu tiên (chưa có kho lưu) xử lý toàn bộ bảng. Các lần sau so sánh hash từng lát với lần trước:
+    lát mới/thay đổi được chuyển đổi lại, lát không còn trong file export bị xóa khỏi kho.
+
+    Parameters:
+    - raw_df: bảng thô dạng wide (như khi đọc bằng read_raw_exports)
+    - key: tên bộ dữ liệu (vd: 'ptcb'), dùng đặt tên file trong kho
+    - store_dir: thư mục kho lưu bảng long, hash và manifest thay đổi
+
+    Returns:
+    - long_df: bảng long đầy đủ sau khi gộp (cùng schema với transform_to_long_format)
+    - change_df: manifest thay đổi (ticker, period_key, change) với change là 'added', 'modified' hoặc 'removed'
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    long_path = os.path.join(store_dir, f"{key}_long.pkl")
+    fingerprint_path = os.path.join(store_dir, f"{key}_fingerprints.parquet")
+    change_path = os.path.join(store_dir, f"{key}_changes.csv")
+
+    # --- 1. So sánh hash từng lát với lần chạy trước ---
+    fingerprint_df, period_columns = _fingerprint_raw_slices(raw_df)
+    has_store = os.path.exists(long_path) and os.path.exists(fingerprint_path)
+    old_long_df = pd.read_pickle(long_path) if has_store else None
+    old_fingerprint_df = pd.read_parquet(fingerprint_path) if has_store else fingerprint_df.iloc[0:0]
+
+    merged_df = fingerprint_df.merge(old_fingerprint_df, on=["ticker", "period_key"], how="outer", suffixes=("", "_old"), indicator=True)
+    change = np.select(
+        [
+            merged_df["_merge"] == "left_only",
+            merged_df["_merge"] == "right_only",
+            merged_df["fingerprint"] != merged_df["fingerprint_old"],
+        ],
+        ["added", "removed", "modified"],
+        default="",
+    )
+    change_df = merged_df.loc[change != "", ["ticker", "period_key"]].assign(change=change[change != ""]).reset_index(drop=True)
+
+    # --- 2. Chuyển đổi lại các lát mới/thay đổi, gom theo kỳ để mỗi kỳ chỉ gọi transform một lần ---
+    new_parts = []
+    ticker_values = raw_df.iloc[:, 0]
+    for period_key, group_df in change_df[change_df["change"] != "removed"].groupby("period_key", sort=False):
+        subset_df = raw_df.loc[ticker_values.isin(group_df["ticker"]), [*raw_df.columns[:4], *period_columns[period_key]]].copy()
+        new_parts.append(transform_to_long_format(subset_df))
+
+    # --- 3. Gộp vào kho: bỏ các lát cũ đã thay đổi/bị xóa, thêm các lát mới ---
+    if old_long_df is not None:
+        changed_index = pd.MultiIndex.from_frame(change_df[["ticker", "period_key"]])
+        old_index = pd.MultiIndex.from_arrays([old_long_df["ticker"].to_numpy(), _period_keys_of(old_long_df["period"])])
+        kept_df = old_long_df[~old_index.isin(changed_index)]
+        long_df = pd.concat([kept_df, *new_parts], ignore_index=True) if new_parts else kept_df.reset_index(drop=True)
+    else:
+        long_df = pd.concat(new_parts, ignore_index=True) if new_parts else transform_to_long_format(raw_df.copy())
+
+    # --- 4. Ghi kho (qua file tạm) và manifest thay đổi ---
+    if not change_df.empty or not has_store:
+        long_df.to_pickle(f"{long_path}.tmp")
+        os.replace(f"{long_path}.tmp", long_path)
+        fingerprint_df.to_parquet(f"{fingerprint_path}.tmp", index=False)
+        os.replace(f"{fingerprint_path}.tmp", fingerprint_path)
+    change_df.to_csv(change_path, index=False, encoding="utf-8-sig")
+
+    summary = change_df["change"].value_counts().to_dict()
+    print(f"Cập nhật '{key}': {len(change_df)} lát thay đổi {summary}, tổng {len(long_df)} dòng.")
+    return long_df, change_df
+
+
+# ==============================================================================
+# PIPELINE XỬ LÝ SONG SONG CHO CÁC BỘ DỮ LIỆU FA
+# ==============================================================================
+
+
+def _transform_chunk(df_chunk, compact=False):
+    """Chuyển một phần (theo dòng/mã) của bảng thô sang long format, chạy trong process con."""
+    return transform_to_long_format(df_chunk, compact=compact)
+
+
+def _reindex_chunk_result(chunk_long_df, chunk_start, chunk_len, total_len):
+    """
+    Đổi index của kết quả một chunk về index như khi xử lý cả bảng một lần
+    (index của pd.melt = vị trí cột * số dòng + vị trí dòng).
+    """
+    if chunk_len == 0:
+        return chunk_long_df
+    local_index = chunk_long_df.index.to_numpy()
+    col_position = local_index // chunk_len
+    row_position = chunk_start + local_index % chunk_len
+    return chunk_long_df.set_axis(col_position * total_len + row_position)
+
+
+def compute_net_flows(long_df, net_flows, unit=None):
+    """
+    Tính giá trị ròng (mua - bán) theo mã cho nhiều nhóm chỉ tiêu trong một lần duyệt dữ liệu
+
+    Các chỉ tiêu liên quan được gom thành ma trận mã × chỉ tiêu, sau đó nhân với ma trận trọng số
+    (+1 cho mua, -1 cho bán) để ra tất cả các chỉ tiêu ròng cùng lúc. Có thể khai báo đồng thời
+    nhiều cửa sổ (1 tuần, 1 tháng, khớp lệnh, thỏa thuận...) trong net_flows.
+
+    Parameters:
+    - long_df: bảng long (ticker, industry, name, period, unit, value)
+    - net_flows: dict {tên chỉ tiêu ròng: {"buy": [tên chỉ tiêu mua], "sell": [tên chỉ tiêu bán]}}
+    - unit: đơn vị của các dòng ròng
+
+    Returns:
+    - DataFrame các dòng ròng theo schema long (ticker, value, name, industry, period, unit).
+      Mã thiếu hẳn phía mua hoặc phía bán có value NaN, giống phép trừ hai Series groupby
+    """
+    net_names = list(net_flows)
+    metrics = list(dict.fromkeys(name for spec in net_flows.values() for side in ("buy", "sell") for name in spec[side]))
+    metric_index = pd.Index(metrics)
+
+    # Ma trận trọng số chỉ tiêu × chỉ tiêu ròng, tách riêng phía mua/bán để biết mã nào có dữ liệu
+    buy_weights = np.zeros((len(metrics), len(net_names)))
+    sell_weights = np.zeros((len(metrics), len(net_names)))
+    for j, net_name in enumerate(net_names):
+        buy_weights[metric_index.get_indexer(net_flows[net_name]["buy"]), j] = 1.0
+        sell_weights[metric_index.get_indexer(net_flows[net_name]["sell"]), j] = 1.0
+
+    # --- 1. Gom các dòng liên quan thành ma trận mã × chỉ tiêu (tổng giá trị và số dòng) ---
+    relevant_df = long_df[long_df["name"].isin(metrics)]
+    ticker_codes, tickers = pd.factorize(relevant_df["ticker"], sort=True)
+    metric_codes = metric_index.get_indexer(relevant_df["name"])
+    value_matrix = np.zeros((len(tickers), len(metrics)))
+    count_matrix = np.zeros((len(tickers), len(metrics)))
+    np.add.at(value_matrix, (ticker_codes, metric_codes), relevant_df["value"].to_numpy(dtype=float))
+    np.add.at(count_matrix, (ticker_codes, metric_codes), 1.0)
+
+    # --- 2. Một phép nhân ma trận cho tất cả chỉ tiêu ròng ---
+    net_matrix = value_matrix @ (buy_weights - sell_weights)
+    has_buy = (count_matrix @ buy_weights) > 0
+    has_sell = (count_matrix @ sell_weights) > 0
+    net_matrix[~(has_buy & has_sell)] = np.nan
+
+    # --- 3. Trả về dạng long, thông tin ngành/kỳ lấy từ dòng đầu tiên của mỗi mã ---
+    ticker_info = long_df.loc[~long_df["ticker"].duplicated(), ["ticker", "industry", "period"]].set_index("ticker")
+    net_dfs = []
+    for j, net_name in enumerate(net_names):
+        mask = has_buy[:, j] | has_sell[:, j]
+        net_tickers = pd.Index(tickers[mask], name="ticker")
+        net_dfs.append(
+            pd.DataFrame(
+                {
+                    "ticker": net_tickers.to_numpy(dtype=object),
+                    "value": net_matrix[mask, j],
+                    "name": net_name,
+                    "industry": ticker_info["industry"].reindex(net_tickers).to_numpy(),
+                    "period": ticker_info["period"].reindex(net_tickers).to_numpy(),
+                    "unit": unit,
+                }
+            )
+        )
+
+    if not net_dfs:
+        return pd.DataFrame(columns=["ticker", "value", "name", "industry", "period", "unit"])
+    return pd.concat(net_dfs, ignore_index=True)
+
+
+def _apply_net_flows(temp_df, net_flows, unit):
+    """Thay các dòng mua/bán trong net_flows bằng các dòng giá trị ròng tính bởi compute_net_flows."""
+    all_trading_cols = [name for spec in net_flows.values() for side in ("buy", "sell") for name in spec[side]]
+    net_df = compute_net_flows(temp_df, net_flows, unit)
+    return pd.concat([temp_df[~temp_df["name"].isin(all_trading_cols)], net_df], ignore_index=True)
+
+
+def _postprocess_clean_table(temp_df, config):
+    """Áp dụng các bước hậu xử lý khai báo trong config cho một bộ dữ liệu đã ở long format."""
+    if config.get("net_flows"):
+        temp_df = _apply_net_flows(temp_df, config["net_flows"], config.get("net_flow_unit"))
+    if config.get("name_map") is not None:
+        temp_df["name"] = temp_df["name"].map(config["name_map"])
+    if config.get("group_map") is not None:
+        temp_df["group"] = temp_df["name"].map(config["group_map"])
+    return temp_df
+
+
+def _finish_clean_table(temp_df, config, compact):
+    """Hậu xử lý (cần cột period gốc cho giá trị ròng) rồi chuyển sang schema gọn nếu được yêu cầu."""
+    temp_df = _postprocess_clean_table(temp_df, config)
+    return to_compact_long_format(temp_df) if compact else temp_df
+
+
+# Số ô dữ liệu thô tối thiểu để build_clean_tables tự dùng process pool khi không truyền max_workers, theo start method.
+# Đo bằng bảng thô 400-1600 mã × 100-1200 cột: xử lý tuần tự ~0.42 µs/ô; pool tốn thêm chi phí cố định
+# (~0.03 s với fork, ~0.55 s với forkserver, ~0.65 s với spawn do mỗi process import lại pandas) và ~0.18 µs/ô truyền dữ liệu qua lại.
+# Điểm hòa với 4 process: 0.03 s / (0.42 × 3/4 - 0.18) µs ≈ 0.22 triệu ô (fork), ≈ 4.1 triệu ô (forkserver), ≈ 4.8 triệu ô (spawn, mặc định trên Windows).
+PARALLEL_MIN_CELLS = {"fork": 250_000, "forkserver": 4_000_000, "spawn": 5_000_000}
+
+
+def build_clean_tables(raw_df_dict, dataset_configs=None, output_dir=None, max_workers=None, chunk_size=500, incremental=False, compact=False):
+    """
+    Chuyển các bảng FA thô sang long format song song trên nhiều process và áp dụng hậu xử lý
+
+    Mỗi bộ dữ liệu được chia theo dòng (mã cổ phiếu) thành các chunk, tất cả chunk của mọi bộ dữ liệu
+    được xử lý trên cùng một process pool rồi ghép lại đúng thứ tự như khi xử lý tuần tự.
+
+    Parameters:
+    - raw_df_dict: dict {key: DataFrame thô} (vd: 'ptcb', 'bctc', 'current')
+    - dataset_configs: dict {key: config}, config có thể gồm:
+        - "name_map": dict đổi tên chỉ tiêu (chỉ tiêu không có trong map thành NaN)
+        - "group_map": dict {chỉ tiêu: nhóm} để tạo cột 'group'
+        - "net_flows": dict {tên chỉ tiêu ròng: {"buy": [...], "sell": [...]}} và "net_flow_unit"
+    - output_dir: nếu có, lưu bảng long (trước hậu xử lý) thành clean_{key}.csv/.parquet trong thư mục này
+    - max_workers: số process tối đa (1 = xử lý tuần tự; None = tự chọn, chạy tuần tự nếu chỉ có 1 CPU hoặc tổng số ô < PARALLEL_MIN_CELLS của start method hiện tại)
+    - chunk_size: số dòng (mã) mỗi chunk
+    - incremental: dùng refresh_long_table_incremental cho từng bộ dữ liệu (chỉ xử lý lại các lát thay đổi)
+      thay cho việc chuyển đổi toàn bộ, manifest thay đổi được lưu trong FA_STORE_DIR
+    - compact: trả về bảng theo schema gọn của to_compact_long_format (áp dụng sau hậu xử lý), chỉ dùng khi xử lý
+      trong bộ nhớ; các file CSV xuất cho người dùng (vd: output/clean_*.csv trong fa_data) giữ schema thường
+
+    Returns:
+    - clean_df_dict: dict {key: DataFrame đã xử lý}
+    """
+    if dataset_configs is None:
+        dataset_configs = {}
+
+    if incremental:
+        clean_df_dict = {}
+        for key, df in raw_df_dict.items():
+            temp_df, _ = refresh_long_table_incremental(df, key)
+            if output_dir:
+                save_long_table(temp_df, os.path.join(output_dir, f"clean_{key}.csv"))
+            clean_df_dict[key] = _finish_clean_table(temp_df, dataset_configs.get(key, {}), compact)
+        return clean_df_dict
+
+    # --- 1. Chia các bảng thô thành chunk theo dòng ---
+    jobs = []
+    for key, df in raw_df_dict.items():
+        for chunk_start in range(0, max(len(df), 1), chunk_size):
+            jobs.append((key, chunk_start, df.iloc[chunk_start : chunk_start + chunk_size]))
+
+    # --- 2. Chuyển sang long format trên process pool ---
+    # Với bảng nhỏ, chi phí khởi tạo process và truyền dữ liệu lớn hơn thời gian xử lý nên chạy tuần tự
+    total_cells = sum(df.size for df in raw_df_dict.values())
+    min_cells = PARALLEL_MIN_CELLS.get(multiprocessing.get_start_method(), PARALLEL_MIN_CELLS["spawn"])
+    if max_workers is None and ((os.cpu_count() or 1) == 1 or total_cells < min_cells):
+        max_workers = 1
+
+    if max_workers == 1 or len(jobs) == 1:
+        chunk_results = [_transform_chunk(chunk_df.copy()) for _, _, chunk_df in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunk_results = list(executor.map(_transform_chunk, [chunk_df for _, _, chunk_df in jobs]))
+
+    # --- 3. Ghép các chunk, hậu xử lý và lưu kết quả ---
+    clean_df_dict = {}
+    for key, df in raw_df_dict.items():
+        parts = [
+            _reindex_chunk_result(chunk_long_df, chunk_start, len(chunk_df), len(df))
+            for (job_key, chunk_start, chunk_df), chunk_long_df in zip(jobs, chunk_results)
+            if job_key == key
+        ]
+        temp_df = pd.concat(parts).sort_index() if len(parts) > 1 else parts[0]
+
+        if output_dir:
+            save_long_table(temp_df, os.path.join(output_dir, f"clean_{key}.csv"))
+
+        clean_df_dict[key] = _finish_clean_table(temp_df, dataset_configs.get(key, {}), compact)
+
+    return clean_df_dict
+
+
+# ==============================================================================
+# BÁO CÁO TÀI CHÍNH: ĐỌC QUA EXCEL (COM) HOẶC TỪ FILE WORKBOOK ĐÃ TÍNH SẴN (OPENPYXL)
+# ==============================================================================
+
 def get_open_excel_workbooks():
     """
     Lấy danh sách tên các workbook Excel đang mở
@@ -70,24 +462,136 @@ def get_open_excel_workbooks():
         return []
 
 
-def get_financial_statements(stock, year, quarter, period_count, file_name="workbook.xlsx"):
+FS_REPORT_LIST = ["IncomeStatement", "BalanceSheet", "CashFlow"]
+FS_WORKBOOK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+FS_META_SHEET = "_meta"  # Sheet ghi tham số year/quarter/period_count của lần export_statement_workbook
+FS_PARAM_KEYS = ("year", "quarter", "period_count")
+
+# Công thức trong ô A1 của sheet tính trực tiếp bằng Excel: =FA.{loại báo cáo}.Reports("{mã}",{year},{quarter},{period_count},...)
+_FS_FORMULA_PATTERN = re.compile(r'FA\.(\w+)\.Reports\(\s*"([^"]+)"\s*,\s*"?(\d+)"?\s*,\s*"?(\d+)"?\s*,\s*"?(\d+)"?', re.IGNORECASE)
+
+# Cache các sheet đã đọc theo đường dẫn file, tự làm mới khi mtime/kích thước file thay đổi
+_FS_WORKBOOK_CACHE = {}
+
+
+def _rows_to_statement_df(rows):
+    """Chuyển các dòng giá trị (hàng đầu là tiêu đề) thành DataFrame giống kết quả đọc qua COM."""
+    rows = [list(row) for row in rows if any(value is not None for value in row)]
+    if not rows:
+        return pd.DataFrame()
+    temp_df = pd.DataFrame(rows[1:], columns=rows[0])
+    # Bỏ các cột trống ở cuối (read-only mode có thể trả về vùng rộng hơn vùng dữ liệu)
+    return temp_df.loc[:, [column is not None or temp_df[column].notna().any() for column in temp_df.columns]]
+
+
+def _resolve_workbook_path(file_name):
+    return file_name if os.path.exists(file_name) else os.path.join(FS_WORKBOOK_DIR, file_name)
+
+
+def _read_formula_params(file_path, sheet_names):
+    """Đọc mã và tham số từ công thức ô A1 của các sheet (mở lại workbook không kèm data_only để thấy công thức)."""
+    sheet_params = {}
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=False)
+    try:
+        for sheet_name in sheet_names:
+            first_row = next(workbook[sheet_name].iter_rows(min_row=1, max_row=1, max_col=1, values_only=True), (None,))
+            match = _FS_FORMULA_PATTERN.search(str(first_row[0] or ""))
+            if match:
+                sheet_params[sheet_name] = {"stock": match.group(2), **dict(zip(FS_PARAM_KEYS, match.group(3, 4, 5)))}
+    finally:
+        workbook.close()
+    return sheet_params
+
+
+def _load_statement_workbook(file_name):
     """
-    Lấy dữ liệu báo cáo tài chính từ Excel sử dụng FA functions
+    Đọc workbook (có cache) và thông tin nhận diện
+
+    Returns:
+    - sheet_dict: dict {tên sheet: DataFrame} (không gồm sheet _meta)
+    - meta: dict gồm params (tham số ghi trong sheet _meta, None nếu không có) và sheet_params (mã và tham số
+      đọc từ công thức A1 của các sheet tên đúng loại báo cáo)
+    """
+    file_path = _resolve_workbook_path(file_name)
+    stat = os.stat(file_path)
+    cached = _FS_WORKBOOK_CACHE.get(os.path.abspath(file_path))
+    if cached and cached[0] == (stat.st_mtime, stat.st_size):
+        return cached[1], cached[2]
+
+    # data_only=True để lấy giá trị đã tính của công thức thay vì chuỗi công thức
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet_dict = {worksheet.title: _rows_to_statement_df(worksheet.iter_rows(values_only=True)) for worksheet in workbook.worksheets}
+    finally:
+        workbook.close()
+
+    meta_df = sheet_dict.pop(FS_META_SHEET, None)
+    params = None
+    if meta_df is not None and not meta_df.empty:
+        params = {str(key): str(value) for key, value in zip(meta_df.iloc[:, 0], meta_df.iloc[:, 1])}
+    generic_sheets = [report_name for report_name in FS_REPORT_LIST if report_name in sheet_dict]
+    meta = {"params": params, "sheet_params": _read_formula_params(file_path, generic_sheets) if generic_sheets else {}}
+
+    _FS_WORKBOOK_CACHE[os.path.abspath(file_path)] = ((stat.st_mtime, stat.st_size), sheet_dict, meta)
+    return sheet_dict, meta
+
+
+def load_statement_workbook(file_name="workbook.xlsx"):
+    """
+    Đọc toàn bộ các sheet của workbook báo cáo tài chính đã tính sẵn trong một lần (openpyxl read-only)
+
+    Workbook gồm các sheet tên '{mã}_{loại báo cáo}' (vd: 'SSI_IncomeStatement') chứa kết quả của công thức
+    FA.{loại báo cáo}.Reports, hoặc các sheet tên đúng loại báo cáo khi chỉ export một mã.
 
     Parameters:
-    - stock: mã cổ phiếu (str)
-    - year: năm (str hoặc int)
-    - quarter: quý (str hoặc int)
-    - period_count: số kỳ (str hoặc int)
-    - file_name: tên file Excel (str, mặc định "workbook.xlsx")
+    - file_name: đường dẫn file hoặc tên file trong thư mục data (mặc định "workbook.xlsx")
 
     Returns:
-    - fs_dict: dictionary chứa DataFrame cho từng loại báo cáo
+    - dict {tên sheet: DataFrame}
     """
+    return _load_statement_workbook(file_name)[0]
+
+
+def _check_statement_params(requested, params, sheet_name, file_name):
+    """So year/quarter/period_count được yêu cầu với tham số lúc tạo sheet; tham số truyền None thì bỏ qua."""
+    for key in FS_PARAM_KEYS:
+        if requested[key] is None:
+            continue
+        if not params or key not in params:
+            raise ValueError(f"'{file_name}' không ghi lại {key} của sheet '{sheet_name}', truyền {key}=None để bỏ qua kiểm tra.")
+        if str(params[key]) != str(requested[key]):
+            raise ValueError(f"Sheet '{sheet_name}' trong '{file_name}' được tính với {key}={params[key]}, không phải {requested[key]}.")
+
+
+def _get_financial_statements_openpyxl(stock, year, quarter, period_count, file_name):
+    sheet_dict, meta = _load_statement_workbook(file_name)
+    requested = {"year": year, "quarter": quarter, "period_count": period_count}
+    fs_dict = {}
+    for report_name in FS_REPORT_LIST:
+        sheet_name, params = f"{stock}_{report_name}", meta["params"]
+        if sheet_name not in sheet_dict:
+            # Sheet chung (export một mã) chỉ được dùng khi công thức của sheet đúng là của mã này
+            sheet_params = meta["sheet_params"].get(report_name)
+            if sheet_params is None or sheet_params["stock"].upper() != str(stock).upper():
+                print(f"Không tìm thấy sheet '{sheet_name}' trong '{file_name}', bỏ qua.")
+                fs_dict[report_name] = pd.DataFrame()
+                continue
+            sheet_name, params = report_name, sheet_params
+        _check_statement_params(requested, params, sheet_name, file_name)
+        fs_dict[report_name] = sheet_dict[sheet_name].copy()
+    return fs_dict
+
+
+def _read_used_range(worksheet):
+    """Đọc toàn bộ UsedRange trong một lần gọi COM thay vì đọc từng ô."""
+    values = worksheet.UsedRange.Value
+    if not isinstance(values, tuple):  # Vùng chỉ có một ô trả về giá trị đơn
+        values = ((values,),)
+    return values
+
 
-    # Khởi tạo dictionary để lưu kết quả
-    report_list = ["IncomeStatement", "BalanceSheet", "CashFlow"]
-    fs_dict = {"IncomeStatement": {}, "BalanceSheet": {}, "CashFlow": {}}
+def _get_financial_statements_com(stock, year, quarter, period_count, file_name, max_retries=500):
+    fs_dict = {report_name: {} for report_name in FS_REPORT_LIST}
 
     excel = None
     workbook = None
@@ -104,40 +608,24 @@ def get_financial_statements(stock, year, quarter, period_count, file_name="work
             workbook = excel.Workbooks(file_name)
             worksheet = workbook.ActiveSheet
 
-            for report_name in report_list:
-                while True:
+            for report_name in FS_REPORT_LIST:
+                rows = []
+                for attempt in range(max_retries):
                     try:
                         worksheet.UsedRange.ClearContents()  # Xóa nội dung và công thức
                         worksheet.UsedRange.ClearFormats()  # Xóa định dạng để loại bỏ spill range cũ
 
                         worksheet.Range("A1").Formula2 = f'=FA.{report_name}.Reports("{stock}",{year},{quarter},{period_count},1000000)'
 
-                        # **Đọc dữ liệu từ UsedRange**
-                        used_range = worksheet.UsedRange
-                        rows = used_range.Rows.Count
-                        cols = used_range.Columns.Count
-
-                        data = []
-                        for i in range(1, rows + 1):
-                            row_data = []
-                            for j in range(1, cols + 1):
-                                value = worksheet.Cells(i, j).Value
-                                row_data.append(value)
-                            data.append(row_data)
+                        rows = _read_used_range(worksheet)
                         break
 
                     except Exception as e:
                         time.sleep(0.01)
-
-                # **Tạo DataFrame**
-                temp_df = pd.DataFrame(data)
-                if rows > 0:
-                    temp_df.columns = temp_df.iloc[0]  # Dùng hàng đầu làm tiêu đề
-                    temp_df = temp_df.iloc[1:].reset_index(drop=True)  # Bỏ hàng đầu và reset index
                 else:
-                    temp_df.columns = None
+                    print(f"Không đọc được {report_name} của {stock} sau {max_retries} lần thử.")
 
-                fs_dict[report_name] = temp_df
+                fs_dict[report_name] = _rows_to_statement_df(rows)
         else:
             print(f"Workbook '{file_name}' không được tìm thấy trong danh sách workbook đang mở.")
 
@@ -163,3 +651,135 @@ def get_financial_statements(stock, year, quarter, period_count, file_name="work
             print(f"Lỗi khi dọn dẹp tiến trình ngầm cho {file_name}: {cleanup_error}")
 
     return fs_dict
+
+
+def get_financial_statements(stock, year, quarter, period_count, file_name="workbook.xlsx", backend=None):
+    """
+    Lấy dữ liệu báo cáo tài chính từ Excel sử dụng FA functions
+
+    Parameters:
+    - stock: mã cổ phiếu (str)
+    - year: năm (str hoặc int)
+    - quarter: quý (str hoặc int)
+    - period_count: số kỳ (str hoặc int)
+    - file_name: tên file Excel (str, mặc định "workbook.xlsx")
+    - backend: 'com' (tính trực tiếp bằng Excel đang mở, chỉ chạy trên Windows) hoặc 'openpyxl' (đọc workbook đã
+      export sẵn bằng export_statement_workbook, chạy được trên mọi hệ điều hành). Mặc định 'com' trên Windows,
+      'openpyxl' trên hệ điều hành khác. Với 'openpyxl', year/quarter/period_count không lọc lại dữ liệu mà được
+      đối chiếu với tham số lúc export (sheet _meta hoặc công thức A1): khác nhau thì báo ValueError, truyền None
+      để bỏ qua kiểm tra. Mã không có sheet '{mã}_{loại báo cáo}' trả về DataFrame rỗng
+
+    Returns:
+    - fs_dict: dictionary chứa DataFrame cho từng loại báo cáo
+    """
+    if backend is None:
+        backend = "com" if sys.platform == "win32" else "openpyxl"
+
+    if backend == "openpyxl":
+        return _get_financial_statements_openpyxl(stock, year, quarter, period_count, file_name)
+    if backend == "com":
+        return _get_financial_statements_com(stock, year, quarter, period_count, file_name)
+    raise ValueError(f"backend không hợp lệ: {backend}")
+
+
+def export_statement_workbook(stock_list, year, quarter, period_count, file_name="workbook.xlsx", output_path=None):
+    """
+    Tính báo cáo tài chính của nhiều mã qua Excel (COM) và lưu giá trị vào một workbook để đọc lại bằng backend 'openpyxl'
+
+    Parameters:
+    - stock_list: danh sách mã cổ phiếu
+    - year, quarter, period_count: tham số của FA functions
+    - file_name: tên workbook đang mở trong Excel dùng để tính công thức
+    - output_path: đường dẫn file kết quả (mặc định data/{file_name})
+
+    Returns:
+    - output_path: đường dẫn file đã lưu
+    """
+    output_path = output_path or os.path.join(FS_WORKBOOK_DIR, file_name)
+    output_workbook = openpyxl.Workbook(write_only=True)
+
+    # Ghi lại tham số tính để backend 'openpyxl' đối chiếu khi đọc
+    meta_sheet = output_workbook.create_sheet(FS_META_SHEET)
+    meta_sheet.append(["key", "value"])
+    for key, value in zip(FS_PARAM_KEYS, (year, quarter, period_count)):
+        meta_sheet.append([key, str(value)])
+
+    for stock in stock_list:
+        fs_dict = _get_financial_statements_com(stock, year, quarter, period_count, file_name)
+        for report_name in FS_REPORT_LIST:
+            temp_df = fs_dict[report_name]
+            worksheet = output_workbook.create_sheet(f"{stock}_{report_name}")
+            if isinstance(temp_df, pd.DataFrame) and not temp_df.empty:
+                worksheet.append(list(temp_df.columns))
+                for row in temp_df.itertuples(index=False):
+                    worksheet.append(list(row))
+
+    output_workbook.save(output_path)
+    _FS_WORKBOOK_CACHE.pop(os.path.abspath(output_path), None)
+    return output_path
+
+
+def _statement_to_long(stock, report_name, temp_df):
+    """Chuyển một báo cáo dạng wide (cột đầu là chỉ tiêu, các cột sau là kỳ) sang dạng long."""
+    if not isinstance(temp_df, pd.DataFrame) or temp_df.empty:
+        return None
+    item_column = temp_df.columns[0]
+    period_columns = list(temp_df.columns[1:])
+    values = temp_df[period_columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+
+    row_count, period_count = values.shape
+    return pd.DataFrame(
+        {
+            "ticker": stock,
+            "report_type": report_name,
+            "item_order": np.repeat(np.arange(row_count, dtype=np.int16), period_count),
+            "item": np.repeat(temp_df[item_column].astype(str).to_numpy(), period_count),
+            "period": np.tile(np.array([str(column) for column in period_columns], dtype=object), row_count),
+            "value": values.ravel(),
+        }
+    )
+
+
+def build_statement_table(stock_list, year, quarter, period_count, file_name="workbook.xlsx", backend=None, max_workers=None, output_dir=None):
+    """
+    Lấy báo cáo tài chính của nhiều mã và gộp thành một bảng long duy nhất
+
+    Parameters:
+    - stock_list: danh sách mã cổ phiếu
+    - year, quarter, period_count, file_name, backend: như get_financial_statements
+    - max_workers: số thread xử lý song song các mã (backend 'com' luôn chạy tuần tự vì dùng chung một sheet Excel)
+    - output_dir: nếu có, lưu bảng ra Parquet phân vùng theo report_type (output_dir/report_type=.../)
+
+    Returns:
+    - DataFrame gồm ticker, report_type, item_order, item, period (category) và value (float64)
+    """
+    if backend is None:
+        backend = "com" if sys.platform == "win32" else "openpyxl"
+    if backend == "openpyxl":
+        load_statement_workbook(file_name)  # Đọc workbook một lần trước khi chia việc cho các thread
+
+    def process_stock(stock):
+        fs_dict = get_financial_statements(stock, year, quarter, period_count, file_name=file_name, backend=backend)
+        return [_statement_to_long(stock, report_name, fs_dict.get(report_name)) for report_name in FS_REPORT_LIST]
+
+    workers = 1 if backend == "com" else (max_workers or min(len(stock_list), os.cpu_count() or 1) or 1)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(process_stock, stock_list))
+    else:
+        results = [process_stock(stock) for stock in stock_list]
+
+    parts = [part for stock_parts in results for part in stock_parts if part is not None]
+    if not parts:
+        return pd.DataFrame(columns=["ticker", "report_type", "item_order", "item", "period", "value"])
+
+    fs_df = pd.concat(parts, ignore_index=True)
+    for column in ["ticker", "report_type", "item", "period"]:
+        fs_df[column] = fs_df[column].astype("category")
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        # Ghi đè các phân vùng cũ để chạy lại không bị nhân đôi dữ liệu
+        fs_df.to_parquet(output_dir, index=False, partition_cols=["report_type"], existing_data_behavior="delete_matching")
+
+    return fs_df
@@ -0,0 +1,139 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
+
+from import_default import json, time, hashlib, importlib, pd, ProcessPoolExecutor
+
+
+# ==============================================================================
+# ĐỌC NHANH CÁC FILE EXPORT THÔ (DẠNG FIINPRO) KÈM CACHE THEO NỘI DUNG FILE
+# ==============================================================================
+
+RAW_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache", "raw")
+
+# Định dạng mặc định của các file export: 7 dòng tiêu đề và 11 dòng chú thích cuối file
+RAW_EXPORT_SKIPROWS = 7
+RAW_EXPORT_SKIPFOOTER = 11
+
+
+def get_excel_engine():
+    """Chọn engine đọc Excel nhanh nhất hiện có: calamine (Rust) nếu đã cài python-calamine, ngược lại openpyxl."""
+    try:
+        importlib.import_module("python_calamine")
+        return "calamine"
+    except ImportError:
+        return "openpyxl"
+
+
+def _file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _raw_cache_path(file_path, read_options, cache_dir):
+    """
+    Tính đường dẫn cache cho file export theo hash nội dung file và các tham số đọc (engine, skiprows, skipfooter),
+    vì cùng một file đọc bằng engine khác có thể cho dtype/giá trị khác. Hash nội dung chỉ được tính lại khi
+    mtime/kích thước file thay đổi.
+    """
+    stat = os.stat(file_path)
+    manifest_path = os.path.join(cache_dir, "_manifest.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    abs_path = os.path.abspath(file_path)
+    entry = manifest.get(abs_path)
+    if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+        content_hash = entry["sha256"]
+    else:
+        content_hash = _file_sha256(file_path)
+        manifest[abs_path] = {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": content_hash}
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, manifest_path)
+
+    options_hash = hashlib.sha256(json.dumps(read_options, sort_keys=True).encode("utf-8")).hexdigest()
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir, f"{stem}-{content_hash[:16]}-{options_hash[:12]}.pkl")
+
+
+def _parse_raw_export(file_path, read_options):
+    """Đọc một file export thô (chạy được trong process con)."""
+    return pd.read_excel(file_path, **read_options)
+
+
+def read_raw_export(file_path, skiprows=RAW_EXPORT_SKIPROWS, skipfooter=RAW_EXPORT_SKIPFOOTER, engine=None, use_cache=True, cache_dir=RAW_CACHE_DIR):
+    """
+    Đọc một file export thô, file không đổi nội dung sẽ được lấy từ cache thay vì parse lại
+
+    Parameters:
+    - file_path: đường dẫn file .xlsx
+    - skiprows, skipfooter: số dòng bỏ qua ở đầu và cuối file
+    - engine: engine đọc Excel (mặc định tự chọn bằng get_excel_engine)
+    - use_cache: dùng cache theo hash nội dung file
+    - cache_dir: thư mục lưu cache
+
+    Returns:
+    - DataFrame giống hệt pd.read_excel(file_path, skiprows=skiprows, skipfooter=skipfooter)
+    """
+    return read_raw_exports({"_": file_path}, skiprows, skipfooter, engine, use_cache, cache_dir, max_workers=1)["_"]
+
+
+def read_raw_exports(
+    path_dict, skiprows=RAW_EXPORT_SKIPROWS, skipfooter=RAW_EXPORT_SKIPFOOTER, engine=None, use_cache=True, cache_dir=RAW_CACHE_DIR, max_workers=None
+):
+    """
+    Đọc nhiều file export thô song song trên các process riêng
+
+    Parameters:
+    - path_dict: dict {key: đường dẫn file}, vd: {"ptcb": "../data/raw/raw_ptcb.xlsx", ...}
+    - skiprows, skipfooter: số dòng bỏ qua ở đầu và cuối file
+    - engine: engine đọc Excel (mặc định tự chọn bằng get_excel_engine)
+    - use_cache: dùng cache theo hash nội dung file và các tham số đọc (engine, skiprows, skipfooter)
+    - cache_dir: thư mục lưu cache
+    - max_workers: số process tối đa (mặc định bằng số file cần parse)
+
+    Returns:
+    - dict {key: DataFrame} theo đúng thứ tự của path_dict
+    """
+    if engine is None:
+        engine = get_excel_engine()
+    read_options = {"skiprows": skiprows, "skipfooter": skipfooter, "engine": engine}
+
+    # --- 1. Lấy các file không đổi từ cache ---
+    result = {}
+    pending = {}
+    for key, file_path in path_dict.items():
+        cache_path = _raw_cache_path(file_path, read_options, cache_dir) if use_cache else None
+        if cache_path and os.path.exists(cache_path):
+            result[key] = pd.read_pickle(cache_path)
+        else:
+            pending[key] = (file_path, cache_path)
+
+    # --- 2. Parse các file còn lại, mỗi file trên một process ---
+    if pending:
+        workers = min(max_workers or len(pending), len(pending))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {key: executor.submit(_parse_raw_export, file_path, read_options) for key, (file_path, _) in pending.items()}
+                parsed = {key: future.result() for key, future in futures.items()}
+        else:
+            parsed = {key: _parse_raw_export(file_path, read_options) for key, (file_path, _) in pending.items()}
+
+        for key, (_, cache_path) in pending.items():
+            result[key] = parsed[key]
+            if cache_path:
+                # Pickle giữ nguyên dtype của từng cột (kể cả cột object lẫn kiểu) để kết quả giống hệt lần đọc đầu
+                temp_path = f"{cache_path}.tmp"
+                parsed[key].to_pickle(temp_path)
+                os.replace(temp_path, cache_path)
+
+    return {key: result[key] for key in path_dict}
@@ -0,0 +1,214 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
+
+from import_default import json, hashlib, pd, np
+
+
+# ==============================================================================
+# HIỆU SUẤT CỦA CÁC MÃ TRONG TỪNG GIAI ĐOẠN THỊ TRƯỜNG (market_period_dict)
+# ==============================================================================
+
+MARKET_PERIOD_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache", "market_period")
+
+# Tăng khi đổi cách tính kết quả để các file cache cũ không còn được dùng
+MARKET_PERIOD_CACHE_VERSION = 2
+
+
+def build_price_matrix(price_dict, price_column="close"):
+    """
+    Ghép dữ liệu giá của nhiều mã thành ma trận (ngày × mã) trên một trục ngày chung đã sắp tăng dần
+
+    Parameters:
+    - price_dict: dict {ticker: DataFrame} có cột 'date' và cột giá (vd: kết quả sync_history_stock/get_mongo_tickers)
+    - price_column: cột giá dùng để tính
+
+    Returns:
+    - dates: mảng datetime64 tăng dần
+    - tickers: danh sách mã theo thứ tự cột
+    - prices: ma trận float64 (số ngày × số mã), NaN ở những ngày mã không có dữ liệu
+    """
+    tickers = [ticker for ticker, df in price_dict.items() if df is not None and not df.empty]
+    if not tickers:
+        return np.array([], dtype="datetime64[ns]"), tickers, np.empty((0, 0))
+
+    # Ghép một lần rồi chuyển kiểu ngày/giá trên toàn bộ dữ liệu thay vì từng mã
+    column_codes = np.repeat(np.arange(len(tickers)), [len(price_dict[ticker]) for ticker in tickers])
+    all_dates = pd.to_datetime(np.concatenate([price_dict[ticker]["date"].to_numpy() for ticker in tickers])).to_numpy(dtype="datetime64[ns]")
+    all_prices = pd.to_numeric(pd.Series(np.concatenate([price_dict[ticker][price_column].to_numpy() for ticker in tickers])), errors="coerce")
+    dates, row_codes = np.unique(all_dates, return_inverse=True)
+
+    prices = np.full((len(dates), len(tickers)), np.nan)
+    prices[row_codes, column_codes] = all_prices.to_numpy(dtype=np.float64)
+
+    return dates, tickers, prices
+
+
+def _period_bounds(dates, market_period_dict):
+    """Vị trí [start, end) của từng giai đoạn trên trục ngày (tìm bằng searchsorted, ngày kết thúc được tính vào giai đoạn)."""
+    starts = np.array([np.datetime64(pd.Timestamp(period["start_date"]), "ns") for period in market_period_dict.values()])
+    ends = np.array([np.datetime64(pd.Timestamp(period["end_date"]), "ns") for period in market_period_dict.values()])
+    return np.searchsorted(dates, starts, side="left"), np.searchsorted(dates, ends, side="right")
+
+
+def _prefix_sum(values):
+    """Tổng tích lũy theo ngày có thêm dòng 0 ở đầu, NaN được tính là 0: tổng đoạn [a, b) = C[b] - C[a]."""
+    return np.vstack([np.zeros((1, values.shape[1])), np.cumsum(np.nan_to_num(values), axis=0)])
+
+
+def _market_period_cache_key(market_period_dict, dates, tickers, prices, industry_map, index_ticker):
+    digest = hashlib.sha256()
+    digest.update(str(MARKET_PERIOD_CACHE_VERSION).encode("utf-8"))
+    digest.update(json.dumps(market_period_dict, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    digest.update(json.dumps([index_ticker, tickers, industry_map or {}], sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    digest.update(dates.tobytes())
+    digest.update(np.ascontiguousarray(prices).tobytes())
+    return digest.hexdigest()[:24]
+
+
+def compute_market_period_stats(
+    price_dict,
+    market_period_dict,
+    index_ticker="VNINDEX",
+    industry_map=None,
+    price_column="close",
+    use_cache=True,
+    cache_dir=MARKET_PERIOD_CACHE_DIR,
+):
+    """
+    Tính hiệu suất của mọi mã trong mọi giai đoạn thị trường trong một lần
+
+    Lợi nhuận ngày, tổng và tổng bình phương được tích lũy một lần trên toàn trục ngày, chỉ số của từng giai đoạn
+    được lấy bằng hiệu hai vị trí tìm bởi searchsorted nên không phải lọc lại dữ liệu cho từng giai đoạn.
+
+    Parameters:
+    - price_dict: dict {ticker: DataFrame} có cột 'date' và price_column, nên gồm cả index_ticker
+    - market_period_dict: dict các giai đoạn như trong fa_data (start_date, end_date, name, trend, phase)
+    - index_ticker: mã chỉ số dùng để tính beta và lợi nhuận vượt trội
+    - industry_map: dict {ticker: ngành} để xếp hạng trong ngành (không có thì chỉ xếp hạng toàn thị trường)
+    - price_column: cột giá dùng để tính
+    - use_cache: lưu/đọc kết quả theo hash của market_period_dict và dữ liệu giá
+    - cache_dir: thư mục cache
+
+    Returns:
+    - DataFrame gồm period, name, trend, phase, start_date, end_date, ticker, industry, trading_days, return,
+      excess_return, max_drawdown, volatility (theo năm), beta, market_rank, industry_rank
+      (dòng của index_ticker có market_rank/industry_rank là NaN, thứ hạng chỉ xếp giữa các cổ phiếu)
+    """
+    dates, tickers, prices = build_price_matrix(price_dict, price_column)
+
+    cache_path = None
+    if use_cache:
+        cache_key = _market_period_cache_key(market_period_dict, dates, tickers, prices, industry_map, index_ticker)
+        cache_path = os.path.join(cache_dir, f"market_period_{cache_key}.parquet")
+        if os.path.exists(cache_path):
+            return pd.read_parquet(cache_path)
+
+    period_keys = list(market_period_dict.keys())
+    starts, ends = _period_bounds(dates, market_period_dict)
+    period_count, ticker_count = len(period_keys), len(tickers)
+
+    # --- 1. Lợi nhuận: giá cuối cùng có dữ liệu trong giai đoạn so với giá đầu tiên có dữ liệu ---
+    # ffill/bfill theo cột bằng chỉ số dòng hợp lệ gần nhất để lấy giá đầu/cuối của mọi giai đoạn cùng lúc
+    row_index = np.arange(len(dates))[:, None]
+    has_price = ~np.isnan(prices)
+    last_valid_row = np.maximum.accumulate(np.where(has_price, row_index, -1), axis=0)
+    next_valid_row = np.minimum.accumulate(np.where(has_price, row_index, len(dates))[::-1], axis=0)[::-1]
+    padded_prices = np.vstack([prices, np.full((1, ticker_count), np.nan)])  # Dòng NaN cho vị trí không hợp lệ
+
+    start_rows = next_valid_row[np.minimum(starts, len(dates) - 1)] if len(dates) else np.zeros((period_count, ticker_count), dtype=int)
+    end_rows = last_valid_row[np.maximum(ends - 1, 0)] if len(dates) else np.zeros((period_count, ticker_count), dtype=int)
+    in_period = (start_rows < ends[:, None]) & (end_rows >= starts[:, None]) & (start_rows <= end_rows)
+    start_rows = np.where(in_period, start_rows, len(dates))
+    end_rows = np.where(in_period, end_rows, len(dates))
+
+    column_index = np.arange(ticker_count)[None, :]
+    start_price = padded_prices[start_rows, column_index]
+    end_price = padded_prices[end_rows, column_index]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        period_return = end_price / start_price - 1
+
+    # --- 2. Biến động và beta từ tổng tích lũy của lợi nhuận ngày ---
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily_return = np.vstack([np.full((1, ticker_count), np.nan), prices[1:] / prices[:-1] - 1])
+    # Lợi nhuận ngày đầu giai đoạn thuộc về giai đoạn trước nên đoạn lấy là [start + 1, end)
+    first_return_rows = np.minimum(starts + 1, ends)
+
+    def period_sum(values):
+        prefix = _prefix_sum(values)
+        return prefix[ends] - prefix[first_return_rows]
+
+    valid_return = ~np.isnan(daily_return)
+    return_count = period_sum(valid_return.astype(np.float64))
+    return_sum = period_sum(daily_return)
+    return_square_sum = period_sum(daily_return**2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return_var = (return_square_sum - return_sum**2 / return_count) / (return_count - 1)
+        volatility = np.sqrt(np.clip(return_var, 0, None)) * np.sqrt(252)
+    volatility[return_count < 2] = np.nan
+
+    beta = np.full((period_count, ticker_count), np.nan)
+    excess_return = np.full((period_count, ticker_count), np.nan)
+    if index_ticker in tickers:
+        index_column = tickers.index(index_ticker)
+        index_return = daily_return[:, [index_column]]
+        # Chỉ dùng các ngày cả mã và chỉ số đều có lợi nhuận
+        pair_valid = valid_return & ~np.isnan(index_return)
+        stock_values = np.where(pair_valid, daily_return, np.nan)
+        index_values = np.where(pair_valid, index_return, np.nan)
+        pair_count = period_sum(pair_valid.astype(np.float64))
+        stock_sum, index_sum = period_sum(stock_values), period_sum(index_values)
+        cross_sum, index_square_sum = period_sum(stock_values * index_values), period_sum(index_values**2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = cross_sum - stock_sum * index_sum / pair_count
+            index_variance = index_square_sum - index_sum**2 / pair_count
+            beta = np.where(pair_count >= 2, covariance / index_variance, np.nan)
+        excess_return = period_return - period_return[:, [index_column]]
+
+    # --- 3. Mức sụt giảm lớn nhất: tính trên lát ngày của từng giai đoạn, vector hóa theo mã ---
+    max_drawdown = np.full((period_count, ticker_count), np.nan)
+    for position in range(period_count):
+        period_prices = prices[starts[position] : ends[position]]
+        if len(period_prices) == 0:
+            continue
+        filled_prices = pd.DataFrame(period_prices).ffill().to_numpy()
+        running_max = np.fmax.accumulate(filled_prices, axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            drawdown = filled_prices / running_max - 1
+        max_drawdown[position] = np.where(in_period[position], np.fmin.reduce(drawdown, axis=0), np.nan)
+
+    # --- 4. Kết quả dạng tidy và xếp hạng ---
+    has_price_prefix = _prefix_sum(has_price.astype(np.float64))
+    trading_days = (has_price_prefix[ends] - has_price_prefix[starts]).astype(np.int64)
+    period_info_df = pd.DataFrame.from_dict(market_period_dict, orient="index")
+    result_df = pd.DataFrame(
+        {
+            "period": np.repeat(period_keys, ticker_count),
+            "ticker": np.tile(np.array(tickers, dtype=object), period_count),
+            "trading_days": trading_days.ravel(),
+            "return": period_return.ravel(),
+            "excess_return": excess_return.ravel(),
+            "max_drawdown": max_drawdown.ravel(),
+            "volatility": volatility.ravel(),
+            "beta": beta.ravel(),
+        }
+    )
+    result_df = result_df[in_period.ravel()]
+    result_df = period_info_df.rename_axis("period").reset_index().merge(result_df, on="period", how="right")
+    result_df["industry"] = result_df["ticker"].map(industry_map) if industry_map else None
+
+    # Chỉ số không tham gia xếp hạng để không đẩy lùi thứ hạng của các cổ phiếu
+    stock_return = result_df["return"].where(result_df["ticker"] != index_ticker)
+    result_df["market_rank"] = stock_return.groupby(result_df["period"]).rank(ascending=False, method="min")
+    result_df["industry_rank"] = (
+        stock_return.groupby([result_df["period"], result_df["industry"]]).rank(ascending=False, method="min") if industry_map else np.nan
+    )
+    result_df = result_df.reset_index(drop=True)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        result_df.to_parquet(f"{cache_path}.tmp", index=False)
+        os.replace(f"{cache_path}.tmp", cache_path)
+
+    return result_df
@@ -0,0 +1,240 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
+
+from import_default import pd, np
+
+
+# ==============================================================================
+# THỐNG KÊ SO SÁNH TRONG NGÀNH (PEER METRICS) TRÊN CÁC BẢNG LONG ĐÃ LÀM SẠCH
+# ==============================================================================
+
+PEER_METRIC_COLUMNS = [
+    "ticker",
+    "industry",
+    "name",
+    "period",
+    "value",
+    "peer_count",
+    "rank",
+    "percentile",
+    "zscore",
+    "industry_mean",
+    "industry_median",
+    "industry_std",
+]
+INDUSTRY_SUMMARY_COLUMNS = ["industry", "name", "period", "peer_count", "mean", "std", "min", "max"]
+
+
+def _period_series(long_df):
+    """Lấy cột kỳ của bảng long, hỗ trợ cả schema compact (period_date/period_quarter/period_label)."""
+    if "period" in long_df.columns:
+        return long_df["period"]
+    quarter = long_df["period_quarter"].astype(str).where(long_df["period_quarter"].notna())
+    if "period_label" in long_df.columns:
+        quarter = quarter.fillna(long_df["period_label"].astype(object))
+    return long_df["period_date"].astype(object).where(long_df["period_date"].notna(), quarter)
+
+
+def _factorize(values):
+    """
+    pd.factorize trả về uniques theo thứ tự xuất hiện, nhưng với cột category thì uniques là CategoricalIndex
+    và Categorical.from_codes sẽ dùng danh sách category đã sắp xếp của nó; đổi về Index thường để khớp với mã.
+
+    Giá trị rỗng (vd: kỳ 'N/A' đọc lại từ CSV thành NaN) nhận mã riêng len(uniques) thay cho -1, để khi ghép
+    mã thành khóa (chỉ tiêu, kỳ) không rơi vào kỳ cuối của chỉ tiêu đứng trước. Số mã dùng làm cơ số là len(uniques) + 1.
+    """
+    codes, uniques = pd.factorize(values)
+    return np.where(codes < 0, len(uniques), codes), pd.Index(np.asarray(uniques))
+
+
+def _codes_to_categorical(codes, categories):
+    """Dựng Categorical từ mã của _factorize, mã len(categories) (giá trị rỗng) trở lại thành NaN."""
+    return pd.Categorical.from_codes(np.where(codes == len(categories), -1, codes), categories=categories)
+
+
+def build_peer_index(long_df):
+    """
+    Đánh chỉ số bảng long thành ma trận dày (chỉ tiêu × kỳ, mã) để tính thống kê ngành
+
+    Parameters:
+    - long_df: bảng long gồm ticker, industry, name, period (hoặc period_date/period_quarter/period_label), value;
+      có thể là một bảng hoặc pd.concat của clean_ptcb/clean_bctc/clean_current
+
+    Returns:
+    - peer_index: dict gồm
+      - values: ma trận float64 (số cặp chỉ tiêu-kỳ × số mã), NaN nếu mã không có dữ liệu
+      - tickers, industries: mã và ngành (Categorical) của từng cột, mỗi cột là một cặp mã-ngành
+      - names, periods: tên chỉ tiêu và kỳ (Categorical) của từng dòng
+    """
+    value = pd.to_numeric(long_df["value"], errors="coerce").to_numpy(dtype=np.float64)
+    valid = ~np.isnan(value) & long_df["industry"].notna().to_numpy()
+    valid_df = long_df[valid]
+
+    # Mỗi cột là một cặp (mã, ngành): cùng một mã có thể mang ngành khác nhau giữa các file export
+    ticker_codes, tickers = _factorize(valid_df["ticker"])
+    industry_codes, industries = _factorize(valid_df["industry"])
+    industry_radix = len(industries) + 1
+    used_pairs, column_codes = np.unique(ticker_codes.astype(np.int64) * industry_radix + industry_codes, return_inverse=True)
+
+    name_codes, names = _factorize(valid_df["name"])
+    period_codes, periods = _factorize(_period_series(valid_df))
+    period_radix = len(periods) + 1
+    used_keys, row_codes = np.unique(name_codes.astype(np.int64) * period_radix + period_codes, return_inverse=True)
+
+    values = np.full((len(used_keys), len(used_pairs)), np.nan)
+    values[row_codes, column_codes] = value[valid]  # Dòng trùng (ticker, chỉ tiêu, kỳ) giữ giá trị cuối
+
+    return {
+        "values": values,
+        "tickers": _codes_to_categorical(used_pairs // industry_radix, tickers),
+        "industries": _codes_to_categorical(used_pairs % industry_radix, industries),
+        "names": _codes_to_categorical(used_keys // period_radix, names),
+        "periods": _codes_to_categorical(used_keys % period_radix, periods),
+    }
+
+
+def _sorted_groups(peer_index):
+    """
+    Trải ma trận thành mảng 1 chiều các ô có dữ liệu, sắp theo (chỉ tiêu-kỳ, ngành, giá trị)
+
+    Returns:
+    - dict gồm vị trí dòng/cột của từng ô sau khi sắp, giá trị đã sắp, mã nhóm và vị trí bắt đầu/số phần tử mỗi nhóm;
+      None nếu không có ô nào có dữ liệu
+    """
+    values = peer_index["values"]
+    industry_codes = peer_index["industries"].codes
+    row_idx, col_idx = np.nonzero(~np.isnan(values))
+    if len(row_idx) == 0:
+        return None
+    cell_values = values[row_idx, col_idx]
+
+    group_ids = row_idx.astype(np.int64) * len(peer_index["industries"].categories) + industry_codes[col_idx]
+    order = np.lexsort((cell_values, group_ids))
+    row_idx, col_idx, cell_values, group_ids = row_idx[order], col_idx[order], cell_values[order], group_ids[order]
+
+    is_group_start = np.r_[True, group_ids[1:] != group_ids[:-1]]
+    group_starts = np.flatnonzero(is_group_start)
+    group_counts = np.diff(np.r_[group_starts, len(group_ids)])
+    group_of_cell = np.cumsum(is_group_start) - 1
+
+    return {
+        "row_idx": row_idx,
+        "col_idx": col_idx,
+        "values": cell_values,
+        "group_of_cell": group_of_cell,
+        "group_starts": group_starts,
+        "group_counts": group_counts,
+    }
+
+
+def _group_quantile(sorted_values, group_starts, group_counts, q):
+    """Phân vị q của từng nhóm (nội suy tuyến tính như np.quantile) trên mảng đã sắp theo nhóm."""
+    position = (group_counts - 1) * q
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    weight = position - lower
+    return sorted_values[group_starts + lower] * (1 - weight) + sorted_values[group_starts + upper] * weight
+
+
+def compute_peer_metrics(long_df, min_peers=1):
+    """
+    Tính thống kê so sánh trong ngành cho mọi mã, chỉ tiêu và kỳ trong một lần (không lặp theo mã)
+
+    Parameters:
+    - long_df: bảng long (xem build_peer_index)
+    - min_peers: số mã tối thiểu có dữ liệu trong ngành để giữ lại kết quả
+
+    Returns:
+    - DataFrame dạng tidy gồm ticker, industry, name, period, value, peer_count, rank (1 = giá trị lớn nhất ngành),
+      percentile (0-1, tỷ lệ mã trong ngành có giá trị nhỏ hơn), zscore, industry_mean, industry_median, industry_std
+    """
+    peer_index = build_peer_index(long_df)
+    groups = _sorted_groups(peer_index)
+    if groups is None:
+        return pd.DataFrame(columns=PEER_METRIC_COLUMNS)
+    sorted_values = groups["values"]
+    group_of_cell = groups["group_of_cell"]
+    group_starts, group_counts = groups["group_starts"], groups["group_counts"]
+
+    # --- 1. Trung bình, độ lệch chuẩn, trung vị của từng nhóm (ngành × chỉ tiêu × kỳ) ---
+    group_sum = np.add.reduceat(sorted_values, group_starts)
+    group_mean = group_sum / group_counts
+    deviation = sorted_values - group_mean[group_of_cell]
+    group_var = np.add.reduceat(deviation**2, group_starts) / np.maximum(group_counts - 1, 1)
+    group_std = np.where(group_counts > 1, np.sqrt(group_var), np.nan)
+    group_median = _group_quantile(sorted_values, group_starts, group_counts, 0.5)
+
+    # --- 2. Xếp hạng trong nhóm, các giá trị bằng nhau nhận cùng hạng ---
+    position = np.arange(len(sorted_values))
+    is_new_value = np.r_[True, (group_of_cell[1:] != group_of_cell[:-1]) | (sorted_values[1:] != sorted_values[:-1])]
+    first_equal = np.maximum.accumulate(np.where(is_new_value, position, 0))
+    is_last_value = np.r_[is_new_value[1:], True]
+    last_equal = np.minimum.accumulate(np.where(is_last_value, position, len(position))[::-1])[::-1]
+
+    cell_start = group_starts[group_of_cell]
+    cell_count = group_counts[group_of_cell]
+    rank = cell_count - (last_equal - cell_start)
+    percentile = np.where(cell_count > 1, (first_equal - cell_start) / np.maximum(cell_count - 1, 1), np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        zscore = deviation / group_std[group_of_cell]
+
+    # --- 3. Kết quả dạng tidy ---
+    result_df = pd.DataFrame(
+        {
+            "ticker": peer_index["tickers"][groups["col_idx"]],
+            "industry": peer_index["industries"][groups["col_idx"]],
+            "name": peer_index["names"][groups["row_idx"]],
+            "period": peer_index["periods"][groups["row_idx"]],
+            "value": sorted_values,
+            "peer_count": cell_count,
+            "rank": rank,
+            "percentile": percentile,
+            "zscore": zscore,
+            "industry_mean": group_mean[group_of_cell],
+            "industry_median": group_median[group_of_cell],
+            "industry_std": group_std[group_of_cell],
+        }
+    )
+    return result_df[result_df["peer_count"] >= min_peers].reset_index(drop=True)
+
+
+def compute_industry_summary(long_df, quantiles=(0.25, 0.5, 0.75)):
+    """
+    Tổng hợp phân phối của từng chỉ tiêu theo ngành và kỳ
+
+    Parameters:
+    - long_df: bảng long (xem build_peer_index)
+    - quantiles: các phân vị cần tính
+
+    Returns:
+    - DataFrame gồm industry, name, period, peer_count, mean, std, min, max và các cột p25/p50/p75...
+    """
+    peer_index = build_peer_index(long_df)
+    groups = _sorted_groups(peer_index)
+    if groups is None:
+        return pd.DataFrame(columns=INDUSTRY_SUMMARY_COLUMNS + [f"p{round(q * 100)}" for q in quantiles])
+    sorted_values = groups["values"]
+    group_starts, group_counts = groups["group_starts"], groups["group_counts"]
+    first_cell = group_starts
+
+    group_mean = np.add.reduceat(sorted_values, group_starts) / group_counts
+    deviation = sorted_values - group_mean[groups["group_of_cell"]]
+    group_var = np.add.reduceat(deviation**2, group_starts) / np.maximum(group_counts - 1, 1)
+
+    summary = {
+        "industry": peer_index["industries"][groups["col_idx"][first_cell]],
+        "name": peer_index["names"][groups["row_idx"][first_cell]],
+        "period": peer_index["periods"][groups["row_idx"][first_cell]],
+        "peer_count": group_counts,
+        "mean": group_mean,
+        "std": np.where(group_counts > 1, np.sqrt(group_var), np.nan),
+        "min": sorted_values[group_starts],
+        "max": sorted_values[group_starts + group_counts - 1],
+    }
+    for q in quantiles:
+        summary[f"p{round(q * 100)}"] = _group_quantile(sorted_values, group_starts, group_counts, q)
+
+    return pd.DataFrame(summary)
@@ -0,0 +1,229 @@
+import sys
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.getcwd()), "import"))
+
+from import_default import re, pd, np
+
+
+# ==============================================================================
+# GỘP NẾN NGÀY THÀNH NẾN TUẦN / THÁNG / QUÝ (MULTI-TIMEFRAME)
+# ==============================================================================
+
+RESAMPLE_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cache", "resample")
+
+# Khung thời gian (giá trị time_frame của create_financial_chart) -> tần suất Period của pandas
+TIME_FRAME_FREQ = {
+    "1W": "W-SUN",  # Tuần giao dịch thứ 2 - thứ 6
+    "1M": "M",
+    "1Q": "Q",
+}
+
+# Các cột được tính lại trên nến đã gộp thay vì lấy giá trị của ngày cuối kỳ
+SMA_COLUMN_PATTERN = re.compile(r"^SMA_(\d+)$")
+RSI_COLUMN_PATTERN = re.compile(r"^RSI_(\d+)$")
+
+# Các cột mốc giá/định danh giữ giá trị của ngày cuối kỳ trên nến đã gộp. Cột không thuộc OHLCV, không nằm trong
+# danh sách này và không tính lại được (SMA_n, RSI_n) sẽ bị bỏ, tránh hiển thị chỉ báo ngày như chỉ báo tuần/tháng
+CARRIED_LEVEL_COLUMNS = [
+    "ticker",
+    "month_open",
+    "month_prev_high",
+    "month_prev_low",
+    "year_open",
+    "year_prev_high",
+    "year_prev_low",
+    "MPIVOT_P",
+    "MFIBO_0382",
+    "MFIBO_0618",
+    "YPIVOT_P",
+    "YFIBO_0382",
+    "YFIBO_0618",
+]
+
+
+def _period_codes(dates, time_frame):
+    """Mã số nguyên của kỳ (tuần/tháng/quý) chứa từng ngày, dùng làm khóa gộp."""
+    if time_frame not in TIME_FRAME_FREQ:
+        raise ValueError(f"time_frame phải là một trong {list(TIME_FRAME_FREQ)}, nhận được: {time_frame!r}")
+    return pd.PeriodIndex(pd.DatetimeIndex(dates), freq=TIME_FRAME_FREQ[time_frame]).asi8
+
+
+def _is_bar_column(col):
+    """Cột được giữ trên nến đã gộp: ngày, OHLCV, mốc giá trong CARRIED_LEVEL_COLUMNS và các chỉ báo tính lại được."""
+    return (
+        col in ("date", "open", "high", "low", "close", "volume", *CARRIED_LEVEL_COLUMNS)
+        or bool(SMA_COLUMN_PATTERN.match(col))
+        or bool(RSI_COLUMN_PATTERN.match(col))
+    )
+
+
+def _aggregate_bars(daily_df, time_frame):
+    """
+    Gộp các dòng (đã sắp theo ngày tăng dần) có cùng mã kỳ: open đầu kỳ, high/low lớn/nhỏ nhất, close cuối kỳ,
+    volume cộng dồn, các cột trong CARRIED_LEVEL_COLUMNS lấy giá trị của ngày cuối kỳ. Cột SMA_n/RSI_n được giữ chỗ
+    để _finalize_bars tính lại, các cột khác bị bỏ.
+
+    Cột date của nến là ngày giao dịch đầu kỳ, last_date là ngày giao dịch cuối cùng đã được gộp vào nến.
+    """
+    codes = _period_codes(daily_df["date"], time_frame)
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    lasts = np.r_[starts[1:], len(codes)] - 1
+
+    bars = {}
+    for col in daily_df.columns:
+        values = daily_df[col].to_numpy()
+        if col == "date":
+            bars[col] = values[starts]
+        elif col == "open":
+            bars[col] = values[starts]
+        elif col == "high":
+            bars[col] = np.fmax.reduceat(values.astype(np.float64), starts)
+        elif col == "low":
+            bars[col] = np.fmin.reduceat(values.astype(np.float64), starts)
+        elif col == "volume":
+            bars[col] = np.add.reduceat(np.nan_to_num(values.astype(np.float64)), starts)
+        elif col in ("close", *CARRIED_LEVEL_COLUMNS):
+            bars[col] = values[lasts]
+        elif SMA_COLUMN_PATTERN.match(col) or RSI_COLUMN_PATTERN.match(col):
+            bars[col] = np.full(len(starts), np.nan)
+    bars["last_date"] = daily_df["date"].to_numpy()[lasts]
+
+    return pd.DataFrame(bars)
+
+
+def _rsi(close, length):
+    """RSI kiểu Wilder (trung bình trượt hệ số 1/length, giống mặc định của pandas_ta.rsi)."""
+    change = close.diff()
+    avg_gain = change.clip(lower=0).ewm(alpha=1 / length, min_periods=length, adjust=False).mean()
+    avg_loss = (-change.clip(upper=0)).ewm(alpha=1 / length, min_periods=length, adjust=False).mean()
+    return 100 * avg_gain / (avg_gain + avg_loss)
+
+
+def _finalize_bars(bars_df):
+    """
+    Tính lại các cột phụ thuộc chuỗi nến đã gộp: SMA_n theo n nến, RSI_n theo close của nến đã gộp,
+    diff/pct_change so với close nến trước.
+    """
+    close = bars_df["close"].astype(np.float64)
+    for col in bars_df.columns:
+        sma_match = SMA_COLUMN_PATTERN.match(col)
+        rsi_match = RSI_COLUMN_PATTERN.match(col)
+        if sma_match:
+            bars_df[col] = close.rolling(int(sma_match.group(1))).mean()
+        elif rsi_match:
+            bars_df[col] = _rsi(close, int(rsi_match.group(1)))
+    bars_df["diff"] = close.diff()
+    bars_df["pct_change"] = close.pct_change()
+    return bars_df
+
+
+def _prepare_daily(daily_df):
+    """Chuẩn hóa kiểu ngày và sắp tăng dần (dữ liệu từ Mongo được trả về theo ngày giảm dần)."""
+    daily_df = daily_df.drop(columns=["diff", "pct_change"], errors="ignore").copy()
+    daily_df["date"] = pd.to_datetime(daily_df["date"])
+    return daily_df.sort_values("date", kind="stable").reset_index(drop=True)
+
+
+def resample_ohlcv(daily_df, time_frame):
+    """
+    Chuyển dữ liệu nến ngày của một mã thành nến tuần/tháng/quý
+
+    Parameters:
+    - daily_df: DataFrame nến ngày gồm date, open, high, low, close, volume và các cột chỉ báo/mốc giá
+      (như full_stock_ta_dict trong ta_data), thứ tự ngày bất kỳ
+    - time_frame: "1W", "1M" hoặc "1Q"
+
+    Returns:
+    - DataFrame nến đã gộp, sắp theo ngày tăng dần, cùng các cột như daily_df và thêm last_date, diff, pct_change
+    """
+    daily_df = _prepare_daily(daily_df)
+    if daily_df.empty:
+        return daily_df[[col for col in daily_df.columns if _is_bar_column(col)]].assign(last_date=pd.Series(dtype="datetime64[ns]"), diff=np.nan, pct_change=np.nan)
+    return _finalize_bars(_aggregate_bars(daily_df, time_frame))
+
+
+def _resample_cache_paths(ticker, time_frame, cache_dir):
+    """File nến đã gộp và file các nến ngày (chưa gộp) của kỳ cuối cùng, kỳ có thể còn đang chạy."""
+    return os.path.join(cache_dir, f"{ticker}_{time_frame}.parquet"), os.path.join(cache_dir, f"{ticker}_{time_frame}_open.parquet")
+
+
+def _open_period_rows(daily_df, time_frame):
+    """Các nến ngày thuộc kỳ cuối cùng của daily_df (đã sắp tăng dần)."""
+    codes = _period_codes(daily_df["date"], time_frame)
+    return daily_df[codes == codes[-1]].reset_index(drop=True) if len(codes) else daily_df
+
+
+def _write_parquet(df, file_path):
+    df.to_parquet(f"{file_path}.tmp", index=False)
+    os.replace(f"{file_path}.tmp", file_path)
+
+
+def update_resampled_bars(ticker, daily_df, time_frame, use_cache=True, cache_dir=RESAMPLE_CACHE_DIR, rebuild=False):
+    """
+    Lấy nến tuần/tháng/quý của một mã, chỉ gộp lại kỳ cuối cùng thay vì toàn bộ lịch sử
+
+    Cache giữ cả các nến ngày chưa gộp của kỳ cuối. Khi có dữ liệu mới, nến ngày cùng ngày thay thế bản đã lưu
+    (vd: nến trong phiên của today_stock được thay bằng nến chốt phiên), rồi kỳ cuối được gộp lại từ các nến ngày
+    này, các nến trước giữ nguyên. Vì vậy chỉ cần truyền vào các nến ngày gần nhất; dữ liệu ngày của các kỳ cũ
+    hơn bị sửa lại thì cần rebuild=True.
+
+    Parameters:
+    - ticker: mã cổ phiếu (tên file cache)
+    - daily_df: DataFrame nến ngày (xem resample_ohlcv), tối thiểu gồm các ngày từ đầu kỳ cuối trong cache
+    - time_frame: "1W", "1M" hoặc "1Q"
+    - use_cache: đọc/ghi nến đã gộp vào cache_dir
+    - cache_dir: thư mục cache (mỗi mã và khung thời gian một file nến đã gộp và một file nến ngày của kỳ cuối)
+    - rebuild: bỏ qua cache, gộp lại toàn bộ từ daily_df
+
+    Returns:
+    - DataFrame nến đã gộp (xem resample_ohlcv)
+    """
+    daily_df = _prepare_daily(daily_df)
+    bars_path, open_path = _resample_cache_paths(ticker, time_frame, cache_dir)
+    has_cache = use_cache and not rebuild and os.path.exists(bars_path) and os.path.exists(open_path)
+
+    if has_cache:
+        cached_df = pd.read_parquet(bars_path)
+        new_daily_df = daily_df[daily_df["date"] >= cached_df["date"].iloc[-1]]
+        if new_daily_df.empty:
+            return cached_df
+
+        # Nến ngày mới thay thế nến đã lưu cùng ngày, kỳ cuối được gộp lại từ đầu
+        open_daily_df = pd.concat([pd.read_parquet(open_path), new_daily_df], ignore_index=True)
+        open_daily_df = open_daily_df.drop_duplicates("date", keep="last").sort_values("date", kind="stable").reset_index(drop=True)
+        open_bar_df = _aggregate_bars(open_daily_df, time_frame)
+        # Cache tạo trước khi đổi danh sách cột được đưa về cùng cột với nến mới gộp
+        bars_df = _finalize_bars(pd.concat([cached_df.iloc[:-1].reindex(columns=open_bar_df.columns), open_bar_df], ignore_index=True))
+    else:
+        open_daily_df = daily_df
+        bars_df = resample_ohlcv(daily_df, time_frame)
+
+    if use_cache and not bars_df.empty:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_parquet(bars_df, bars_path)
+        _write_parquet(_open_period_rows(open_daily_df, time_frame), open_path)
+    return bars_df
+
+
+def resample_watchlist(df_dict, time_frames=("1W", "1M"), bar_count=None, use_cache=True, cache_dir=RESAMPLE_CACHE_DIR, rebuild=False):
+    """
+    Gộp nến ngày của cả danh sách mã cho nhiều khung thời gian, kết quả dùng trực tiếp cho render_charts_batch
+
+    Parameters:
+    - df_dict: dict {ticker: DataFrame nến ngày}
+    - time_frames: các khung thời gian cần gộp
+    - bar_count: chỉ giữ bar_count nến gần nhất của mỗi mã (None = giữ tất cả)
+    - use_cache, cache_dir, rebuild: như update_resampled_bars
+
+    Returns:
+    - dict {time_frame: {ticker: DataFrame nến đã gộp}}, vd:
+      render_charts_batch(result["1W"], ..., time_frame="1W", image_name_template="{symbol}_1W_chart.png")
+    """
+    result = {}
+    for time_frame in time_frames:
+        result[time_frame] = {}
+        for ticker, daily_df in df_dict.items():
+            bars_df = update_resampled_bars(ticker, daily_df, time_frame, use_cache=use_cache, cache_dir=cache_dir, rebuild=rebuild)
+            result[time_frame][ticker] = bars_df.tail(bar_count).reset_index(drop=True) if bar_count else bars_df
+    return result